@@ -1,54 +1,340 @@
+import asyncio
+import dataclasses
+import json
 import logging
 import os
+import time
 from os import access
+from pathlib import Path
+from typing import AsyncGenerator
 
 import bentoml
 import numpy as np
+from bentoml.exceptions import ServiceUnavailable
 from PIL import Image
+from starlette.responses import Response
+
+from src import metrics
+from src.backends import BACKENDS
+from src.backends import load_model as load_backend
+from src.batching import MicroBatcher
+from src.postprocess import PACKED_MEDIA_TYPE, Detections, accepts_packed
+from src.preprocess import DecodedImage, decode_image, letterbox_batch
+from src.response_cache import ResponseCache
+from src.video_stream import FrameReader, image_frames, video_frames
+from src.worker_pool import PoolSaturatedError, WorkerPool
 
 logger = logging.getLogger("bentoml")
 logger.setLevel(logging.DEBUG)
 
+MODEL_NAME = os.getenv("MODEL_NAME", "yolo11n.pt")
+
+# Serve a registered model instead of MODEL_NAME, following its alias (e.g. yolo11n@Champion)
+MODEL_REGISTRY_NAME = os.getenv("MODEL_REGISTRY_NAME")
+MODEL_ALIAS = os.getenv("MODEL_ALIAS", "Champion")
+MODEL_POLL_INTERVAL = float(os.getenv("MODEL_POLL_INTERVAL", "60"))  # seconds, 0 disables hot-swapping
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", "tmp/models")  # shared with src/inference_local.py
+MODEL_CACHE_MAX_MB = float(os.getenv("MODEL_CACHE_MAX_MB", "2048"))  # least recently used artifacts evicted beyond
+# Serve the fastest optimized variant of the registered model whose accuracy drop (mAP50-95) is at most this tolerance,
+# e.g. 0.01 (see src/variants.py). Unset: the .pt weights
+VARIANT_TOLERANCE = float(os.environ["YOLO_VARIANT_TOLERANCE"]) if os.getenv("YOLO_VARIANT_TOLERANCE") else None
+WARMUP_IMAGE_SIZE = 640
+
+# CPU backend: torch, onnx, onnx-int8 or openvino (exported once next to the .pt weights)
+BACKEND = os.getenv("YOLO_BACKEND", "torch")
+
+# Inference runs in a pool of model replicas, off the event loop
+NUM_WORKERS = int(os.getenv("YOLO_WORKERS", "1"))
+THREADS_PER_WORKER = int(os.getenv("YOLO_THREADS_PER_WORKER", "0")) or max(1, (os.cpu_count() or 1) // NUM_WORKERS)
+MAX_QUEUE_SIZE = int(os.getenv("YOLO_MAX_QUEUE_SIZE", "16"))  # per worker, 503 beyond
+
+# Server-side batching of concurrent requests (disabled by default)
+BATCHING_ENABLED = os.getenv("YOLO_BATCHING", "0") == "1"
+MAX_BATCH_SIZE = int(os.getenv("YOLO_MAX_BATCH_SIZE", "8"))
+MAX_WAIT_MS = float(os.getenv("YOLO_MAX_WAIT_MS", "5"))
+
+# Cache of responses for re-submitted images (disabled by default)
+CACHE_ENABLED = os.getenv("YOLO_CACHE", "0") == "1"
+CACHE_MAX_ENTRIES = int(os.getenv("YOLO_CACHE_MAX_ENTRIES", "1024"))
+CACHE_MAX_MB = float(os.getenv("YOLO_CACHE_MAX_MB", "64"))
+CACHE_TTL = float(os.getenv("YOLO_CACHE_TTL", "300"))  # seconds, 0: no expiry
+
+# Video tracking streams, each with its own model replica and tracker state
+MAX_STREAMS = int(os.getenv("YOLO_MAX_STREAMS", "2"))  # concurrent streams, 503 beyond
+STREAM_BUFFER = int(os.getenv("YOLO_STREAM_BUFFER", "8"))  # decoded frames waiting for the tracker, per stream
+TRACKER = os.getenv("YOLO_TRACKER", "bytetrack.yaml")
+
+# Inference parameters (ultralytics defaults), part of the cache key
+PREDICT_PARAMS = {"conf": 0.25, "iou": 0.7, "imgsz": 640}
+
+
+def predict_images(model, images: list[DecodedImage]) -> list[Detections]:
+    """Run a single (batched) forward pass and extract the detections of each image. Runs in a worker thread."""
+    # Letterboxed in the reused buffer of this worker, ultralytics has nothing left to resize
+    arrays, transforms, preprocess_time = letterbox_batch([image.array for image in images], PREDICT_PARAMS["imgsz"])
+    results = model.predict(arrays, verbose=False, **PREDICT_PARAMS)
+
+    all_detections = []
+    for image, result, (scale, offset) in zip(images, results, transforms):
+        start = time.perf_counter()
+        detections = Detections.from_result(result)
+        decode_scale_x, decode_scale_y = image.decode_scale
+        detections.rescale((decode_scale_x / scale, decode_scale_y / scale), offset, image.original_size)
+        detections.decode_time = image.decode_time
+        detections.preprocess_time = preprocess_time / len(images) + float(result.speed["preprocess"])
+        detections.postprocess_time = (time.perf_counter() - start) * 1000 + float(result.speed["postprocess"])
+        all_detections.append(detections)
+    return all_detections
+
+
+def encode_response(detections: Detections, accept: str | None) -> dict | Response:
+    """JSON response by default, packed float32 boxes when the client accepts them"""
+    if accepts_packed(accept):
+        return Response(
+            content=detections.to_packed(),
+            media_type=PACKED_MEDIA_TYPE,
+            headers={"X-Class-Names": detections.class_names_header()},
+        )
+    return detections.to_dict()
+
+
+def cache_key(image: DecodedImage, model_version: str) -> str:
+    """Key of the response cache, hashing the decoded pixels"""
+    params = {**PREDICT_PARAMS, "shape": image.array.shape, "original_size": image.original_size}
+    return ResponseCache.make_key(image.array.data, model_version, params)
+
 
 @bentoml.service
 class YOLOService:
     def __init__(self) -> None:
-        self.model = self.load_model("yolo11n.pt")
+        if BACKEND not in BACKENDS:
+            raise ValueError(f"YOLO_BACKEND must be one of {BACKENDS}, got {BACKEND}")
+
+        model_path = MODEL_NAME
+        self.model_version = MODEL_NAME
+        self.watcher = None
+        if MODEL_REGISTRY_NAME:
+            from src.model_registry import RegistryModelWatcher
+
+            self.watcher = RegistryModelWatcher(
+                model_name=MODEL_REGISTRY_NAME,
+                alias=MODEL_ALIAS,
+                on_new_version=self.swap_model,
+                download_dir=MODEL_CACHE_DIR,
+                poll_interval=MODEL_POLL_INTERVAL,
+                variant_tolerance=VARIANT_TOLERANCE,
+                variant_batch_size=MAX_BATCH_SIZE if BATCHING_ENABLED else 1,
+                cache_max_bytes=int(MODEL_CACHE_MAX_MB * 1024 * 1024),
+            )
+            model_version, model_path = self.watcher.load_current()
+            self.model_version = f"{MODEL_REGISTRY_NAME}/{model_version.version}"
+        self.model_path = model_path
+
+        self.pool = WorkerPool(
+            lambda: self.load_model(model_path),
+            num_workers=NUM_WORKERS,
+            max_queue_size=MAX_QUEUE_SIZE,
+            threads_per_worker=THREADS_PER_WORKER,
+            on_job_start=self._observe_worker_wait,
+        )
+        metrics.set_active_model(self.model_version, BACKEND)
+        logger.info(f"{NUM_WORKERS} {BACKEND} inference workers (max_queue_size={MAX_QUEUE_SIZE})")
+
+        self.batcher = None
+        if BATCHING_ENABLED:
+            # One batch in flight per worker, the queue in front of them is bounded like the workers ones
+            self.batcher = MicroBatcher(
+                self._run_batch,
+                max_batch_size=MAX_BATCH_SIZE,
+                max_wait_ms=MAX_WAIT_MS,
+                max_concurrent_batches=NUM_WORKERS,
+                max_pending=NUM_WORKERS * MAX_QUEUE_SIZE,
+                on_batch=self._observe_batch,
+            )
+            logger.info(f"Batching enabled (max_batch_size={MAX_BATCH_SIZE}, max_wait_ms={MAX_WAIT_MS})")
+
+        self.cache = None
+        if CACHE_ENABLED:
+            self.cache = ResponseCache(
+                max_entries=CACHE_MAX_ENTRIES, max_bytes=int(CACHE_MAX_MB * 1024 * 1024), ttl=CACHE_TTL
+            )
+
+        self.streams = asyncio.Semaphore(MAX_STREAMS)
+
+        if self.watcher is not None and MODEL_POLL_INTERVAL > 0:
+            self.watcher.start()
+            logger.info(f"Watching {MODEL_REGISTRY_NAME}@{MODEL_ALIAS} every {MODEL_POLL_INTERVAL}s")
 
     def load_model(self, model_path):
-        """Load the YOLO model"""
-        from ultralytics import YOLO
+        """Load the YOLO model with the configured backend and warm it up, so the first request does not pay the setup cost"""
+        model = load_backend(model_path, BACKEND, num_threads=THREADS_PER_WORKER)
+        model.predict(np.zeros((WARMUP_IMAGE_SIZE, WARMUP_IMAGE_SIZE, 3), dtype=np.uint8), verbose=False)
+        return model
+
+    def swap_model(self, model_version, weights_path) -> None:
+        """Called by the registry watcher (in its thread) when the alias moves to a new version"""
+        self.pool.swap_models(lambda: self.load_model(weights_path))
+        self.model_path = weights_path
+        previous_version, self.model_version = self.model_version, f"{MODEL_REGISTRY_NAME}/{model_version.version}"
+        metrics.set_active_model(self.model_version, BACKEND, previous_version)
+        if self.cache is not None:
+            self.cache.clear()
+
+    def load_tracking_model(self):
+        """
+        Model replica of a tracking stream: ultralytics keeps the tracker state on the model, so it cannot be shared.
+        The ONNX Runtime backends have no tracking support, they track with the torch weights. So do the optimized
+        variants served from the registry (ONNX files): the .pt weights of their version are loaded instead.
+        """
+        backend = BACKEND if BACKEND in ("torch", "openvino") else "torch"
+        weights_path = self.watcher.current_weights if self.watcher is not None else self.model_path
+        return load_backend(weights_path, backend)
+
+    def _observe_worker_wait(self, wait: float) -> None:
+        metrics.queue_wait.labels(queue="worker", model_version=self.model_version).observe(wait)
 
-        return YOLO(model_path)
+    def _observe_batch(self, size: int, waits: list[float]) -> None:
+        metrics.batch_size.labels(model_version=self.model_version).observe(size)
+        histogram = metrics.queue_wait.labels(queue="batch", model_version=self.model_version)
+        for wait in waits:
+            histogram.observe(wait)
+
+    async def _run_batch(self, images: list[DecodedImage]) -> list[Detections]:
+        return await self.pool.submit(predict_images, images)
 
     @bentoml.api
-    async def predict(self, image: Image.Image) -> dict:
+    async def predict(self, image: Image.Image, ctx: bentoml.Context) -> dict:
         """
         Handle prediction requests
 
         Args:
             image: PIL Image object
+            ctx: request context, used for content negotiation
 
         Returns:
-            dict: Prediction results including boxes, scores, and class labels
-        """
-        # Convert PIL Image to numpy array
-        img_array = np.array(image)
-
-        # Run inference
-        results = self.model.predict(img_array)
-        result = results[0]  # Get first result since we only process one image
-
-        # Format response
-        boxes = []
-        for box in result.boxes:
-            boxes.append(
-                {
-                    "xyxy": box.xyxy[0].tolist(),
-                    "confidence": float(box.conf[0]),
-                    "class_id": int(box.cls[0]),
-                    "class_name": result.names[int(box.cls[0])],
-                }
+            dict: Prediction results including boxes, scores, and class labels, and the decode, preprocess and inference times (ms).
+                With `Accept: application/x-yolo-detections`, the boxes are packed as float32 instead (see src/postprocess.py)
+
+        Raises:
+            ServiceUnavailable: (503) if the inference queues are full
+
+        The time spent in each stage is exposed on /metrics (see src/metrics.py).
+        """
+        start = time.perf_counter()
+        accept = ctx.request.headers.get("accept")
+        model_version = self.model_version
+
+        # The uploaded image is not decoded yet: large JPEGs get decoded at a reduced scale, off the event loop
+        decoded = await asyncio.to_thread(decode_image, image, PREDICT_PARAMS["imgsz"])
+        stages = {"decode": decoded.decode_time, "array_conversion": decoded.convert_time}
+
+        key = None
+        result = None
+        if self.cache is not None:
+            key = await asyncio.to_thread(cache_key, decoded, model_version)
+            result = self.cache.get(key)
+
+        cached = result is not None
+        if not cached:
+            try:
+                if self.batcher is not None:
+                    # Grouped with the other in-flight requests into one forward pass
+                    result = await self.batcher.submit(decoded)
+                else:
+                    metrics.batch_size.labels(model_version=model_version).observe(1)
+                    results = await self.pool.submit(predict_images, [decoded])
+                    result = results[0]  # Get first result since we only process one image
+            except (PoolSaturatedError, asyncio.QueueFull):
+                metrics.rejected_requests.inc()
+                raise ServiceUnavailable("Inference queues are full, retry later")
+
+            if key is not None:
+                self.cache.put(key, result, size=result.nbytes)
+            stages.update(
+                preprocess=result.preprocess_time,
+                inference=result.inference_time,
+                postprocess=result.postprocess_time,
             )
+        else:
+            # The cached timings are those of the request that filled the entry: this one only decoded the image
+            result = dataclasses.replace(
+                result, decode_time=decoded.decode_time, preprocess_time=0.0, inference_time=0.0, postprocess_time=0.0
+            )
+
+        encode_start = time.perf_counter()
+        response = encode_response(result, accept)
+        stages["encode"] = (time.perf_counter() - encode_start) * 1000
+
+        metrics.observe_stages(model_version, stages)
+        metrics.request_duration.labels(model_version=model_version, cached=str(cached).lower()).observe(
+            time.perf_counter() - start
+        )
+        return response
+
+    @bentoml.api
+    async def workers(self) -> dict:
+        """Served model version and queue depth of each inference worker"""
+        return {
+            "model_version": self.model_version,
+            "workers": self.pool.stats(),
+            "batch_queue_depth": self.batcher.pending if self.batcher is not None else 0,
+        }
+
+    @bentoml.api
+    async def cache_stats(self) -> dict:
+        """Hit, miss and eviction counters of the response cache"""
+        if self.cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.cache.stats()}
 
-        return {"boxes": boxes, "inference_time": float(result.speed["inference"])}
+    async def _track_stream(self, frames, drop_frames: bool) -> AsyncGenerator[str, None]:
+        """Tracks the frames (an iterable decoded by a FrameReader thread) with a dedicated model, as JSON lines"""
+        if self.streams.locked():
+            metrics.rejected_requests.inc()
+            raise ServiceUnavailable("Too many tracking streams, retry later")
+
+        async with self.streams:
+            # The stream keeps the model it started with, so its track ids stay consistent across a model swap
+            model = await asyncio.to_thread(self.load_tracking_model)
+            reader = FrameReader(frames, buffer_size=STREAM_BUFFER, drop_frames=drop_frames).start()
+            try:
+                while (item := await asyncio.to_thread(reader.get)) is not None:
+                    index, frame = item
+                    results = await asyncio.to_thread(
+                        model.track, frame, persist=True, tracker=TRACKER, verbose=False, **PREDICT_PARAMS
+                    )
+                    detections = Detections.from_result(results[0])
+                    yield json.dumps({"frame": index, **detections.to_dict()}) + "\n"
+                yield json.dumps({"frames": reader.read, "dropped": reader.dropped}) + "\n"
+            finally:
+                reader.stop()
+
+    @bentoml.api
+    async def track(self, video: Path, drop_frames: bool = False) -> AsyncGenerator[str, None]:
+        """
+        Track objects in a video, streaming the detections of each frame
+
+        Args:
+            video: video file
+            drop_frames: skip the frames decoded while the tracker (or the client) is busy instead of waiting for it,
+                to keep up with live sources
+
+        Returns:
+            JSON lines: one per processed frame with its index and the boxes, each box having a track_id kept across frames,
+                then a summary with the number of frames read and dropped
+
+        Raises:
+            ServiceUnavailable: (503) if YOLO_MAX_STREAMS streams are already running
+
+        At most YOLO_STREAM_BUFFER decoded frames are held per stream, whatever the length of the video.
+        """
+        async for line in self._track_stream(video_frames(video), drop_frames):
+            yield line
+
+    @bentoml.api
+    async def track_frames(self, frames: list[Path], drop_frames: bool = False) -> AsyncGenerator[str, None]:
+        """
+        Same as track, for a sequence of image files (in order) instead of a video
+        """
+        async for line in self._track_stream(image_frames(frames), drop_frames):
+            yield line
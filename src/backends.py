@@ -0,0 +1,342 @@
+"""
+CPU inference backends for the YOLO weights.
+
+- torch: the .pt weights through ultralytics (default)
+- onnx: the weights exported once to ONNX and run with ONNX Runtime, with a configurable number of threads
+- onnx-int8: same, with the weights dynamically quantized to int8
+- openvino: the weights exported to OpenVINO and run through ultralytics
+
+Exported artifacts are cached next to the .pt file (best.onnx, best.int8.onnx, best_openvino_model/) and
+re-exported only when the .pt is newer. Every backend returns ultralytics Results from predict(), so the
+callers do not depend on the backend.
+
+Run as a script to check that a backend matches the torch one and compare their latency:
+
+    python src/backends.py tmp/models/best.pt test_files --backends onnx onnx-int8
+"""
+
+import argparse
+import ast
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+BACKENDS = ("torch", "onnx", "onnx-int8", "openvino")
+DEFAULT_IMGSZ = 640
+
+
+def _is_stale(exported: Path, weights: Path) -> bool:
+    return not exported.exists() or exported.stat().st_mtime < weights.stat().st_mtime
+
+
+def export_model(weights_path: str | Path, backend: str, imgsz: int = DEFAULT_IMGSZ) -> Path:
+    """
+    Exports the .pt weights for the backend, unless an up to date export is already cached next to them.
+
+    Returns:
+        Path: the exported model (file or directory).
+    """
+    from ultralytics import YOLO
+
+    weights_path = Path(weights_path)
+    if backend == "torch":
+        return weights_path
+
+    if backend in ("onnx", "onnx-int8"):
+        onnx_path = weights_path.with_suffix(".onnx")
+        if _is_stale(onnx_path, weights_path):
+            # Dynamic batch and image dimensions: batched predictions and minimal padding like the torch backend
+            exported = YOLO(weights_path).export(format="onnx", imgsz=imgsz, dynamic=True)
+            Path(exported).replace(onnx_path)
+        if backend == "onnx":
+            return onnx_path
+
+        int8_path = weights_path.with_suffix(".int8.onnx")
+        if _is_stale(int8_path, onnx_path):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            tmp_path = int8_path.with_suffix(".tmp")
+            quantize_dynamic(str(onnx_path), str(tmp_path), weight_type=QuantType.QUInt8)
+            tmp_path.replace(int8_path)
+        return int8_path
+
+    if backend == "openvino":
+        openvino_dir = weights_path.parent / f"{weights_path.stem}_openvino_model"
+        if _is_stale(openvino_dir, weights_path):
+            YOLO(weights_path).export(format="openvino", imgsz=imgsz)
+        return openvino_dir
+
+    raise ValueError(f"Unknown backend {backend}, expected one of {BACKENDS}")
+
+
+def load_model(weights_path: str | Path, backend: str = "torch", num_threads: int = 0, imgsz: int = DEFAULT_IMGSZ):
+    """
+    Loads the weights with the given backend, exporting them first if needed.
+
+    Args:
+        weights_path (str, Path): Path to the .pt weights, or to an ONNX variant (run with ONNX Runtime whatever the backend).
+        backend (str): One of BACKENDS.
+        num_threads (int): ONNX Runtime intra-op threads (0 lets ONNX Runtime decide). For torch use torch.set_num_threads.
+        imgsz (int): Input size of the exported models.
+    """
+    if Path(weights_path).suffix == ".onnx":  # A variant optimized after training (see src/variants.py)
+        return OnnxRuntimeModel(weights_path, num_threads=num_threads)
+    model_path = export_model(weights_path, backend, imgsz=imgsz)
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxRuntimeModel(model_path, num_threads=num_threads)
+
+    from ultralytics import YOLO
+
+    return YOLO(model_path, task="detect")
+
+
+def letterbox_shape(image_shape: tuple[int, int], size: int, stride: int = 32) -> tuple[int, int]:
+    """Smallest (h, w) multiple of stride holding the image resized to fit size x size (ultralytics "auto" padding)"""
+    h, w = image_shape
+    scale = min(size / h, size / w)
+    new_h, new_w = round(h * scale), round(w * scale)
+    return new_h + (size - new_h) % stride, new_w + (size - new_w) % stride
+
+
+def letterbox(
+    image: np.ndarray, shape: tuple[int, int], out: np.ndarray | None = None
+) -> tuple[np.ndarray, float, tuple[int, int]]:
+    """
+    Resizes the image keeping its aspect ratio and pads it (value 114) to shape (h, w), like ultralytics.
+
+    Returns:
+        the letterboxed image, the scale factor and the (left, top) padding.
+    """
+    import cv2
+
+    h, w = image.shape[:2]
+    scale = min(shape[0] / h, shape[1] / w)
+    new_w, new_h = round(w * scale), round(h * scale)
+    left, top = round((shape[1] - new_w) / 2 - 0.1), round((shape[0] - new_h) / 2 - 0.1)
+
+    if out is None:
+        out = np.empty((*shape, 3), dtype=np.uint8)
+    out.fill(114)
+    resized = image if (new_w, new_h) == (w, h) else cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    out[top : top + new_h, left : left + new_w] = resized
+    return out, scale, (left, top)
+
+
+class OnnxRuntimeModel:
+    def __init__(self, onnx_path: str | Path, num_threads: int = 0) -> None:
+        """
+        Runs an ultralytics ONNX export with ONNX Runtime on CPU, doing the letterbox and NMS around it.
+
+        Args:
+            onnx_path (str, Path): The exported model.
+            num_threads (int): Intra-op threads of the session (0 lets ONNX Runtime decide).
+        """
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(onnx_path), options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata["names"])
+        self.imgsz = ast.literal_eval(metadata.get("imgsz", str([DEFAULT_IMGSZ])))[0]
+
+    def predict(
+        self,
+        source,
+        conf: float = 0.25,
+        iou: float = 0.7,
+        imgsz: int | None = None,
+        max_det: int = 300,
+        verbose: bool = False,
+        **kwargs,
+    ) -> list:
+        """Same contract as YOLO.predict for image paths and numpy images (HWC, BGR like ultralytics)"""
+        import cv2
+        import torch
+        import torchvision
+        from ultralytics.engine.results import Results
+
+        images = source if isinstance(source, list) else [source]
+        images = [cv2.imread(str(image)) if isinstance(image, (str, Path)) else image for image in images]
+        size = imgsz or self.imgsz
+
+        t0 = time.perf_counter()
+        if len({image.shape for image in images}) == 1:
+            # Minimal padding when the images share their shape, square inputs otherwise (same as ultralytics)
+            shape = letterbox_shape(images[0].shape[:2], size)
+        else:
+            shape = (size, size)
+        batch = np.empty((len(images), *shape, 3), dtype=np.uint8)
+        transforms = []
+        for i, image in enumerate(images):
+            _, scale, pad = letterbox(image, shape, out=batch[i])
+            transforms.append((scale, pad))
+        # BGR HWC uint8 -> RGB CHW float
+        inputs = np.ascontiguousarray(batch[..., ::-1].transpose(0, 3, 1, 2), dtype=np.float32) / 255
+        t1 = time.perf_counter()
+
+        outputs = self.session.run(None, {self.input_name: inputs})[0]  # (batch, 4 + nc, anchors)
+        t2 = time.perf_counter()
+
+        results = []
+        for image, output, (scale, (left, top)) in zip(images, outputs, transforms):
+            predictions = output.T  # (anchors, 4 + nc)
+            scores = predictions[:, 4:]
+            class_id = scores.argmax(1)
+            confidence = scores[np.arange(len(scores)), class_id]
+            keep = confidence > conf
+            cxcywh, confidence, class_id = predictions[keep, :4], confidence[keep], class_id[keep]
+
+            xyxy = np.empty_like(cxcywh)
+            xyxy[:, :2] = cxcywh[:, :2] - cxcywh[:, 2:] / 2
+            xyxy[:, 2:] = cxcywh[:, :2] + cxcywh[:, 2:] / 2
+            boxes = torch.from_numpy(xyxy)
+            kept = torchvision.ops.batched_nms(boxes, torch.from_numpy(confidence), torch.from_numpy(class_id), iou)
+            kept = kept[:max_det].numpy()
+
+            # Back to the coordinates of the original image
+            xyxy = xyxy[kept]
+            xyxy[:, [0, 2]] = ((xyxy[:, [0, 2]] - left) / scale).clip(0, image.shape[1])
+            xyxy[:, [1, 3]] = ((xyxy[:, [1, 3]] - top) / scale).clip(0, image.shape[0])
+            data = np.column_stack([xyxy, confidence[kept], class_id[kept].astype(np.float32)])
+            results.append(Results(image, path="", names=self.names, boxes=torch.from_numpy(data)))
+        t3 = time.perf_counter()
+
+        n = len(images)
+        speed = {
+            "preprocess": (t1 - t0) * 1000 / n,
+            "inference": (t2 - t1) * 1000 / n,
+            "postprocess": (t3 - t2) * 1000 / n,
+        }
+        for result in results:
+            result.speed = speed
+        return results
+
+
+def _box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """IoU matrix between two sets of xyxy boxes"""
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return intersection / (area_a[:, None] + area_b[None, :] - intersection + 1e-9)
+
+
+def compare_detections(reference, candidate, iou_threshold: float = 0.9, conf_tolerance: float = 0.05) -> dict:
+    """
+    Matches the detections of two results of the same image (same class, IoU above iou_threshold).
+
+    Returns:
+        dict: number of detections, matched ones and largest confidence difference of the matches.
+    """
+    ref = reference.boxes.data.cpu().numpy()
+    cand = candidate.boxes.data.cpu().numpy()
+    matched, max_conf_diff = 0, 0.0
+    if len(ref) and len(cand):
+        ious = _box_iou(ref[:, :4], cand[:, :4])
+        ious[ref[:, 5][:, None] != cand[:, 5][None, :]] = 0
+        used = set()
+        for i in np.argsort(-ref[:, 4]):
+            j = int(np.argmax(ious[i]))
+            if ious[i, j] >= iou_threshold and j not in used:
+                used.add(j)
+                diff = abs(float(ref[i, 4] - cand[j, 4]))
+                max_conf_diff = max(max_conf_diff, diff)
+                matched += diff <= conf_tolerance
+    return {
+        "reference": len(ref),
+        "candidate": len(cand),
+        "matched": matched,
+        "max_conf_diff": max_conf_diff,
+    }
+
+
+def parity_check(
+    reference_model, candidate_model, images: list[np.ndarray], min_match_ratio: float = 0.95, **kwargs
+) -> dict:
+    """Checks that the candidate finds the same detections as the reference on the images"""
+    totals = {"reference": 0, "candidate": 0, "matched": 0, "max_conf_diff": 0.0}
+    for image in images:
+        reference = reference_model.predict(image, verbose=False)[0]
+        candidate = candidate_model.predict(image, verbose=False)[0]
+        comparison = compare_detections(reference, candidate, **kwargs)
+        for key in ("reference", "candidate", "matched"):
+            totals[key] += comparison[key]
+        totals["max_conf_diff"] = max(totals["max_conf_diff"], comparison["max_conf_diff"])
+
+    expected = max(totals["reference"], totals["candidate"])
+    totals["match_ratio"] = totals["matched"] / expected if expected else 1.0
+    totals["passed"] = totals["match_ratio"] >= min_match_ratio
+    return totals
+
+
+def benchmark_latency(model, images: list[np.ndarray], runs: int = 20, warmup: int = 3) -> dict:
+    """Single image latency (ms) of a model, cycling through the images"""
+    for image in images[:warmup]:
+        model.predict(image, verbose=False)
+    timings = []
+    for i in range(runs):
+        start = time.perf_counter()
+        model.predict(images[i % len(images)], verbose=False)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "mean_ms": float(np.mean(timings)),
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95)),
+    }
+
+
+def load_images(source: str | Path) -> list[np.ndarray]:
+    import cv2
+
+    source = Path(source)
+    paths = (
+        sorted(p for p in source.iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+        if source.is_dir()
+        else [source]
+    )
+    return [cv2.imread(str(p)) for p in paths]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parity and latency report of the CPU backends against torch")
+    parser.add_argument("weights", help="Path to the .pt weights")
+    parser.add_argument("images", help="Image or directory of images")
+    parser.add_argument("--backends", nargs="+", default=["onnx", "onnx-int8"], choices=BACKENDS)
+    parser.add_argument("--threads", type=int, default=0, help="ONNX Runtime threads")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    images = load_images(args.images)
+    reference = load_model(args.weights, "torch")
+    report = {"torch": {"latency": benchmark_latency(reference, images, args.runs)}}
+    for backend in args.backends:
+        model = load_model(args.weights, backend, num_threads=args.threads)
+        report[backend] = {
+            "latency": benchmark_latency(model, images, args.runs),
+            "parity": parity_check(reference, model, images),
+        }
+
+    print(f"{'backend':<12}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'parity':>10}")
+    for backend, entry in report.items():
+        latency = entry["latency"]
+        parity = entry.get("parity")
+        parity_str = "-" if parity is None else f"{parity['match_ratio']:.0%}"
+        print(
+            f"{backend:<12}{latency['mean_ms']:>10.1f}{latency['p50_ms']:>10.1f}{latency['p95_ms']:>10.1f}{parity_str:>10}"
+        )
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
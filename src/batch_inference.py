@@ -0,0 +1,317 @@
+"""
+Batch inference over a directory, a glob pattern or a list of image files.
+
+The images are decoded by a pool of threads (OpenCV releases the GIL while decoding) a bounded number of images ahead
+of the model, which predicts them in batches. Only the images in flight are in memory, whatever the number of files.
+The detections stream to the output, one record per image:
+
+    {"path", "width", "height", "boxes": [{"xyxy", "confidence", "class_id", "class_name"}], "error"}
+
+- .jsonl: one JSON record per line, flushed after each batch
+- .parquet: a directory of part files (part-00000.parquet, ...) of a few thousand records, each written atomically
+
+The images already in the output are skipped, so an interrupted run is resumed by running it again with the same
+output. Unreadable images are recorded with their error. With annotate_dir, the images with their boxes drawn are
+written there too (by the same thread pool).
+
+    python src/batch_inference.py "data/shelves/**/*.jpg" --weights tmp/models/best.pt --output detections.jsonl
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import numpy as np
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+PARQUET_PART_SIZE = 4096  # records per part file
+
+
+def list_images(source: str | Path) -> tuple[list[Path], Path | None]:
+    """
+    Images of the source: a directory (recursively), a glob pattern, a .txt file listing images, or a single image.
+
+    Returns:
+        the sorted images, and the directory they are relative to (for the annotated images), if any.
+    """
+    path = Path(source)
+    if path.is_dir():
+        return sorted(p for p in path.rglob("*") if p.suffix.lower() in IMAGE_SUFFIXES), path
+    if path.is_file() and path.suffix == ".txt":
+        return [Path(line.strip()) for line in path.read_text().splitlines() if line.strip()], None
+    if path.is_file():
+        return [path], None
+    matches = sorted(Path(p) for p in glob.glob(str(source), recursive=True))
+    if not matches:
+        raise FileNotFoundError(f"No images match {source}")
+    return [p for p in matches if p.suffix.lower() in IMAGE_SUFFIXES], None
+
+
+def decode_image(path: Path) -> np.ndarray:
+    import cv2
+
+    image = cv2.imread(str(path))  # BGR like ultralytics
+    if image is None:
+        raise ValueError("unreadable image")
+    return image
+
+
+def detections_record(path: Path, result) -> dict:
+    """Record of an image from its ultralytics result, converted with a single device-to-host copy"""
+    data = result.boxes.data.cpu().numpy()  # (n, 6): xyxy, confidence, class
+    names = result.names
+    height, width = result.orig_shape
+    boxes = [
+        {"xyxy": row[:4], "confidence": row[4], "class_id": int(row[5]), "class_name": names[int(row[5])]}
+        for row in data.tolist()
+    ]
+    return {"path": str(path), "width": width, "height": height, "boxes": boxes, "error": None}
+
+
+def error_record(path: Path, error: Exception) -> dict:
+    return {"path": str(path), "width": None, "height": None, "boxes": [], "error": f"{type(error).__name__}: {error}"}
+
+
+class JsonlWriter:
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = None
+
+    def processed(self) -> set[str]:
+        """Images already in the output. A line cut by an interruption is removed"""
+        if not self.path.exists():
+            return set()
+        data = self.path.read_bytes()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            with open(self.path, "r+b") as f:
+                f.truncate(end)
+        return {json.loads(line)["path"] for line in data[:end].splitlines() if line.strip()}
+
+    def write(self, records: list[dict]) -> None:
+        if self._file is None:
+            self._file = open(self.path, "a")
+        self._file.write("".join(json.dumps(record) + "\n" for record in records))
+        self._file.flush()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class ParquetWriter:
+    def __init__(self, path: str | Path, part_size: int = PARQUET_PART_SIZE) -> None:
+        import pyarrow as pa
+
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.part_size = part_size
+        self._records: list[dict] = []
+        box = pa.struct(
+            [
+                ("xyxy", pa.list_(pa.float32(), 4)),
+                ("confidence", pa.float32()),
+                ("class_id", pa.int64()),
+                ("class_name", pa.string()),
+            ]
+        )
+        self.schema = pa.schema(
+            [
+                ("path", pa.string()),
+                ("width", pa.int64()),
+                ("height", pa.int64()),
+                ("boxes", pa.list_(box)),
+                ("error", pa.string()),
+            ]
+        )
+
+    def _parts(self) -> list[Path]:
+        return sorted(self.path.glob("part-*.parquet"))
+
+    def processed(self) -> set[str]:
+        import pyarrow.parquet as pq
+
+        return {path for part in self._parts() for path in pq.read_table(part, columns=["path"])["path"].to_pylist()}
+
+    def write(self, records: list[dict]) -> None:
+        self._records.extend(records)
+        if len(self._records) >= self.part_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not self._records:
+            return
+        parts = self._parts()
+        index = int(parts[-1].stem.split("-")[1]) + 1 if parts else 0
+        path = self.path / f"part-{index:05d}.parquet"
+        tmp_path = path.with_suffix(".tmp")
+        pq.write_table(pa.Table.from_pylist(self._records, schema=self.schema), tmp_path)
+        os.replace(tmp_path, path)
+        self._records = []
+
+    def close(self) -> None:
+        self._flush()
+
+
+def open_writer(path: str | Path) -> JsonlWriter | ParquetWriter:
+    """Writer of the output format given by the extension (.jsonl or .parquet)"""
+    suffix = Path(path).suffix
+    if suffix == ".jsonl":
+        return JsonlWriter(path)
+    if suffix == ".parquet":
+        return ParquetWriter(path)
+    raise ValueError(f"Output must be a .jsonl file or a .parquet directory, got {path}")
+
+
+@dataclass
+class BatchReport:
+    images: int = 0  # in the source
+    skipped: int = 0  # already in the output
+    processed: int = 0
+    errors: int = 0
+    seconds: float = 0.0
+
+    @property
+    def images_per_second(self) -> float:
+        return self.processed / self.seconds if self.seconds else 0.0
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "images_per_second": self.images_per_second}
+
+
+class BatchInference:
+    def __init__(
+        self,
+        model,
+        batch_size: int = 16,
+        workers: int | None = None,
+        prefetch: int | None = None,
+        imgsz: int = 640,
+        conf: float = 0.25,
+        annotate_dir: str | Path | None = None,
+    ) -> None:
+        """
+        Args:
+            model: YOLO model or backend (anything with predict taking a list of BGR images, see src/backends.py).
+            batch_size (int): Images per predict call.
+            workers (int): Threads decoding the images (and writing the annotated ones), os.cpu_count() by default.
+            prefetch (int): Images decoded ahead of the model, 2 batches by default. Bounds the memory.
+            annotate_dir (str, Path): Where to write the annotated images, None to not write them.
+        """
+        self.model = model
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count() or 1
+        self.prefetch = max(prefetch or 2 * batch_size, batch_size)
+        self.imgsz = imgsz
+        self.conf = conf
+        self.annotate_dir = Path(annotate_dir) if annotate_dir is not None else None
+
+    def _annotated_path(self, path: Path, root: Path | None) -> Path:
+        relative = path.relative_to(root) if root is not None and path.is_relative_to(root) else Path(path.name)
+        return self.annotate_dir / relative
+
+    def _write_annotated(self, path: Path, result) -> None:
+        import cv2
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        cv2.imwrite(str(path), result.plot())
+
+    def _batches(self, executor: ThreadPoolExecutor, paths: Iterable[Path]) -> Iterator[list[tuple[Path, Future]]]:
+        """Batches of (path, decoding), keeping prefetch decodings in flight"""
+        pending: deque[tuple[Path, Future]] = deque()
+        paths = iter(paths)
+        while True:
+            for path in paths:
+                pending.append((path, executor.submit(decode_image, path)))
+                if len(pending) >= self.prefetch:
+                    break
+            if not pending:
+                return
+            yield [pending.popleft() for _ in range(min(self.batch_size, len(pending)))]
+
+    def run(self, paths: list[Path], writer: JsonlWriter | ParquetWriter, root: Path | None = None) -> BatchReport:
+        """
+        Predicts the images not already in the writer's output and writes their records.
+
+        Args:
+            paths (list[Path]): Images, see list_images.
+            root (Path): Directory the annotated images are written relative to (their file name otherwise).
+        """
+        report = BatchReport(images=len(paths))
+        processed = writer.processed()
+        todo = [path for path in paths if str(path) not in processed]
+        report.skipped = len(paths) - len(todo)
+
+        start = time.perf_counter()
+        annotating: list[Future] = []
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="batch-decode") as executor:
+            try:
+                for batch in self._batches(executor, todo):
+                    records, images = {}, []
+                    for path, decoding in batch:
+                        try:
+                            images.append((path, decoding.result()))
+                        except Exception as e:
+                            records[path] = error_record(path, e)
+                    if images:
+                        results = self.model.predict(
+                            [image for _, image in images], imgsz=self.imgsz, conf=self.conf, verbose=False
+                        )
+                        # The previous batch's annotated images are written before queuing more (bounded memory)
+                        for future in annotating:
+                            future.result()
+                        annotating = []
+                        for (path, _), result in zip(images, results):
+                            records[path] = detections_record(path, result)
+                            if self.annotate_dir is not None:
+                                annotated_path = self._annotated_path(path, root)
+                                annotating.append(executor.submit(self._write_annotated, annotated_path, result))
+                    writer.write([records[path] for path, _ in batch])  # In the order of the source
+                    report.processed += len(batch)
+                    report.errors += len(batch) - len(images)
+                for future in annotating:
+                    future.result()
+            finally:
+                writer.close()
+        report.seconds = time.perf_counter() - start
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch inference over a directory, glob or list of images")
+    parser.add_argument("source", help="Directory, glob pattern (quoted), .txt list of images or image")
+    parser.add_argument("--weights", required=True, help="Weights (.pt, or an ONNX variant)")
+    parser.add_argument("--output", required=True, help=".jsonl file or .parquet directory, resumed if it exists")
+    parser.add_argument("--backend", default="torch", help="See src/backends.py")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=None, help="Decoding threads (default: CPU count)")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--annotate-dir", help="Also write the annotated images to this directory")
+    args = parser.parse_args()
+
+    from backends import load_model
+
+    paths, root = list_images(args.source)
+    model = load_model(args.weights, args.backend, imgsz=args.imgsz)
+    engine = BatchInference(
+        model, args.batch_size, args.workers, imgsz=args.imgsz, conf=args.conf, annotate_dir=args.annotate_dir
+    )
+    report = engine.run(paths, open_writer(args.output), root)
+    print(json.dumps(report.to_dict(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Adaptive micro-batching for the serving path.
+
+Concurrent requests are collected into a single batch (up to max_batch_size, waiting at most max_wait_ms
+for the batch to fill) and handed to one handler call. Each caller gets back its own result.
+While all batch slots are busy, new requests pile up in the queue, so batches naturally grow with the load.
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        handler: Callable[[list], Awaitable[list]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 5.0,
+        max_concurrent_batches: int = 1,
+        max_pending: int = 0,
+        on_batch: Callable[[int, list[float]], None] | None = None,
+    ) -> None:
+        """
+        Initializes the batcher.
+
+        Args:
+            handler (Callable): Coroutine function taking a list of items and returning a list of results (same order and length).
+            max_batch_size (int): Maximum number of items handed to the handler at once.
+            max_wait_ms (float): Maximum time to wait for a batch to fill once its first item arrived.
+            max_concurrent_batches (int): Number of batches that can be handled at the same time (e.g. one per model replica).
+            max_pending (int): Maximum number of items waiting for a batch, 0 for unbounded.
+            on_batch (Callable): Called with the size of each batch and the time (s) each of its items waited.
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        if max_concurrent_batches < 1:
+            raise ValueError("max_concurrent_batches must be at least 1")
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_concurrent_batches = max_concurrent_batches
+        self.max_pending = max_pending
+        self.on_batch = on_batch
+        self._queue: asyncio.Queue | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._worker: asyncio.Task | None = None
+        self._running: set[asyncio.Task] = set()  # keeps a reference on in-flight batches
+
+    @property
+    def pending(self) -> int:
+        """Number of items waiting for a batch"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, item: Any) -> Any:
+        """
+        Queues an item and waits for its own result.
+
+        Raises:
+            asyncio.QueueFull: if max_pending items are already waiting.
+        """
+        if self._worker is None or self._worker.done():
+            # Started lazily: the service may be built outside of the event loop
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self) -> list[tuple[Any, asyncio.Future, float]]:
+        """Waits for a first item, then fills the batch until it is full or the wait budget is spent"""
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # Take whatever is already waiting without yielding to the loop
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            # Only form a batch once a slot is free, so it holds everything that queued up meanwhile
+            await self._slots.acquire()
+            batch = await self._collect()
+            task = asyncio.create_task(self._handle(batch))
+            self._running.add(task)
+            task.add_done_callback(self._batch_done)
+
+    def _batch_done(self, task: asyncio.Task) -> None:
+        self._running.discard(task)
+        self._slots.release()
+
+    async def _handle(self, batch: list[tuple[Any, asyncio.Future, float]]) -> None:
+        items = [item for item, _, _ in batch]
+        if self.on_batch is not None:
+            now = time.perf_counter()
+            self.on_batch(len(batch), [now - enqueued for _, _, enqueued in batch])
+        try:
+            results = await self.handler(items)
+            if len(results) != len(items):
+                raise RuntimeError(f"Batch handler returned {len(results)} results for {len(items)} items")
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():  # caller may have been cancelled
+                future.set_result(result)
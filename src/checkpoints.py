@@ -0,0 +1,113 @@
+"""
+Training checkpoints uploaded to the MLflow run, to resume an interrupted training.
+
+Ultralytics writes weights/last.pt (weights, optimizer state, epoch and train arguments) at the end of every epoch.
+Every `every` epochs, the on_model_save callback copies it and uploads the copy to the run as checkpoints/last.pt in a
+background thread, so the training goes on during the upload (an epoch ending while the previous checkpoint is still
+uploading is skipped). The run is tagged training_state=running until the training ends (complete), and
+checkpoint_epoch with the epochs of the uploaded checkpoint.
+
+A training that died (out of memory, preemption...) leaves a run still tagged running with a checkpoint:
+latest_checkpoint finds the most recent one and downloads its checkpoint, and the training is resumed from it by
+Ultralytics (resume=True) in the same MLflow run.
+"""
+
+import shutil
+import tempfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+import mlflow
+from mlflow import MlflowClient
+from rich.console import Console
+
+CHECKPOINT_DIR = "checkpoints"
+CHECKPOINT_NAME = "last.pt"
+
+console = Console()
+
+
+def latest_checkpoint(run_name: str, dst_path: str | Path) -> tuple[str, Path] | tuple[None, None]:
+    """
+    Most recent interrupted run named run_name with a checkpoint, in the active experiment.
+
+    Returns:
+        the id of the run and its checkpoint downloaded to dst_path, (None, None) if there is none.
+    """
+    runs = mlflow.search_runs(
+        filter_string=f"attributes.run_name = '{run_name}' and tags.training_state = 'running' "
+        "and tags.checkpoint_epoch != ''",
+        order_by=["attributes.start_time DESC"],
+        max_results=1,
+        output_format="list",
+    )
+    if not runs:
+        return None, None
+    run = runs[0]
+    Path(dst_path).mkdir(parents=True, exist_ok=True)
+    checkpoint = mlflow.artifacts.download_artifacts(
+        run_id=run.info.run_id, artifact_path=f"{CHECKPOINT_DIR}/{CHECKPOINT_NAME}", dst_path=str(dst_path)
+    )
+    console.print(f"Resuming run {run.info.run_id} after epoch {run.data.tags['checkpoint_epoch']}")
+    return run.info.run_id, Path(checkpoint)
+
+
+class CheckpointUploader:
+    """Ultralytics callbacks uploading the checkpoints of a training to its MLflow run"""
+
+    def __init__(self, run_id: str, every: int = 1, resumed: bool = False) -> None:
+        """
+        Args:
+            run_id (str): Run of the training.
+            every (int): Upload a checkpoint every `every` epochs, 0 to disable the uploads.
+            resumed (bool): Whether the training resumes the run from one of its checkpoints.
+        """
+        self.run_id = run_id
+        self.every = every
+        self.resumed = resumed
+        self.client = MlflowClient()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.staging = Path(tempfile.mkdtemp(prefix="checkpoints-"))
+        self.pending: Future | None = None
+        self.uploaded = 0  # epochs of the last uploaded checkpoint
+
+    def attach(self, model) -> None:
+        """Adds the callbacks to a YOLO model, before model.train"""
+        self.client.set_tag(self.run_id, "training_state", "running")
+        model.add_callback("on_train_start", self.on_train_start)
+        model.add_callback("on_model_save", self.on_model_save)
+        model.add_callback("on_train_end", self.on_train_end)
+
+    def on_train_start(self, trainer) -> None:
+        if self.resumed and mlflow.active_run() is not None:
+            # The params of the run were logged by the interrupted training, the Ultralytics callback fails to log
+            # them again (model and resume changed) and stops logging: keep logging the epochs to the resumed run
+            trainer._mlflow_active = True
+
+    def on_model_save(self, trainer) -> None:
+        epochs = trainer.epoch + 1
+        if not self.every or epochs % self.every or epochs >= trainer.epochs:
+            return  # Nothing to resume after the last epoch
+        if self.pending is not None and not self.pending.done():
+            console.print(f"Checkpoint of epoch {epochs} skipped, the previous one is still uploading")
+            return
+        staged = self.staging / CHECKPOINT_NAME
+        shutil.copyfile(trainer.last, staged)  # last.pt is rewritten by the next epoch
+        self.pending = self.executor.submit(self._upload, staged, epochs)
+
+    def _upload(self, path: Path, epochs: int) -> None:
+        try:
+            self.client.log_artifact(self.run_id, str(path), CHECKPOINT_DIR)
+            self.client.set_tag(self.run_id, "checkpoint_epoch", epochs)
+            self.uploaded = epochs
+        except Exception as e:  # The training goes on without this checkpoint
+            console.print(f"[yellow]Upload of the checkpoint of epoch {epochs} failed: {e}[/]")
+
+    def on_train_end(self, trainer) -> None:
+        self.close()
+        self.client.set_tag(self.run_id, "training_state", "complete")
+
+    def close(self) -> None:
+        """Waits for the upload in progress and removes the staged checkpoint"""
+        self.executor.shutdown(wait=True)
+        shutil.rmtree(self.staging, ignore_errors=True)
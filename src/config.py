@@ -16,13 +16,51 @@ class Config:
         self.ORG_NAME = "Picsalex-MLOps"
         self.HOST = "https://app.picsellia.com"  # If host changes, we need to redo everython so no need for env var
         self.DATASET_ID = "0194d124-1c5f-7d01-a532-be8aeebf59e8"
+        self.DOWNLOAD_WORKERS = 8  # Assets downloaded concurrently
+        self.EXTRACT_WORKERS = 4  # Threads writing the label files of the annotation export
+        self.INCREMENTAL_SYNC = True  # Only download and split what changed since the last run
+        # "move" the images to the split folders, or leave them in place and write the split as "index" files,
+        # "symlink" or "hardlink" folders (re-splitting is then instant)
+        self.SPLIT_MODE = "move"
+        self.STRATIFY_SPLIT = False  # Keep the class proportions in each split (not with "move")
+        # Train on images verified, deduplicated across splits and pre-resized once (data/THE-dataset/image_cache)
+        self.IMAGE_CACHE = True
 
         # Pipeline Training
         self.MODEL_NAME = "yolo11n"
         self.DATA_YAML = "data/THE-dataset/yolo.yaml"
+        self.DATASET_STATS = "data/THE-dataset/dataset_stats.json"  # Written by the data pipeline, logged with the run
         self.YOLO_DIR_TMP = "tmp/yolo_runs"
         self.DEVICE = "cpu"
+        self.IMAGE_SIZE = 640  # Training image size, also the size of the image cache
         self.EPOCHS = 1
+        self.CHECKPOINT_EVERY = 1  # Epochs between the checkpoints uploaded to the run, 0 to disable
+        self.RESUME = True  # Resume the last interrupted training of MODEL_NAME from its checkpoint, if any
+        # Promotion gate (src/promotion.py): CPU latency measured at these batch sizes, the candidate can be at most
+        # LATENCY_BUDGET slower than the Champion (and under MAX_LATENCY_MS ms if set) at each of them
+        self.PROMOTION_BATCH_SIZES = [1, 8]
+        self.PROMOTION_ITERATIONS = 10
+        self.LATENCY_BUDGET = 0.1
+        self.MAX_LATENCY_MS = None
+        # Post-training variants logged with the run (see src/variants.py), calibrated on VARIANT_SAMPLE train images
+        self.VARIANTS = ["onnx", "onnx-fp16", "onnx-int8", "onnx-fused"]
+        self.VARIANT_SAMPLE = 128
+        # Hyperparameter sweep instead of a single training, see src/sweep.py. The best trial is registered under
+        # MODEL_NAME, whatever its model size.
+        self.SWEEP = False
+        self.SWEEP_TRIALS = 8
+        self.SWEEP_CONCURRENCY = 2  # Trials trained at the same time, sharing the CPU cores
+        self.SWEEP_MIN_EPOCHS = 1  # Successive halving: 1, 3, 9 epochs, keeping the best third at each rung
+        self.SWEEP_MAX_EPOCHS = 9
+        self.SWEEP_ETA = 3
+        self.SWEEP_SPACE = {
+            "model": [self.MODEL_NAME],  # e.g. ["yolo11n", "yolo11s"] to search the model size too
+            "lr0": {"low": 1e-4, "high": 1e-2, "log": True},
+            "imgsz": [320, 480, 640],
+            "mosaic": [0.0, 0.5, 1.0],
+            "fliplr": [0.0, 0.5],
+            "hsv_v": {"low": 0.0, "high": 0.6},
+        }
 
         ## minio
         self.endpoint_url = os.getenv("MLFLOW_S3_ENDPOINT_URL")
@@ -3,10 +3,32 @@ Provide the source for the inference:
 - "image"
 - "video"
 - "camera"
+- "batch"
 
 if it is an image or video, also provide a link to the file. If none is provided, a default option will be used.
+
+With "batch", file_inference is a directory, a glob pattern or a .txt list of images: the detections are written to
+output_inference (.jsonl file or .parquet directory, resumed if it exists), see batch_inference.py.
+
+With "video" and "camera", nothing is displayed: the annotated video is written to output_video_inference and the
+detections of each frame to detections_log_inference, see video_stream.py.
+
+The backend can be "torch", "onnx", "onnx-int8" or "openvino" (see backends.py).
+The ONNX backends only support image and batch inference, video and camera tracking fall back to torch.
 """
 
 
 source_type_inference = "image"
-file_inference = "test_files/yolotest3.jpeg"
\ No newline at end of file
+file_inference = "test_files/yolotest3.jpeg"
+backend_inference = "torch"
+
+#Batch inference
+output_inference = "results_inference.jsonl"
+annotate_dir_inference = None #Directory where the annotated images are written, None to skip them
+batch_size_inference = 16
+
+#Video and camera inference
+output_video_inference = "results_inference.mp4"
+detections_log_inference = "results_inference_tracks.jsonl"
+drop_frames_inference = False #Skip the frames the tracker has no time for (live sources) instead of waiting for it
+buffer_size_video_inference = 8 #Frames waiting between two stages
@@ -1,14 +1,22 @@
 from pathlib import Path
 from picsellia import Client, Dataset, DatasetVersion
 from picsellia.types.enums import AnnotationFileType
-import zipfile
 import shutil
 from rich.console import Console
 from rich.progress import track
 import yaml
 import random
+import tempfile
 from typing import Optional
 from src.config import config
+from src.dataset_index import index_split_dataset, read_split
+from src.dataset_sync import sync_dataset
+from src.download_manager import MANIFEST_NAME, DownloadManager, Manifest, PicselliaDatasetClient
+from src.label_extraction import stream_extract_labels
+from src.dataset_stats import STATS_NAME, compute_dataset_stats, save_stats
+from src.image_cache import ImageCache
+from src.label_store import STORE_DIR, LabelStore
+from src.label_validation import ValidationReport, validate_stores
 
 
 # Configuration
@@ -16,15 +24,21 @@ DATASET_PATH = Path(r"data/THE-dataset")
 console = Console()
 
 
-def ensure_dataset_downloaded(dataset_version: DatasetVersion, dataset_path: Path):
-    """Download dataset if not already present"""
-    if not dataset_path.exists():
-        console.log(f"[yellow]Dataset not found at {dataset_path}, downloading...[/]")
-        dataset_path.parent.mkdir(parents=True, exist_ok=True)
-        dataset_version.download(dataset_path)
-        console.log("[green]Dataset downloaded successfully![/]")
-    else:
-        console.log("[blue]Dataset already exists, skipping download[/]")
+def ensure_dataset_downloaded(dataset_version: DatasetVersion, dataset_path: Path, max_workers: int = 8):
+    """Download the assets missing from dataset_path (resuming an interrupted download) and verify them"""
+    if (dataset_path / "train").exists() and not (dataset_path / MANIFEST_NAME).exists():
+        console.log("[blue]Dataset already split (downloaded before the manifest existed), skipping download[/]")
+        return
+    if Manifest(dataset_path / MANIFEST_NAME).complete:
+        console.log("[blue]Dataset already downloaded, skipping download[/]")
+        return
+
+    console.log(f"[yellow]Dataset missing or incomplete at {dataset_path}, downloading...[/]")
+    client = PicselliaDatasetClient(dataset_version, max_connections=max_workers)
+    report = DownloadManager(client, dataset_path, max_workers=max_workers).download()
+    if report.failed:
+        raise RuntimeError(f"{len(report.failed)} assets could not be downloaded, run the pipeline again to resume")
+    console.log("[green]Dataset downloaded successfully![/]")
 
 
 def ensure_annotations_present(dataset_path: Path) -> bool:
@@ -53,25 +67,16 @@ def ensure_annotations_downloaded(dataset_path: Path, dataset_version: DatasetVe
     return None
 
 
-def extract_annotations(annotation_file: str, dataset_path: Path):
-    """Extract and organize annotation files"""
-    # Delete existing txt files before extraction
-    for txt_file in dataset_path.glob("*.txt"):
-        txt_file.unlink()
-
-    temp_dir = dataset_path / "temp"
+def extract_annotations(annotation_file: str, dataset_path: Path, workers: int = 1):
+    """Extract the label files of the export straight into dataset_path, replacing the existing ones"""
     console.log("[yellow]Extracting annotation files...[/]")
-
-    with zipfile.ZipFile(annotation_file, "r") as zip_ref:
-        zip_ref.extractall(temp_dir)
-
-    for txt_file in track(list(temp_dir.rglob("*.txt")), description="Moving annotation files"):
-        shutil.move(str(txt_file), str(dataset_path / txt_file.name))
-
-    shutil.rmtree(temp_dir)
+    report = stream_extract_labels(annotation_file, dataset_path, workers=workers)
 
     shutil.rmtree(Path(annotation_file).parent.parent)
-    console.log("[green]Annotation files extracted and organized![/]")
+    console.log(
+        f"[green]{report.written} annotation files extracted ({report.removed} stale removed) "
+        f"in {report.seconds:.1f}s![/]"
+    )
 
 
 def split_dataset(dataset_path: Path, train_ratio: float, valid_ratio: float, seed: int = 42):
@@ -132,19 +137,37 @@ def split_dataset(dataset_path: Path, train_ratio: float, valid_ratio: float, se
     console.log("[green]Dataset split complete![/]")
 
 
-def create_yaml_yolo(dataset_path: Path, classes: list[str]):
-    """Create yaml file for yolo training"""
+def sync_dataset_version(
+    dataset_version: DatasetVersion, dataset_path: Path, train_ratio: float, valid_ratio: float, max_workers: int = 8
+):
+    """Incremental alternative to the download, extraction and split steps: only applies what changed on Picsellia"""
+    with tempfile.TemporaryDirectory() as export_dir:
+        annotation_file = dataset_version.export_annotation_file(
+            annotation_file_type=AnnotationFileType.YOLO,
+            target_path=export_dir,
+        )
+        client = PicselliaDatasetClient(dataset_version, max_connections=max_workers)
+        report = sync_dataset(client, dataset_path, annotation_file, train_ratio, valid_ratio, max_workers=max_workers)
+    if report.failed:
+        raise RuntimeError(f"{len(report.failed)} assets could not be downloaded, run the pipeline again to resume")
+
+
+def create_yaml_yolo(dataset_path: Path, classes: list[str], split_paths: Optional[dict[str, str]] = None):
+    """Create yaml file for yolo training, split_paths (index files or directories) default to the split folders"""
     console.log("[yellow]Creating yaml file for yolo training...[/]")
     yaml_path = dataset_path / "yolo.yaml"
 
     # Create dict mapping index to class name
     names_dict = {i: name for i, name in enumerate(classes)}
 
+    if split_paths is None:
+        split_paths = {split: f"./{split}/images" for split in ["train", "valid", "test"]}
+
     # Create yaml config dict
     yaml_config = {
-        "test": "./test/images",
-        "train": "./train/images",
-        "val": "./valid/images",
+        "test": split_paths["test"],
+        "train": split_paths["train"],
+        "val": split_paths["valid"],
         "nc": len(classes),
         "names": names_dict,
     }
@@ -155,49 +178,102 @@ def create_yaml_yolo(dataset_path: Path, classes: list[str]):
     console.log("[green]YAML file created![/]")
 
 
-def validate_dataset(dataset_path: Path):
+def split_images(dataset_path: Path, split_paths: Optional[dict[str, str]] = None) -> dict[str, Optional[list[Path]]]:
+    """Images of each split, from the index files or link folders of split_paths or the images folders of
+    split_dataset. None for the missing splits."""
+    splits = {}
+    for split in ["train", "valid", "test"]:
+        yaml_path = split_paths[split] if split_paths is not None else f"./{split}/images"
+        try:
+            splits[split] = read_split(dataset_path, yaml_path)
+        except FileNotFoundError:
+            splits[split] = None
+    return splits
+
+
+def build_label_stores(
+    dataset_path: Path, split_paths: Optional[dict[str, str]] = None
+) -> dict[str, Optional[LabelStore]]:
+    """Pack the labels of each split into dataset_path/label_store/<split> (see src/label_store.py), only the label
+    files changed since the previous build are parsed. None for the missing splits."""
+    stores = {}
+    for split, image_files in split_images(dataset_path, split_paths).items():
+        if image_files is None:
+            stores[split] = None
+            continue
+        store_path = dataset_path / STORE_DIR / split
+        previous = LabelStore.load(store_path, dataset_path) if store_path.exists() else None
+        stores[split] = LabelStore.build(image_files, dataset_path, previous)
+        stores[split].save(store_path)
+    return stores
+
+
+def write_dataset_stats(dataset_path: Path, stores: dict[str, Optional[LabelStore]], nc: Optional[int] = None) -> dict:
+    """Statistics of the splits (see src/dataset_stats.py), saved to dataset_path/dataset_stats.json for the training
+    run, which logs them and compares them with the ones of the Champion's dataset"""
+    console.log("[yellow]Computing dataset statistics...[/]")
+    stats = compute_dataset_stats(stores, nc=nc)
+    save_stats(stats, dataset_path / STATS_NAME)
+    for split, split_stats in stats["splits"].items():
+        console.log(
+            f"{split}: {split_stats['images']} images, {split_stats['boxes_per_image']:.2f} boxes per image, "
+            f"boxes per class {split_stats['histograms']['classes']['counts']}"
+        )
+    return stats
+
+
+def cache_images(
+    dataset_path: Path, split_paths: Optional[dict[str, str]] = None, imgsz: int = 640, workers: Optional[int] = None
+) -> dict[str, str]:
+    """Verify, deduplicate across splits and pre-resize the images for training (see src/image_cache.py).
+    Returns the split folders of the cache, to put in yolo.yaml."""
+    console.log(f"[yellow]Caching images at {imgsz}px...[/]")
+    splits = {split: images for split, images in split_images(dataset_path, split_paths).items() if images is not None}
+    cache_paths, report = ImageCache(dataset_path, imgsz=imgsz, workers=workers).build(splits)
+    report.save(dataset_path / "image_cache_report.json")
+    console.log(
+        f"{report.processed} images decoded, {report.images - report.processed} unchanged ({report.seconds:.1f}s), "
+        f"kept {report.kept}"
+    )
+    if report.duplicates:
+        console.log(f"[yellow]{len(report.duplicates)} duplicates dropped, {report.leaked} across splits[/]")
+    if report.unreadable:
+        console.log(f"[red]{len(report.unreadable)} unreadable images dropped: {list(report.unreadable)[:5]}[/]")
+    return cache_paths
+
+
+def validate_dataset(
+    dataset_path: Path,
+    split_paths: Optional[dict[str, str]] = None,
+    nc: Optional[int] = None,
+    stores: Optional[dict[str, Optional[LabelStore]]] = None,
+) -> ValidationReport:
     """Validation part of the pipeline, checking if :
-    - The dataset is correctly structured (images and labels folders)
+    - The dataset is correctly structured (images and labels folders, or the index files of split_paths)
     - Each image has a corresponding label file
-    - The labels are correctly formatted
+    - The labels are correctly formatted: 5 values, class ids in [0, nc), normalized coordinates, boxes with an area
+      (see src/label_validation.py, run on the label stores of the splits)
+
+    Returns the report (with the number of boxes and images per class), raises a ValueError if there are errors.
+    The label stores are built if not given.
     """
     console.log("[yellow]Validating dataset...[/]")
-    errors = 0
-    warnings = 0
-    for split in ["train", "valid", "test"]:
-        images_path = dataset_path / split / "images"
-        labels_path = dataset_path / split / "labels"
-
-        # Check if images and labels folders exist
-        if not images_path.exists() or not labels_path.exists():
-            console.log(f"[red]Images or labels folder not found for {split} split[/]")
-            errors += 1
-            continue
-
-        # Check if each image has a corresponding label file
-        images = set(img.stem for img in images_path.glob("*.jpg"))
-        labels = set(label.stem for label in labels_path.glob("*.txt"))
-        missing_labels = images - labels
-        if missing_labels:
-            console.log(f"[yellow](warning) {len(missing_labels)} images are missing label files in {split} split[/]")
-            warnings += len(missing_labels)
-
-        # Check if labels are correctly formatted
-        for label_file in labels_path.glob("*.txt"):
-            with open(label_file, "r") as f:
-                lines = f.readlines()
-            for line in lines:
-                parts = line.strip().split()
-                if len(parts) != 5:
-                    console.log(f"[red]Incorrect format in {label_file.name}[/]")
-                    errors += 1
-                    break
-
-    if errors == 0:
+    if stores is None:
+        stores = build_label_stores(dataset_path, split_paths)
+    report = validate_stores(stores, nc=nc)
+    console.log(
+        f"{report.checked} label files parsed, {report.cached} unchanged taken from the label store "
+        f"({report.seconds:.1f}s), warnings: {report.warnings or 'none'}"
+    )
+    for split, summary in report.splits.items():
+        if summary is not None:
+            console.log(f"{split}: {summary['boxes']} boxes, per class {summary['boxes_per_class']}")
+    if report.ok:
         console.log("[green]Dataset validation successful![/]")
     else:
-        console.log(f"[red]{errors} errors found in the dataset[/]")
+        console.log(f"[red]Errors found in the dataset: {report.errors}[/]")
         raise ValueError("Dataset validation failed")
+    return report
 
 
 def main():
@@ -211,20 +287,39 @@ def main():
     dataset: Dataset = client.get_dataset_by_id(config.DATASET_ID)
     dataset_version: DatasetVersion = dataset.get_version("initial")
 
-    # PIPELINE ML 1 : Data extraction
-    ensure_dataset_downloaded(dataset_version, DATASET_PATH)
-    annotation_file = ensure_annotations_downloaded(DATASET_PATH, dataset_version)
-    if annotation_file:
-        extract_annotations(annotation_file, DATASET_PATH)
+    if config.INCREMENTAL_SYNC:
+        # PIPELINE ML 1 + 2 : Data extraction and preparation of the changes only
+        sync_dataset_version(dataset_version, DATASET_PATH, 0.6, 0.2, max_workers=config.DOWNLOAD_WORKERS)
+    else:
+        # PIPELINE ML 1 : Data extraction
+        ensure_dataset_downloaded(dataset_version, DATASET_PATH, max_workers=config.DOWNLOAD_WORKERS)
+        annotation_file = ensure_annotations_downloaded(DATASET_PATH, dataset_version)
+        if annotation_file:
+            extract_annotations(annotation_file, DATASET_PATH, workers=config.EXTRACT_WORKERS)
 
     # PIPELINE ML 2 : Data preparation
-    split_dataset(DATASET_PATH, 0.6, 0.2)  # 60% train, 20% valid, 20% test
+    split_paths = None
+    if config.SPLIT_MODE != "move":
+        # Images left in place, the split is only written as index files or links
+        console.log(f"[yellow]Splitting dataset ({config.SPLIT_MODE}, stratify={config.STRATIFY_SPLIT})...[/]")
+        split_paths = index_split_dataset(
+            DATASET_PATH, 0.6, 0.2, stratify=config.STRATIFY_SPLIT, mode=config.SPLIT_MODE
+        )
+    elif not config.INCREMENTAL_SYNC:
+        split_dataset(DATASET_PATH, 0.6, 0.2)  # 60% train, 20% valid, 20% test
     classes = dataset_version.list_labels()
     class_names = [label.name for label in classes]
-    create_yaml_yolo(DATASET_PATH, class_names)
 
-    # PIPELINE ML 3 : Data validation
-    validate_dataset(DATASET_PATH)
+    # PIPELINE ML 3 : Data validation and statistics
+    stores = build_label_stores(DATASET_PATH, split_paths)
+    report = validate_dataset(DATASET_PATH, split_paths, nc=len(class_names), stores=stores)
+    report.save(DATASET_PATH / "validation_report.json")
+    write_dataset_stats(DATASET_PATH, stores, nc=len(class_names))
+
+    # Training reads the readable, deduplicated and pre-resized images of the cache
+    if config.IMAGE_CACHE:
+        split_paths = cache_images(DATASET_PATH, split_paths, imgsz=config.IMAGE_SIZE)
+    create_yaml_yolo(DATASET_PATH, class_names, split_paths)
 
 
 if __name__ == "__main__":
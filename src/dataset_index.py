@@ -0,0 +1,155 @@
+"""
+Copy-free dataset splitting.
+
+The images stay where they are (flat in the dataset directory, or in the split directories of the incremental sync)
+and the split membership is written either as index files listing the images (train.txt, valid.txt, test.txt, read by
+YOLO through yolo.yaml) or as directories of symlinks / hardlinks to them (splits/<split>/images and labels).
+Re-splitting only rewrites these, so changing the ratios takes seconds and does not touch the data.
+
+With stratify, images are grouped by their rarest class (computed on the packed label store, see
+src/label_store.py) and each group is split with the ratios, so every class keeps about the same proportions in each
+split.
+"""
+
+import os
+import random
+import shutil
+from pathlib import Path
+
+from src.image_cache import CACHE_DIR
+from src.label_store import STORE_DIR, LabelStore, label_path  # noqa: F401 (label_path re-exported)
+
+SPLITS = ("train", "valid", "test")
+SPLIT_MODES = ("index", "symlink", "hardlink")
+IMAGE_FORMATS = (".jpg", ".jpeg", ".png")
+LINKS_DIR = "splits"
+
+
+def list_images(dataset_path: Path) -> list[Path]:
+    """Images of the dataset, in any subdirectory but the links of a previous split and the image cache"""
+    images = []
+    for root, dirs, files in os.walk(dataset_path):
+        if Path(root) == dataset_path:
+            dirs[:] = [d for d in dirs if d not in (LINKS_DIR, STORE_DIR, CACHE_DIR)]
+        images.extend(Path(root) / name for name in files if Path(name).suffix.lower() in IMAGE_FORMATS)
+    return sorted(images)
+
+
+def assign_splits(
+    images: list[Path],
+    train_ratio: float,
+    valid_ratio: float,
+    seed: int = 42,
+    stratify: bool = False,
+    store: LabelStore | None = None,
+) -> dict[str, list[Path]]:
+    """
+    Splits the images with the ratios (the rest goes to test).
+
+    Args:
+        stratify (bool): Split each group of images sharing the same rarest class separately.
+        store (LabelStore): Labels of the images (same order) for stratify, packed from the label files if not given.
+    """
+    rng = random.Random(seed)
+    if not stratify:
+        groups = [list(images)]
+    else:
+        if store is None:
+            root = os.path.commonpath([Path(image).parent for image in images]) if images else "."
+            store = LabelStore.build(images, root)
+        rarest = store.rarest_classes()
+        by_rarest: dict[int, list[Path]] = {}
+        for image, key in zip(images, rarest.tolist()):
+            by_rarest.setdefault(key, []).append(image)
+        groups = [by_rarest[key] for key in sorted(by_rarest)]
+
+    splits: dict[str, list[Path]] = {split: [] for split in SPLITS}
+    for group in groups:
+        rng.shuffle(group)
+        if stratify:
+            # Rounded instead of truncated, the images of small groups would otherwise all end up in test
+            n_train = round(len(group) * train_ratio)
+            n_valid = min(round(len(group) * valid_ratio), len(group) - n_train)
+        else:
+            n_train = int(len(group) * train_ratio)
+            n_valid = int(len(group) * valid_ratio)
+        splits["train"] += group[:n_train]
+        splits["valid"] += group[n_train : n_train + n_valid]
+        splits["test"] += group[n_train + n_valid :]
+    return splits
+
+
+def _write_atomic(path: Path, content: str) -> None:
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(content)
+    os.replace(tmp_path, path)
+
+
+def _link(source: Path, target: Path, mode: str) -> None:
+    if mode == "symlink":
+        target.symlink_to(os.path.relpath(source, target.parent))
+    else:
+        os.link(source, target)
+
+
+def write_split(dataset_path: Path, splits: dict[str, list[Path]], mode: str = "index") -> dict[str, str]:
+    """
+    Writes the split membership, replacing the previous one.
+
+    Args:
+        mode (str): "index" (train.txt, valid.txt, test.txt), "symlink" or "hardlink" (splits/<split>/images and labels).
+
+    Returns:
+        the path of each split to put in yolo.yaml, relative to the dataset directory.
+    """
+    if mode not in SPLIT_MODES:
+        raise ValueError(f"mode must be one of {SPLIT_MODES}, got {mode}")
+    dataset_path = Path(dataset_path)
+    links_path = dataset_path / LINKS_DIR
+    if links_path.exists():
+        shutil.rmtree(links_path)  # Only links, the images they point to are kept
+
+    yaml_paths = {}
+    for split, images in splits.items():
+        if mode == "index":
+            lines = [f"./{image.relative_to(dataset_path).as_posix()}\n" for image in images]
+            _write_atomic(dataset_path / f"{split}.txt", "".join(lines))
+            yaml_paths[split] = f"./{split}.txt"
+            continue
+
+        (dataset_path / f"{split}.txt").unlink(missing_ok=True)
+        images_path = links_path / split / "images"
+        labels_path = links_path / split / "labels"
+        images_path.mkdir(parents=True)
+        labels_path.mkdir(parents=True)
+        for image in images:
+            _link(image, images_path / image.name, mode)
+            label = label_path(image)
+            if label.exists():
+                _link(label, labels_path / label.name, mode)
+        yaml_paths[split] = f"./{LINKS_DIR}/{split}/images"
+    return yaml_paths
+
+
+def read_split(dataset_path: Path, yaml_path: str) -> list[Path]:
+    """Images of a split, from its path in yolo.yaml (index file or directory)"""
+    path = Path(dataset_path) / yaml_path
+    if path.suffix == ".txt":
+        return [Path(dataset_path) / line.strip() for line in path.read_text().splitlines() if line.strip()]
+    return sorted(p for p in path.iterdir() if p.suffix.lower() in IMAGE_FORMATS)
+
+
+def index_split_dataset(
+    dataset_path: Path,
+    train_ratio: float,
+    valid_ratio: float,
+    seed: int = 42,
+    stratify: bool = False,
+    mode: str = "index",
+) -> dict[str, str]:
+    """Splits the images of dataset_path without moving them, see the module docstring"""
+    dataset_path = Path(dataset_path)
+    images = list_images(dataset_path)
+    store = LabelStore.build(images, dataset_path) if stratify else None
+    splits = assign_splits(images, train_ratio, valid_ratio, seed=seed, stratify=stratify, store=store)
+    return write_split(dataset_path, splits, mode=mode)
@@ -0,0 +1,188 @@
+"""
+Dataset statistics and drift between dataset versions.
+
+The statistics of a split are computed in a single pass over its label store (see src/label_store.py): images are
+read by chunks, with the memory-mapped boxes of the chunk and the headers of its images (not decoded), and added to
+fixed-bin histograms. The memory does not depend on the size of the dataset, and the histograms of two versions of the
+dataset have the same bins, so they can be compared directly:
+
+- classes: boxes per class
+- boxes_per_image: 0, 1, ..., 29, 30 and more
+- box_size: sqrt(w * h) of the normalized boxes, log-spaced from 1/256 to 1
+- box_aspect: log2(w / h) of the boxes, from -4 to 4
+- resolution: longest side of the images in pixels
+- image_aspect: width / height of the images
+
+The first and last bins are open-ended. The drift between two versions is measured per histogram with the population
+stability index (PSI): under 0.1 the distributions are about the same, above 0.25 they changed significantly.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+STATS_NAME = "dataset_stats.json"
+CHUNK_SIZE = 4096  # images per chunk
+MODERATE_DRIFT = 0.1
+LARGE_DRIFT = 0.25
+EDGES = {
+    "boxes_per_image": np.arange(0, 31),
+    "box_size": np.geomspace(1 / 256, 1, 17),
+    "box_aspect": np.linspace(-4, 4, 17),
+    "resolution": np.array([0, 320, 480, 640, 800, 960, 1280, 1600, 1920, 2560, 3200, 3840, 5120]),
+    "image_aspect": np.array([0, 0.5, 0.75, 0.9, 1.1, 1.25, 1.4, 1.6, 1.9, 2.5]),
+}
+
+
+def bin_counts(values: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """Histogram of values, the values below the first edge and above the last one in the first and last bins"""
+    bins = np.clip(np.searchsorted(edges, values, side="right") - 1, 0, len(edges) - 2)
+    return np.bincount(bins, minlength=len(edges) - 1)
+
+
+class StatsAccumulator:
+    """Statistics of a split, updated chunk by chunk"""
+
+    def __init__(self, nc: int | None = None) -> None:
+        self.classes = np.zeros(nc or 0, dtype=np.int64)
+        self.histograms = {name: np.zeros(len(edges) - 1, dtype=np.int64) for name, edges in EDGES.items()}
+        self.images = 0
+        self.labelled = 0
+        self.boxes = 0
+        self.unreadable_images = 0
+        self.box_sums = np.zeros(5)  # number of boxes with a size, sum of w, h, w², h²
+
+    def add_boxes(self, rows: np.ndarray, boxes_per_image: np.ndarray, labelled: int) -> None:
+        """
+        Args:
+            rows (np.ndarray): (n, 5) class, x, y, w, h of the boxes of the chunk.
+            boxes_per_image (np.ndarray): Number of boxes of each image of the chunk.
+            labelled (int): Images of the chunk with a label file.
+        """
+        self.images += len(boxes_per_image)
+        self.labelled += labelled
+        self.boxes += len(rows)
+        self.histograms["boxes_per_image"] += bin_counts(boxes_per_image, EDGES["boxes_per_image"])
+
+        cls = rows[:, 0]
+        valid = (cls >= 0) & (cls == np.floor(cls))
+        counts = np.bincount(cls[valid].astype(np.int64), minlength=len(self.classes))
+        if len(counts) > len(self.classes):
+            self.classes = np.pad(self.classes, (0, len(counts) - len(self.classes)))
+        self.classes += counts
+
+        w, h = rows[:, 3].astype(np.float64), rows[:, 4].astype(np.float64)
+        positive = (w > 0) & (h > 0)
+        w, h = w[positive], h[positive]
+        self.histograms["box_size"] += bin_counts(np.sqrt(w * h), EDGES["box_size"])
+        self.histograms["box_aspect"] += bin_counts(np.log2(w / h), EDGES["box_aspect"])
+        self.box_sums += [len(w), w.sum(), h.sum(), (w**2).sum(), (h**2).sum()]
+
+    def add_image_sizes(self, sizes: np.ndarray) -> None:
+        """(n, 2) width and height of the readable images of the chunk"""
+        if not len(sizes):
+            return
+        self.histograms["resolution"] += bin_counts(sizes.max(axis=1), EDGES["resolution"])
+        self.histograms["image_aspect"] += bin_counts(sizes[:, 0] / sizes[:, 1], EDGES["image_aspect"])
+
+    def to_dict(self) -> dict:
+        n, sum_w, sum_h, sum_w2, sum_h2 = self.box_sums
+        n = max(n, 1)
+        mean_w, mean_h = sum_w / n, sum_h / n
+        return {
+            "images": self.images,
+            "labelled": self.labelled,
+            "boxes": self.boxes,
+            "unreadable_images": self.unreadable_images,
+            "boxes_per_image": self.boxes / max(self.images, 1),
+            "box_width": {"mean": float(mean_w), "std": float(np.sqrt(max(sum_w2 / n - mean_w**2, 0)))},
+            "box_height": {"mean": float(mean_h), "std": float(np.sqrt(max(sum_h2 / n - mean_h**2, 0)))},
+            "histograms": {
+                "classes": {"counts": self.classes.tolist()},
+                **{
+                    name: {"edges": EDGES[name].tolist(), "counts": counts.tolist()}
+                    for name, counts in self.histograms.items()
+                },
+            },
+        }
+
+
+def image_size(path: Path) -> tuple[int, int] | None:
+    """(width, height) read from the header of the image, None if it cannot be opened"""
+    try:
+        with Image.open(path) as image:
+            return image.size
+    except (OSError, SyntaxError, ValueError, ImportError):
+        return None
+
+
+def compute_split_stats(store, nc: int | None = None, chunk_size: int = CHUNK_SIZE) -> dict:
+    """
+    Statistics of a split, in a single pass over its label store by chunks of images.
+
+    Args:
+        store (LabelStore): Labels of the split, see src/label_store.py.
+        nc (int): Number of classes, the classes histogram is as long as the largest class id otherwise.
+    """
+    stats = StatsAccumulator(nc)
+    offsets, labelled = np.asarray(store.offsets), store.labelled
+    for start in range(0, len(store), chunk_size):
+        stop = min(start + chunk_size, len(store))
+        rows = np.asarray(store.rows[offsets[start] : offsets[stop]])
+        stats.add_boxes(rows, np.diff(offsets[start : stop + 1]), int(labelled[start:stop].sum()))
+        sizes = [image_size(store.image_path(i)) for i in range(start, stop)]
+        stats.unreadable_images += sizes.count(None)
+        stats.add_image_sizes(np.array([size for size in sizes if size is not None], dtype=np.float64).reshape(-1, 2))
+    return stats.to_dict()
+
+
+def compute_dataset_stats(stores: dict, nc: int | None = None) -> dict:
+    """Statistics of each split (label stores, None for the missing splits)"""
+    return {"splits": {split: compute_split_stats(store, nc) for split, store in stores.items() if store is not None}}
+
+
+def save_stats(stats: dict, path: str | Path) -> None:
+    Path(path).write_text(json.dumps(stats, separators=(",", ":")))
+
+
+def load_stats(path: str | Path) -> dict:
+    return json.loads(Path(path).read_text())
+
+
+def population_stability_index(reference: list[int], current: list[int], eps: float = 1e-4) -> float:
+    """PSI of two histograms with the same bins (the shorter one padded with empty bins)"""
+    size = max(len(reference), len(current))
+    p = np.pad(np.asarray(reference, dtype=np.float64), (0, size - len(reference)))
+    q = np.pad(np.asarray(current, dtype=np.float64), (0, size - len(current)))
+    if not p.sum() or not q.sum():
+        return 0.0
+    p = np.maximum(p / p.sum(), eps)
+    q = np.maximum(q / q.sum(), eps)
+    return float(np.sum((q - p) * np.log(q / p)))
+
+
+def compare_stats(current: dict, reference: dict) -> dict:
+    """
+    Drift of each histogram of each split between two versions of the dataset.
+
+    Returns:
+        {"level": the highest level, "features": [{"split", "feature", "psi", "level"}]}, levels being "none",
+        "moderate" (PSI >= 0.1) and "large" (PSI >= 0.25). Histograms with different bins are not compared.
+    """
+    levels = ["none", "moderate", "large"]
+    features = []
+    for split, stats in current["splits"].items():
+        reference_split = reference["splits"].get(split)
+        if reference_split is None:
+            continue
+        for name, histogram in stats["histograms"].items():
+            reference_histogram = reference_split["histograms"].get(name)
+            if reference_histogram is None or reference_histogram.get("edges") != histogram.get("edges"):
+                continue
+            psi = population_stability_index(reference_histogram["counts"], histogram["counts"])
+            level = "large" if psi >= LARGE_DRIFT else "moderate" if psi >= MODERATE_DRIFT else "none"
+            features.append({"split": split, "feature": name, "psi": round(psi, 4), "level": level})
+    level = max((feature["level"] for feature in features), key=levels.index, default="none")
+    return {"level": level, "features": features}
@@ -0,0 +1,190 @@
+"""
+Incremental sync of the dataset directory with its source.
+
+Instead of downloading, extracting and splitting everything again, the sync compares the remote listing with the
+manifest of the download manager: new or changed assets are downloaded and put in their split, deleted ones are
+removed with their label, and only the labels whose content changed in the annotation export are written (compared
+with the CRC32 stored in the zip directory, so unchanged labels are not even decompressed). The split of an image is
+derived from a hash of its name: existing images never move and new ones follow the split ratios.
+
+The work is proportional to the size of the change, apart from listing the remote and local files.
+"""
+
+import hashlib
+import os
+import time
+import zipfile
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from rich.console import Console
+
+from src.download_manager import DatasetClient, DownloadManager, Manifest, RemoteFile, file_sha256
+
+SPLITS = ("train", "valid", "test")
+
+console = Console()
+
+
+@dataclass
+class SyncReport:
+    added: int = 0
+    updated: int = 0
+    removed: int = 0
+    labels_written: int = 0
+    labels_removed: int = 0
+    seconds: float = 0.0
+    failed: dict[str, str] = field(default_factory=dict)
+
+
+def assign_split(name: str, train_ratio: float, valid_ratio: float, seed: int = 42) -> str:
+    """Split of an image, a deterministic function of its name"""
+    digest = hashlib.blake2b(f"{seed}:{name}".encode(), digest_size=8).digest()
+    u = int.from_bytes(digest, "big") / 2**64
+    if u < train_ratio:
+        return "train"
+    if u < train_ratio + valid_ratio:
+        return "valid"
+    return "test"
+
+
+def _label_path(dataset_path: Path, entry: dict, name: str) -> Path:
+    return dataset_path / entry["split"] / "labels" / f"{Path(name).stem}.txt"
+
+
+def _remove_asset(dataset_path: Path, manifest: Manifest, name: str) -> None:
+    entry = manifest.get(name)
+    (dataset_path / manifest.local_path(name)).unlink(missing_ok=True)
+    if "split" in entry:
+        _label_path(dataset_path, entry, name).unlink(missing_ok=True)
+    manifest.remove(name)
+
+
+def _adopt_existing(dataset_path: Path, manifest: Manifest, files: list[RemoteFile]) -> int:
+    """
+    Records in the manifest the images already split by split_dataset (before the sync existed), in their current
+    split, so they are not downloaded again.
+    """
+    local = {}
+    for split in SPLITS:
+        images_path = dataset_path / split / "images"
+        if images_path.exists():
+            local.update({entry.name: (split, entry) for entry in os.scandir(images_path) if entry.is_file()})
+
+    adopted = 0
+    for file in files:
+        entry = manifest.get(file.name)
+        if (entry is not None and "split" in entry) or file.name not in local:
+            continue
+        split, dir_entry = local[file.name]
+        size = dir_entry.stat().st_size
+        sha256 = entry["sha256"] if entry is not None and entry["size"] == size else file_sha256(dir_entry.path)
+        manifest.add(
+            file.name,
+            {"key": file.key, "size": size, "sha256": sha256, "path": f"{split}/images/{file.name}", "split": split},
+        )
+        adopted += 1
+    return adopted
+
+
+def sync_labels(dataset_path: Path, manifest: Manifest, annotation_file: str | Path) -> tuple[int, int]:
+    """
+    Writes the labels of the YOLO annotation export that changed, removes the ones that are no longer annotated.
+
+    Returns:
+        the number of labels written and removed.
+    """
+    by_stem = {Path(name).stem: name for name, entry in manifest.files.items() if "split" in entry}
+    written = 0
+    annotated = set()
+    with zipfile.ZipFile(annotation_file) as zip_file:
+        for info in zip_file.infolist():
+            if info.is_dir() or not info.filename.endswith(".txt"):
+                continue
+            name = by_stem.get(Path(info.filename).stem)
+            if name is None:
+                continue  # Not an image of the dataset (e.g. classes.txt)
+            annotated.add(name)
+            entry = manifest.get(name)
+            label_path = _label_path(dataset_path, entry, name)
+            if entry.get("label_crc") == info.CRC and label_path.exists():
+                continue
+            label_path.parent.mkdir(parents=True, exist_ok=True)
+            label_path.write_bytes(zip_file.read(info))
+            manifest.update(name, label_crc=info.CRC)
+            written += 1
+
+    removed = 0
+    for name, entry in manifest.files.items():
+        if name not in annotated and "label_crc" in entry:
+            _label_path(dataset_path, entry, name).unlink(missing_ok=True)
+            del entry["label_crc"]
+            removed += 1
+    return written, removed
+
+
+def sync_dataset(
+    client: DatasetClient,
+    dataset_path: Path,
+    annotation_file: str | Path | None = None,
+    train_ratio: float = 0.6,
+    valid_ratio: float = 0.2,
+    seed: int = 42,
+    max_workers: int = 8,
+) -> SyncReport:
+    """
+    Brings the split dataset directory up to date with the client.
+
+    Args:
+        client (DatasetClient): Source of the images.
+        dataset_path (Path): Dataset directory, with the train, valid and test splits.
+        annotation_file (str, Path): YOLO annotation export (zip), labels are left as is if not given.
+        train_ratio (float), valid_ratio (float): Split ratios of the new images, the rest goes to test.
+        seed (int): Seed of the split assignment.
+        max_workers (int): Images downloaded concurrently.
+    """
+    start = time.perf_counter()
+    dataset_path = Path(dataset_path)
+    manager = DownloadManager(client, dataset_path, max_workers=max_workers)
+    manifest = manager.manifest
+    report = SyncReport()
+
+    files = client.list_files()
+    remote_names = {file.name for file in files}
+    for name in [name for name in manifest.files if name not in remote_names]:
+        _remove_asset(dataset_path, manifest, name)
+        report.removed += 1
+
+    adopted = _adopt_existing(dataset_path, manifest, files)
+    if adopted:
+        console.log(f"[blue]{adopted} images already split, kept in their split[/]")
+
+    previous = {name: dict(entry) for name, entry in manifest.files.items()}
+    download_report = manager.download(files)
+    report.failed = download_report.failed
+    for name in download_report.files:
+        # A changed image stays in its split, with its label
+        kept = {key: previous[name][key] for key in ("split", "label_crc") if key in previous.get(name, {})}
+        split = kept.setdefault("split", assign_split(name, train_ratio, valid_ratio, seed))
+        relative_path = f"{split}/images/{name}"
+        (dataset_path / split / "images").mkdir(parents=True, exist_ok=True)
+        os.replace(dataset_path / name, dataset_path / relative_path)
+        manifest.update(name, path=relative_path, **kept)
+        if name in previous and "split" in previous[name]:
+            report.updated += 1
+        else:
+            report.added += 1
+
+    if annotation_file is not None:
+        report.labels_written, report.labels_removed = sync_labels(dataset_path, manifest, annotation_file)
+    for split in SPLITS:
+        (dataset_path / split / "images").mkdir(parents=True, exist_ok=True)
+        (dataset_path / split / "labels").mkdir(parents=True, exist_ok=True)
+    manifest.save()
+
+    report.seconds = time.perf_counter() - start
+    console.log(
+        f"[green]Dataset synced in {report.seconds:.1f}s: {report.added} added, {report.updated} updated, "
+        f"{report.removed} removed, {report.labels_written} labels written, {report.labels_removed} labels removed[/]"
+    )
+    return report
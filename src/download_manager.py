@@ -0,0 +1,331 @@
+"""
+Resumable, parallel and verified download of a dataset.
+
+The files are listed by a DatasetClient (the Picsellia dataset version, or a local directory standing in for it)
+and fetched by a pool of threads sharing a bounded connection pool. Each file is written to <name>.part, resumed from
+where it stopped after an interruption, verified (size, and checksum when the client knows it) and only then renamed.
+A manifest (.manifest.json in the dataset directory) records the key, size and sha256 of every complete file (and
+where it was moved to, if it was), so a new run only fetches the missing or corrupt ones.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, Protocol
+
+from rich.console import Console
+from rich.progress import BarColumn, MofNCompleteColumn, Progress, TextColumn
+
+MANIFEST_NAME = ".manifest.json"
+PART_SUFFIX = ".part"
+CHUNK_SIZE = 1024 * 1024
+
+console = Console()
+
+
+class ChecksumError(Exception):
+    """Raised when a downloaded file does not match the expected size or checksum"""
+
+
+@dataclass
+class RemoteFile:
+    name: str  # file name in the dataset directory
+    key: str  # identifies the remote content (e.g. the Picsellia object name), a new key means a new content
+    size: int | None = None
+    sha256: str | None = None
+
+
+class DatasetClient(Protocol):
+    def list_files(self) -> list[RemoteFile]:
+        """Files of the dataset"""
+        ...
+
+    def open(self, file: RemoteFile, offset: int = 0) -> tuple[int, Iterable[bytes]]:
+        """
+        Chunks of the file starting at offset.
+
+        Returns:
+            the offset the chunks actually start from (0 if the source cannot resume), and the chunks.
+        """
+        ...
+
+
+class LocalDatasetClient:
+    """Dataset served from a local directory, e.g. a mirror of the dataset or a stand-in for Picsellia in the tests"""
+
+    def __init__(self, root: str | Path, checksums: bool = True) -> None:
+        self.root = Path(root)
+        self.checksums = checksums
+
+    def list_files(self) -> list[RemoteFile]:
+        files = []
+        for path in sorted(p for p in self.root.iterdir() if p.is_file()):
+            stat = path.stat()
+            files.append(
+                RemoteFile(
+                    name=path.name,
+                    key=f"{path.name}:{stat.st_size}:{stat.st_mtime_ns}",
+                    size=stat.st_size,
+                    sha256=file_sha256(path) if self.checksums else None,
+                )
+            )
+        return files
+
+    def open(self, file: RemoteFile, offset: int = 0) -> tuple[int, Iterable[bytes]]:
+        def chunks():
+            with open(self.root / file.name, "rb") as f:
+                f.seek(offset)
+                while chunk := f.read(CHUNK_SIZE):
+                    yield chunk
+
+        return offset, chunks()
+
+
+class PicselliaDatasetClient:
+    """Assets of a Picsellia dataset version, fetched from their presigned URLs with HTTP range requests"""
+
+    def __init__(self, dataset_version, max_connections: int = 8, timeout: float = 60) -> None:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.dataset_version = dataset_version
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._assets = {}
+
+    def list_files(self) -> list[RemoteFile]:
+        self._assets = {asset.filename: asset for asset in self.dataset_version.list_assets()}
+        # The object name changes when the content of the data changes, the size is only known once downloading
+        return [RemoteFile(name=name, key=str(asset.object_name)) for name, asset in self._assets.items()]
+
+    def open(self, file: RemoteFile, offset: int = 0) -> tuple[int, Iterable[bytes]]:
+        asset = self._assets[file.name]
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        response = self.session.get(asset.url, headers=headers, stream=True, timeout=self.timeout)
+        if response.status_code == 403:  # Presigned URL expired (after 1 hour)
+            response.close()
+            response = self.session.get(asset.reset_url(), headers=headers, stream=True, timeout=self.timeout)
+        if offset and response.status_code == 416:
+            # Range not satisfiable: the .part already holds the whole file, or more if corrupt. The total size (if the
+            # server gives it) lets the download check the .part, which is restarted from 0 when it does not match
+            response.close()
+            total = response.headers.get("Content-Range", "").rpartition("/")[2]
+            if file.size is None and total.isdigit():
+                file.size = int(total)
+            return offset, iter(())
+        response.raise_for_status()
+
+        if offset and response.status_code != 206:
+            offset = 0  # Range ignored, the whole file is sent again
+        if file.size is None and "Content-Length" in response.headers:
+            file.size = offset + int(response.headers["Content-Length"])
+
+        def chunks():
+            with response:
+                yield from response.iter_content(CHUNK_SIZE)
+
+        return offset, chunks()
+
+
+def file_sha256(path: str | Path) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class Manifest:
+    """
+    Complete files of a dataset directory, saved atomically:
+    {name: {"key", "size", "sha256", ["path": relative path if moved, e.g. train/images/<name>], ...}}
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        data = json.loads(self.path.read_text()) if self.path.exists() else {}
+        self.files: dict[str, dict] = data.get("files", {})
+        self.complete: bool = data.get("complete", False)
+
+    def get(self, name: str) -> dict | None:
+        return self.files.get(name)
+
+    def local_path(self, name: str) -> str:
+        """Path of the file relative to the dataset directory"""
+        entry = self.files.get(name)
+        return entry.get("path", name) if entry is not None else name
+
+    def add(self, name: str, entry: dict) -> None:
+        with self._lock:
+            self.files[name] = entry
+
+    def update(self, name: str, **fields) -> None:
+        with self._lock:
+            self.files[name].update(fields)
+
+    def remove(self, name: str) -> None:
+        with self._lock:
+            self.files.pop(name, None)
+            self.complete = False
+
+    def save(self) -> None:
+        with self._lock:
+            data = json.dumps({"complete": self.complete, "files": self.files}, indent=1, sort_keys=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        tmp_path.write_text(data)
+        os.replace(tmp_path, self.path)
+
+
+@dataclass
+class DownloadReport:
+    downloaded: int = 0
+    skipped: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+    files: list[str] = field(default_factory=list)  # names of the downloaded files
+    failed: dict[str, str] = field(default_factory=dict)
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes / self.seconds if self.seconds > 0 else 0.0
+
+
+class DownloadManager:
+    def __init__(
+        self,
+        client: DatasetClient,
+        target_dir: str | Path,
+        max_workers: int = 8,
+        retries: int = 3,
+        verify: bool = False,
+        save_every: float = 5.0,
+    ) -> None:
+        """
+        Args:
+            client (DatasetClient): Source of the files.
+            target_dir (str, Path): Dataset directory, holding the manifest.
+            max_workers (int): Files downloaded concurrently (the Picsellia client should get as many connections).
+            retries (int): Attempts per file, an interrupted attempt is resumed by the next one.
+            verify (bool): Re-hash the files already listed in the manifest instead of only checking their size.
+            save_every (float): Seconds between manifest saves while downloading.
+        """
+        self.client = client
+        self.target_dir = Path(target_dir)
+        self.max_workers = max_workers
+        self.retries = retries
+        self.verify = verify
+        self.save_every = save_every
+        self.manifest = Manifest(self.target_dir / MANIFEST_NAME)
+        self._bytes = 0
+        self._bytes_lock = threading.Lock()
+
+    def is_complete(self, file: RemoteFile) -> bool:
+        """Whether the local copy of the file is in the manifest, up to date and intact"""
+        entry = self.manifest.get(file.name)
+        path = self.target_dir / self.manifest.local_path(file.name)
+        if entry is None or entry["key"] != file.key or not path.exists():
+            return False
+        if path.stat().st_size != entry["size"] or (file.size is not None and file.size != entry["size"]):
+            return False
+        if file.sha256 is not None and file.sha256 != entry["sha256"]:
+            return False
+        return not self.verify or file_sha256(path) == entry["sha256"]
+
+    def plan(self, files: list[RemoteFile]) -> list[RemoteFile]:
+        """Files to download: missing, changed or corrupt"""
+        return [file for file in files if not self.is_complete(file)]
+
+    def download(self, files: list[RemoteFile] | None = None) -> DownloadReport:
+        """
+        Downloads the files that are not complete yet (to the dataset directory).
+
+        Args:
+            files (list[RemoteFile]): Every file of the dataset, listed by the client if not given.
+        """
+        self.target_dir.mkdir(parents=True, exist_ok=True)
+        files = self.client.list_files() if files is None else files
+        todo = self.plan(files)
+        report = DownloadReport(skipped=len(files) - len(todo))
+        console.log(f"{len(todo)} files to download, {report.skipped} already complete")
+
+        start = time.perf_counter()
+        last_save = start
+        columns = (TextColumn("Downloading"), BarColumn(), MofNCompleteColumn(), TextColumn("{task.fields[speed]}"))
+        with Progress(*columns, console=console, transient=True) as progress:
+            task = progress.add_task("download", total=len(todo), speed="")
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="download") as executor:
+                futures = {executor.submit(self._download_file, file): file for file in todo}
+                for future in as_completed(futures):
+                    file = futures[future]
+                    try:
+                        self.manifest.add(file.name, future.result())
+                        report.downloaded += 1
+                        report.files.append(file.name)
+                    except Exception as e:
+                        report.failed[file.name] = f"{type(e).__name__}: {e}"
+                    speed = self._bytes / (time.perf_counter() - start) / 1e6
+                    progress.update(task, advance=1, speed=f"{speed:.2f} MB/s")
+                    if time.perf_counter() - last_save > self.save_every:
+                        self.manifest.save()
+                        last_save = time.perf_counter()
+
+        report.seconds = time.perf_counter() - start
+        report.bytes = self._bytes
+        self.manifest.complete = not report.failed
+        self.manifest.save()
+
+        console.log(
+            f"Downloaded {report.downloaded} files ({report.bytes / 1e6:.1f} MB) in {report.seconds:.1f}s, "
+            f"{report.bytes_per_second / 1e6:.2f} MB/s"
+        )
+        if report.failed:
+            console.log(f"[red]{len(report.failed)} files failed to download, run again to resume them[/]")
+        return report
+
+    def _count(self, n: int) -> None:
+        with self._bytes_lock:
+            self._bytes += n
+
+    def _download_file(self, file: RemoteFile) -> dict:
+        """Downloads one file to its .part, resuming it if possible, verifies it and renames it. Runs in a worker thread."""
+        path = self.target_dir / file.name
+        part_path = path.with_name(path.name + PART_SUFFIX)
+        for attempt in range(1, self.retries + 1):
+            offset = part_path.stat().st_size if part_path.exists() else 0
+            if file.size is not None and offset > file.size:
+                offset = 0
+            try:
+                offset, chunks = self.client.open(file, offset)
+                hasher = hashlib.sha256()
+                if offset:
+                    with open(part_path, "rb") as f:
+                        while f.tell() < offset:
+                            hasher.update(f.read(min(CHUNK_SIZE, offset - f.tell())))
+                with open(part_path, "r+b" if offset else "wb") as f:
+                    f.seek(offset)
+                    f.truncate()
+                    for chunk in chunks:
+                        f.write(chunk)
+                        hasher.update(chunk)
+                        self._count(len(chunk))
+
+                size = part_path.stat().st_size
+                sha256 = hasher.hexdigest()
+                if (file.size is not None and size != file.size) or (file.sha256 is not None and sha256 != file.sha256):
+                    part_path.unlink()
+                    raise ChecksumError(f"{file.name}: got {size} bytes with sha256 {sha256}")
+                os.replace(part_path, path)
+                return {"key": file.key, "size": size, "sha256": sha256}
+            except Exception:
+                # The .part is kept (unless corrupt) so the next attempt resumes it
+                if attempt == self.retries:
+                    raise
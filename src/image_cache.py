@@ -0,0 +1,308 @@
+"""
+Pre-resized image cache for training.
+
+Every image of the splits is decoded once by a process pool, which verifies that it is readable, computes its content
+hash (sha256) and its perceptual hash (64 bits difference hash of the 9x8 grayscale thumbnail), and writes a copy
+resized to the training image size (longest side) in image_cache/<imgsz>/objects/<sha256>.jpg. The copies are keyed
+by content, so they are reused by every training run and a modified image gets a new one. image_cache/index.json
+keeps the hash of each image with its mtime and size: unchanged images are not even read on the next runs.
+
+Images with the same content (exact duplicates) or whose perceptual hashes differ by a few bits (near-duplicates:
+re-encoded, resized or slightly edited copies) are grouped. The first image of each group is kept in the first split
+(train, then valid, then test) and its copies in the other splits are dropped, so the same picture cannot be trained
+on and evaluated. Within a split, only exact duplicates are dropped. Unreadable images are dropped too.
+
+The kept images are hardlinked (copied on filesystems without hardlinks) with their labels into
+image_cache/<imgsz>/<split>/images and labels, the split folders to put in yolo.yaml. The links are named after the
+images (<stem>.jpg), two images of a split with the same stem are refused.
+"""
+
+import hashlib
+import io
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from src.label_store import label_path
+
+CACHE_DIR = "image_cache"  # in the dataset directory
+INDEX_NAME = "index.json"
+JPEG_QUALITY = 95
+MIN_FILES_FOR_POOL = 64  # below, the pool startup costs more than it saves
+MAX_BUCKET_NEIGHBOURS = 256  # near-duplicate candidates compared per image and band (uniform images share hashes)
+
+
+def difference_hash(image: Image.Image) -> int:
+    """64 bits perceptual hash: whether each pixel of the 9x8 grayscale thumbnail is brighter than its right neighbour"""
+    pixels = np.asarray(image.convert("L").resize((9, 8), Image.Resampling.BILINEAR), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def process_image(path: str, imgsz: int, objects_dir: str) -> dict:
+    """
+    Decodes an image and writes its resized copy to objects_dir, unless a copy of the same content is already there.
+
+    Returns:
+        {"sha256", "ok", "phash", "size": original (width, height)}, or {"sha256", "ok": False, "error"}
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    sha256 = hashlib.sha256(data).hexdigest()
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            size = image.size
+            scale = imgsz / max(size)
+            if scale < 1:
+                # Decoded directly at a reduced scale by the JPEG decoder (still reading the whole file)
+                image.draft("RGB", (round(size[0] * scale), round(size[1] * scale)))
+            image = ImageOps.exif_transpose(image).convert("RGB")  # Oriented like cv2.imread does for Ultralytics
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError, ImportError) as e:
+        # ImportError: once imported, Ultralytics retries the images PIL cannot open with the HEIF plugin (pi-heif)
+        return {"sha256": sha256, "ok": False, "error": f"{type(e).__name__}: {e}"}
+
+    phash = difference_hash(image)
+    object_path = Path(objects_dir) / f"{sha256}.jpg"
+    if not object_path.exists():
+        image.thumbnail((imgsz, imgsz), Image.Resampling.BILINEAR)  # Only shrinks, keeps the aspect ratio
+        tmp_path = object_path.with_name(f"{object_path.name}.{os.getpid()}.tmp")
+        image.save(tmp_path, "JPEG", quality=JPEG_QUALITY)
+        os.replace(tmp_path, object_path)
+    return {"sha256": sha256, "ok": True, "phash": phash, "size": list(size)}
+
+
+def _process(args: tuple[str, int, str]) -> dict:
+    return process_image(*args)
+
+
+def popcount(values: np.ndarray) -> np.ndarray:
+    """Number of set bits of each uint64 (np.bitwise_count needs numpy 2)"""
+    values = np.asarray(values, dtype=np.uint64)
+    bits = np.unpackbits(values.reshape(-1, 1).view(np.uint8), axis=1)
+    return bits.sum(axis=1).reshape(values.shape)
+
+
+def near_duplicate_pairs(hashes: np.ndarray, max_distance: int) -> np.ndarray:
+    """
+    Pairs (i, j), i < j, of hashes differing by at most max_distance bits.
+
+    The 64 bits are cut into max_distance + 1 bands: two hashes that close have at least one identical band, so only
+    the hashes sharing a band are compared (neighbours after sorting by the band), instead of all the pairs.
+    """
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    bands = max_distance + 1
+    bounds = np.linspace(0, 64, bands + 1).astype(int)
+    pairs = []
+    for low, high in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+        keys = (hashes >> np.uint64(low)) & np.uint64((1 << (high - low)) - 1)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        for shift in range(1, min(len(hashes), MAX_BUCKET_NEIGHBOURS + 1)):
+            same = np.flatnonzero(sorted_keys[shift:] == sorted_keys[:-shift])
+            if not len(same):
+                break
+            i, j = order[same], order[same + shift]
+            close = popcount(hashes[i] ^ hashes[j]) <= max_distance
+            pairs.append(np.column_stack([np.minimum(i, j), np.maximum(i, j)])[close])
+    if not pairs:
+        return np.zeros((0, 2), dtype=np.int64)
+    return np.unique(np.concatenate(pairs), axis=0)
+
+
+def _find(parents: list[int], i: int) -> int:
+    while parents[i] != i:
+        parents[i] = parents[parents[i]]
+        i = parents[i]
+    return i
+
+
+@dataclass
+class ImageCacheReport:
+    images: int = 0
+    processed: int = 0  # images decoded, the others were unchanged since the previous run
+    unreadable: dict[str, str] = field(default_factory=dict)  # image: error
+    duplicates: list[dict] = field(default_factory=list)  # dropped image, kept image, their splits and distance
+    leaked: int = 0  # duplicates dropped from valid or test because they are in an earlier split
+    kept: dict[str, int] = field(default_factory=dict)  # split: images in the cache
+    seconds: float = 0.0
+
+    def save(self, path: str | Path) -> None:
+        Path(path).write_text(json.dumps(asdict(self), indent=2))
+
+
+class ImageCache:
+    def __init__(self, dataset_path: str | Path, imgsz: int = 640, workers: int | None = None, max_distance: int = 4):
+        """
+        Args:
+            dataset_path (str, Path): Dataset directory, the cache is in its image_cache folder.
+            imgsz (int): Training image size, longest side of the cached images.
+            workers (int): Processes decoding the images, os.cpu_count() by default.
+            max_distance (int): Bits of difference between the perceptual hashes of near-duplicates, -1 to only drop
+                exact duplicates.
+        """
+        self.dataset_path = Path(dataset_path)
+        self.imgsz = imgsz
+        self.workers = workers or os.cpu_count() or 1
+        self.max_distance = max_distance
+        self.root = self.dataset_path / CACHE_DIR
+        self.size_dir = self.root / str(imgsz)
+        self.objects_dir = self.size_dir / "objects"
+        self.index_path = self.root / INDEX_NAME
+
+    def _load_index(self) -> dict:
+        if self.index_path.exists():
+            return json.loads(self.index_path.read_text())
+        return {"paths": {}, "images": {}}
+
+    def _save_index(self, index: dict) -> None:
+        tmp_path = self.index_path.with_name(self.index_path.name + ".tmp")
+        tmp_path.write_text(json.dumps(index))
+        os.replace(tmp_path, self.index_path)
+
+    def scan(self, images: list[Path], report: ImageCacheReport) -> list[dict]:
+        """Record of each image (see process_image), decoding only the new or modified ones"""
+        index = self._load_index()
+        paths, records = index["paths"], index["images"]
+        keys = [image.relative_to(self.dataset_path).as_posix() for image in images]
+        stats = [os.stat(image) for image in images]
+
+        stale = []
+        for i, (key, stat) in enumerate(zip(keys, stats)):
+            entry = paths.get(key)
+            record = records.get(entry["sha256"]) if entry is not None else None
+            unchanged = entry is not None and (entry["mtime_ns"], entry["size"]) == (stat.st_mtime_ns, stat.st_size)
+            cached = record is not None and (not record["ok"] or (self.objects_dir / f"{entry['sha256']}.jpg").exists())
+            if not (unchanged and cached):
+                stale.append(i)
+
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        tasks = [(os.fspath(images[i]), self.imgsz, os.fspath(self.objects_dir)) for i in stale]
+        if len(tasks) >= MIN_FILES_FOR_POOL and self.workers > 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                results = list(executor.map(_process, tasks, chunksize=16))
+        else:
+            results = [_process(task) for task in tasks]
+        for i, result in zip(stale, results):
+            sha256 = result.pop("sha256")
+            records[sha256] = result
+            paths[keys[i]] = {"mtime_ns": stats[i].st_mtime_ns, "size": stats[i].st_size, "sha256": sha256}
+        report.processed = len(stale)
+
+        # Forget the images that are gone, and their cached copies
+        paths = {key: paths[key] for key in keys}
+        used = {entry["sha256"] for entry in paths.values()}
+        records = {sha256: record for sha256, record in records.items() if sha256 in used}
+        for object_path in self.objects_dir.iterdir():
+            if object_path.stem not in used:
+                object_path.unlink()
+        self._save_index({"paths": paths, "images": records})
+        return [{"sha256": paths[key]["sha256"], **records[paths[key]["sha256"]]} for key in keys]
+
+    def build(self, splits: dict[str, list[Path]]) -> tuple[dict[str, str], ImageCacheReport]:
+        """
+        Caches the images of the splits, drops the unreadable images and the duplicates, and writes the split folders.
+
+        Args:
+            splits (dict): split: images (in the dataset directory). The order of the splits gives the priority of
+                the duplicates, the first split keeps them.
+
+        Returns:
+            the path of each split folder to put in yolo.yaml (relative to the dataset directory), and the report.
+        """
+        start = time.perf_counter()
+        report = ImageCacheReport()
+        names = list(splits)
+        images = [image for split in names for image in splits[split]]
+        image_splits = [names.index(split) for split in names for _ in splits[split]]
+        report.images = len(images)
+        records = self.scan(images, report)
+
+        readable = [i for i, record in enumerate(records) if record["ok"]]
+        for i, record in enumerate(records):
+            if not record["ok"]:
+                report.unreadable[str(images[i])] = record["error"]
+
+        # Groups of duplicates: same content, or close perceptual hashes across splits
+        parents = list(range(len(images)))
+        first_by_sha = {}
+        pairs = []
+        for i in readable:
+            j = first_by_sha.setdefault(records[i]["sha256"], i)
+            if j != i:
+                pairs.append((j, i))
+        if self.max_distance >= 0 and readable:
+            hashes = np.array([records[i]["phash"] for i in readable], dtype=np.uint64)
+            for a, b in near_duplicate_pairs(hashes, self.max_distance).tolist():
+                if image_splits[readable[a]] != image_splits[readable[b]]:
+                    pairs.append((readable[a], readable[b]))
+        for a, b in pairs:
+            root_a, root_b = _find(parents, a), _find(parents, b)
+            parents[max(root_a, root_b)] = min(root_a, root_b)  # The root is the image of the earliest split
+
+        dropped = set()
+        for i in readable:
+            kept = _find(parents, i)
+            if kept == i:
+                continue
+            dropped.add(i)
+            distance = int(popcount(np.uint64(records[i]["phash"]) ^ np.uint64(records[kept]["phash"])))
+            report.duplicates.append(
+                {
+                    "image": str(images[i]),
+                    "split": names[image_splits[i]],
+                    "kept": str(images[kept]),
+                    "kept_split": names[image_splits[kept]],
+                    "exact": records[i]["sha256"] == records[kept]["sha256"],
+                    "distance": distance,
+                }
+            )
+            report.leaked += image_splits[i] != image_splits[kept]
+
+        # The images are linked by stem next to their labels: two of them with the same stem in a split would overwrite
+        # each other (e.g. a.jpg and a.png, or the same name in two directories)
+        linked: dict[tuple[int, str], int] = {}
+        for i in readable:
+            if i not in dropped:
+                j = linked.setdefault((image_splits[i], images[i].stem), i)
+                if j != i:
+                    raise ValueError(
+                        f"{images[j]} and {images[i]} would both be {names[image_splits[i]]}/images/{images[i].stem}.jpg"
+                        " in the image cache, rename one of them"
+                    )
+
+        split_paths = {}
+        for split in names:
+            split_dir = self.size_dir / split
+            if split_dir.exists():
+                shutil.rmtree(split_dir)  # Only links to the objects and copies of the labels
+            (split_dir / "images").mkdir(parents=True)
+            (split_dir / "labels").mkdir(parents=True)
+            split_paths[split] = f"./{CACHE_DIR}/{self.imgsz}/{split}/images"
+            report.kept[split] = 0
+
+        for i in readable:
+            if i in dropped:
+                continue
+            split_dir = self.size_dir / names[image_splits[i]]
+            _link(self.objects_dir / f"{records[i]['sha256']}.jpg", split_dir / "images" / f"{images[i].stem}.jpg")
+            label = label_path(images[i])
+            if label.exists():
+                _link(label, split_dir / "labels" / label.name)
+            report.kept[names[image_splits[i]]] += 1
+
+        report.seconds = time.perf_counter() - start
+        return split_paths, report
+
+
+def _link(source: Path, target: Path) -> None:
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)  # Keeps the mtime, the label stores do not parse the copy again
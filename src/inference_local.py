@@ -4,19 +4,19 @@ Inference is done locally in contrast with inference_bento.py which does remote
 """
 
 import os
-import mlflow
 from mlflow.tracking import MlflowClient
-from ultralytics import YOLO
-from minio import Minio
-import boto3
-import shutil
 
+import backends
+from batch_inference import BatchInference, list_images, open_writer
 from config_inference import *
+from model_cache import ModelCache
+from video_stream import VideoPipeline, video_fps, video_frames
 
 #Paths
-tmp_dir = os.path.join(os.getcwd(), "tmp")
-models_dir = os.path.join(tmp_dir, "models")
-local_model_path = os.path.join(models_dir, "best.pt")
+#Model cache shared with the service (see model_cache.py): a version already downloaded is reused
+models_dir = os.getenv("MODEL_CACHE_DIR", os.path.join(os.getcwd(), "tmp", "models"))
+models_max_bytes = int(float(os.getenv("MODEL_CACHE_MAX_MB", "2048")) * 1024 * 1024)
+weights_artifact_path = "weights/best.pt"
 
 test_files_dir = os.path.join(os.getcwd(), "test_files") #Where the sample images are located
 default_image_path = os.path.join(test_files_dir, "image.jpeg")
@@ -34,43 +34,31 @@ class Inference():
         self.run_id = self.model_version.run_id    
         self.model = None
 
-        self.overwrite_model = True
-
-        #Setup paths and files
-        #os.rmdir(tmp_dir)
-        shutil.rmtree(tmp_dir)
-        os.makedirs(tmp_dir, exist_ok=True)
-        os.makedirs(models_dir, exist_ok=True)
+        self.cache = ModelCache(models_dir, max_bytes=models_max_bytes)
 
 
     def load_model(self):
         """
-        Loads model from minio using the uri given by mlflow
+        Loads model from the model cache, downloaded from minio (artifacts of the version's run) if it is not there
         """
-        
-        artifact_uri = self.client.get_run(self.run_id).info.artifact_uri
-        model_path = f"{artifact_uri}/weights/best.pt"  
-
-        if model_path.startswith('s3://'):
-            model_path = model_path[5:]
-        bucket_name, object_name = model_path.split('/', 1)
-
-        endpoint = os.getenv("MLFLOW_S3_ENDPOINT_URL", "http://localhost:9000")
-        endpoint = endpoint.removeprefix("http://").removeprefix("https://")
-        minio_client = Minio(
-            endpoint,
-            access_key=os.getenv('AWS_ACCESS_KEY_ID'),
-            secret_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-            secure=False  #true if https
-        )
-    
-        if (not os.path.exists(local_model_path)) or (self.overwrite_model == True):
-            minio_client.fget_object(bucket_name, object_name, local_model_path)
+
+        downloaded = []
+
+        def download(dst_path):
+            downloaded.append(dst_path)
+            return self.client.download_artifacts(self.run_id, weights_artifact_path, str(dst_path))
+
+        local_model_path = self.cache.get(self.model_name, self.model_version.version, weights_artifact_path, download)
+        if downloaded:
             print(f"Model downloaded to: {local_model_path}")
         else:
-            print(f"Using existing model at: {local_model_path}")
+            print(f"Using cached model at: {local_model_path}")
 
-        self.model = YOLO(local_model_path)
+        backend = backend_inference
+        if source_type_inference not in ("image", "batch") and backend in ("onnx", "onnx-int8"):
+            print(f"{backend} backend does not support tracking, using torch")
+            backend = "torch"
+        self.model = backends.load_model(local_model_path, backend)
 
 
     def infer(self):
@@ -92,7 +80,25 @@ class Inference():
                 cv2.imwrite(inference_result_path, im_array)
 
         def infer_video(source):
-            results = self.model.track(source, show=True) #Can lead to ram filling up in slower systems.
+            #Decoding, tracking and writing run in parallel with a few frames in memory at most (see video_stream.py)
+            pipeline = VideoPipeline(
+                self.model,
+                buffer_size=buffer_size_video_inference,
+                drop_frames=drop_frames_inference,
+                output_video=output_video_inference,
+                detections_log=detections_log_inference,
+                fps=video_fps(source),
+            )
+            try:
+                pipeline.run(video_frames(source))
+            except KeyboardInterrupt: #How a camera stream is stopped
+                print("Interrupted")
+            report = pipeline.report()
+            print(f"{report['seconds']:.1f}s")
+            for stage, stats in report["stages"].items():
+                print(f"{stage:<8}{stats['frames']} frames, {stats['fps']:.1f} fps "
+                      f"({stats['busy_fps']:.1f} fps when busy), {stats['dropped']} dropped")
+            print(f"Results in {output_video_inference} and {detections_log_inference}")
 
 
 
@@ -120,10 +126,19 @@ class Inference():
             infer_video(source)
 
         elif source_type_inference=="camera":
-            results = self.model.track("0", show=True)
+            print("Running camera inference, Ctrl+C to stop")
+            infer_video(0)
+
+        elif source_type_inference == "batch":
+            print("Running batch inference")
+            paths, root = list_images(file_inference)
+            engine = BatchInference(self.model, batch_size=batch_size_inference, annotate_dir=annotate_dir_inference)
+            report = engine.run(paths, open_writer(output_inference), root)
+            print(f"{report.processed} images in {report.seconds:.1f}s ({report.images_per_second:.1f} images/s), "
+                  f"{report.skipped} already done, {report.errors} unreadable. Results in {output_inference}")
 
         else:
-            print("Inference type must be \"camera\", \"image\" or \"video\"")
+            print("Inference type must be \"camera\", \"image\", \"video\" or \"batch\"")
 
 if __name__=="__main__":
 
@@ -0,0 +1,156 @@
+"""
+Streaming extraction of the label files of a YOLO annotation export.
+
+The label entries of the zip are copied one by one straight to their final location (the dataset directory, flat),
+through a fixed size buffer: no temporary tree to extract, walk, move and delete, and the memory does not depend on
+the size of the archive. With several workers, each one reads the archive through its own handle, so the
+decompression of the entries runs in parallel.
+
+Run as a script to compare it with extracting to a temporary directory and moving the files, on a synthetic archive:
+
+    python src/label_extraction.py --files 100000 --workers 4
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+BUFFER_SIZE = 64 * 1024  # larger entries are copied by chunks of this size
+MIN_FILES_PER_WORKER = 1024
+WRITE_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+
+
+@dataclass
+class ExtractReport:
+    written: int = 0
+    removed: int = 0  # stale labels, not in the archive anymore
+    bytes: int = 0
+    seconds: float = 0.0
+
+
+def label_members(zip_file: zipfile.ZipFile) -> list[zipfile.ZipInfo]:
+    return [info for info in zip_file.infolist() if not info.is_dir() and info.filename.endswith(".txt")]
+
+
+def _extract_members(annotation_file: str | Path, members: list[zipfile.ZipInfo], target_dir: Path) -> int:
+    """Copies the members to target_dir (flat) through one handle of the archive, returns the number of bytes written"""
+    written = 0
+    target_dir = os.fspath(target_dir)
+    with zipfile.ZipFile(annotation_file) as zip_file:
+        for info in members:
+            path = os.path.join(target_dir, os.path.basename(info.filename))
+            if info.file_size <= BUFFER_SIZE:
+                # Labels are small: one read and one write, without the buffered file objects
+                data = zip_file.read(info)
+                fd = os.open(path, WRITE_FLAGS, 0o644)
+                try:
+                    os.write(fd, data)
+                finally:
+                    os.close(fd)
+            else:
+                with zip_file.open(info) as source, open(path, "wb") as target:
+                    shutil.copyfileobj(source, target, BUFFER_SIZE)
+            written += info.file_size
+    return written
+
+
+def stream_extract_labels(
+    annotation_file: str | Path, target_dir: str | Path, workers: int = 1, remove_stale: bool = True
+) -> ExtractReport:
+    """
+    Extracts the .txt entries of the archive to target_dir, in a single pass over the archive.
+
+    Args:
+        workers (int): Threads extracting concurrently.
+        remove_stale (bool): Remove the .txt files of target_dir that are not in the archive.
+    """
+    start = time.perf_counter()
+    target_dir = Path(target_dir)
+    target_dir.mkdir(parents=True, exist_ok=True)
+    with zipfile.ZipFile(annotation_file) as zip_file:
+        members = label_members(zip_file)
+
+    report = ExtractReport(written=len(members))
+    workers = max(1, min(workers, len(members) // MIN_FILES_PER_WORKER))
+    if workers > 1:
+        # One contiguous part of the archive per worker, read sequentially through the worker's own handle
+        size = -(-len(members) // workers)
+        parts = [members[i : i + size] for i in range(0, len(members), size)]
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="extract") as executor:
+            report.bytes = sum(executor.map(lambda part: _extract_members(annotation_file, part, target_dir), parts))
+    else:
+        report.bytes = _extract_members(annotation_file, members, target_dir)
+
+    if remove_stale:
+        names = {Path(info.filename).name for info in members}
+        with os.scandir(target_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(".txt") and entry.name not in names and entry.is_file():
+                    os.unlink(entry.path)
+                    report.removed += 1
+
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def make_synthetic_export(path: str | Path, n_files: int, boxes_per_file: int = 4) -> Path:
+    """Zip shaped like a Picsellia YOLO export (labels in a subdirectory), for the benchmark"""
+    path = Path(path)
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as zip_file:
+        for i in range(n_files):
+            lines = "".join(f"{(i + j) % 8} 0.{i % 89 + 10} 0.{j + 20} 0.1{j} 0.2{j}\n" for j in range(boxes_per_file))
+            zip_file.writestr(f"export/labels/image_{i:06d}.txt", lines)
+    return path
+
+
+def extract_with_temp_dir(annotation_file: str | Path, target_dir: Path) -> None:
+    """Previous extraction (extract everything, move the labels, delete the tree), the baseline of the benchmark"""
+    temp_dir = target_dir / "temp"
+    with zipfile.ZipFile(annotation_file, "r") as zip_ref:
+        zip_ref.extractall(temp_dir)
+    for txt_file in list(temp_dir.rglob("*.txt")):
+        shutil.move(str(txt_file), str(target_dir / txt_file.name))
+    shutil.rmtree(temp_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the label extraction on a synthetic archive")
+    parser.add_argument("--files", type=int, default=100_000, help="Label files in the archive")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--dir", help="Where to write the archive and the labels (a temporary directory by default)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as work_dir:
+        work_dir = Path(work_dir)
+        start = time.perf_counter()
+        archive = make_synthetic_export(work_dir / "annotations.zip", args.files)
+        print(
+            f"archive: {args.files} files, {archive.stat().st_size / 1e6:.1f} MB ({time.perf_counter() - start:.1f}s)"
+        )
+
+        runs = [("temp dir + move", lambda target: extract_with_temp_dir(archive, target))]
+        for workers in args.workers:
+            runs.append(
+                (f"streaming, {workers} workers", lambda target, w=workers: stream_extract_labels(archive, target, w))
+            )
+
+        print(f"{'method':<24}{'seconds':>10}{'files/s':>12}")
+        for i, (name, run) in enumerate(runs):
+            target = work_dir / f"labels_{i}"
+            target.mkdir()
+            start = time.perf_counter()
+            run(target)
+            seconds = time.perf_counter() - start
+            assert sum(1 for _ in os.scandir(target)) == args.files
+            print(f"{name:<24}{seconds:>10.2f}{args.files / seconds:>12.0f}")
+            shutil.rmtree(target)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""
+Packed label store.
+
+The boxes of all the label files of a split are packed into contiguous numpy arrays, instead of one small .txt file
+per image:
+
+- rows (n, 5) float32: class, cx, cy, w, h of every box, image after image
+- offsets (images + 1,) int64: the boxes of image i are rows[offsets[i]:offsets[i + 1]]
+- lines (n,) int32: line of each box in its label file, for the validation reports
+- malformed (m, 2) int32: image and line of the lines that are not 5 numbers (line 0: the file could not be read)
+- stats (images, 2) int64: mtime_ns and size of each label file (size -1: no label file)
+- images.txt: the images, relative to the dataset directory
+
+Each array is saved as a .npy file in the store directory and loaded memory-mapped, so opening a store is instant and
+only the pages actually used are read. Rebuilding a store only parses the label files whose mtime or size changed.
+Validation, class statistics and stratification are vectorized operations on the arrays, and export_txt writes the
+per-image label files back for Ultralytics.
+"""
+
+import io
+import os
+import shutil
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+STORE_DIR = "label_store"  # in the dataset directory, one store per split
+ARRAYS = ("rows", "offsets", "lines", "malformed", "stats")
+
+
+def label_path(image_path: str | Path) -> Path:
+    """Label of an image as YOLO looks for it: last /images/ replaced by /labels/, extension by .txt"""
+    sa, sb = f"{os.sep}images{os.sep}", f"{os.sep}labels{os.sep}"
+    return Path(sb.join(os.fspath(image_path).rsplit(sa, 1))).with_suffix(".txt")
+
+
+def read_label_files(paths: list[str | Path]) -> tuple[list[list[str]], list[int], list[int], list[tuple[int, int]]]:
+    """
+    Splits the lines of label files into values.
+
+    Returns:
+        the values of the lines with 5 values, the file (index in paths) and line number of each of them, and the
+        (file, line) of the other non-empty lines, line 0 for the files that could not be read.
+    """
+    tokens, owners, line_numbers, malformed = [], [], [], []
+    for i, path in enumerate(paths):
+        try:
+            with open(path) as f:
+                lines = f.read().splitlines()
+        except (OSError, UnicodeDecodeError):
+            malformed.append((i, 0))
+            continue
+        for line_number, line in enumerate(lines, start=1):
+            parts = line.split()
+            if not parts:
+                continue
+            if len(parts) != 5:
+                malformed.append((i, line_number))
+                continue
+            tokens.append(parts)
+            owners.append(i)
+            line_numbers.append(line_number)
+    return tokens, owners, line_numbers, malformed
+
+
+def parse_rows(tokens: list[list[str]]) -> tuple[np.ndarray, np.ndarray]:
+    """(n, 5) float array of the rows, and a mask of the rows that could be parsed"""
+    try:
+        return np.array(tokens, dtype=np.float64).reshape(-1, 5), np.ones(len(tokens), dtype=bool)
+    except ValueError:
+        # Some value is not a number: parse row by row to find which (rare)
+        rows = np.zeros((len(tokens), 5))
+        valid = np.ones(len(tokens), dtype=bool)
+        for i, row in enumerate(tokens):
+            try:
+                rows[i] = [float(value) for value in row]
+            except ValueError:
+                valid[i] = False
+        return rows, valid
+
+
+def _label_stat(path: Path) -> tuple[int, int]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return 0, -1
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _relative(paths: list[Path], root: Path) -> list[str]:
+    prefix = os.fspath(root) + os.sep
+    names = []
+    for path in map(os.fspath, paths):
+        if not path.startswith(prefix):
+            raise ValueError(f"{path} is not in {root}")
+        names.append(path[len(prefix) :].replace(os.sep, "/"))
+    return names
+
+
+def _segments(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Indices of the concatenated ranges [starts[i], starts[i] + counts[i])"""
+    ends = np.cumsum(counts)
+    return np.repeat(starts - (ends - counts), counts) + np.arange(ends[-1] if len(ends) else 0)
+
+
+@dataclass
+class LabelStore:
+    root: Path  # dataset directory, the images are relative to it
+    images: list[str]
+    rows: np.ndarray
+    offsets: np.ndarray
+    lines: np.ndarray
+    malformed: np.ndarray
+    stats: np.ndarray
+    parsed: int = 0  # label files parsed by the build, the others were taken from the previous store
+
+    def __len__(self) -> int:
+        return len(self.images)
+
+    @property
+    def labelled(self) -> np.ndarray:
+        """Whether each image has a label file"""
+        return self.stats[:, 1] >= 0
+
+    @property
+    def owners(self) -> np.ndarray:
+        """Image of each row"""
+        return np.repeat(np.arange(len(self.images)), np.diff(self.offsets))
+
+    def image_path(self, i: int) -> Path:
+        return self.root / self.images[i]
+
+    def label_file(self, i: int) -> Path:
+        return label_path(self.image_path(i))
+
+    def boxes(self, i: int) -> np.ndarray:
+        return self.rows[self.offsets[i] : self.offsets[i + 1]]
+
+    @classmethod
+    def build(cls, images: list[Path], root: str | Path, previous: "LabelStore | None" = None) -> "LabelStore":
+        """
+        Packs the label files of the images (found the way YOLO does, see label_path).
+
+        Args:
+            images (list[Path]): Images, in root.
+            root (str, Path): Dataset directory.
+            previous (LabelStore): Store of a previous build, the label files unchanged since are not parsed again.
+        """
+        root = Path(root)
+        names = _relative(images, root)
+        labels = [label_path(image) for image in images]
+        stats = np.array([_label_stat(label) for label in labels], dtype=np.int64).reshape(-1, 2)
+
+        # Image of the previous store to reuse for each image, -1 to parse its label file
+        reused = np.full(len(names), -1, dtype=np.int64)
+        if previous is not None and len(previous):
+            previous_index = {name: j for j, name in enumerate(previous.images)}
+            candidates = np.array([previous_index.get(name, -1) for name in names], dtype=np.int64)
+            found = candidates >= 0
+            unchanged = found.copy()
+            unchanged[found] = (np.asarray(previous.stats)[candidates[found]] == stats[found]).all(axis=1)
+            reused[unchanged] = candidates[unchanged]
+        else:
+            previous = None
+        stale = np.flatnonzero((reused < 0) & (stats[:, 1] >= 0))
+
+        tokens, owners, line_numbers, malformed = read_label_files([labels[i] for i in stale])
+        new_rows, parsed = parse_rows(tokens)
+        owners = np.asarray(owners, dtype=np.int64)
+        malformed += [(i, line_numbers[row]) for i, row in zip(owners[~parsed].tolist(), np.flatnonzero(~parsed))]
+        new_owners = stale[owners[parsed]]  # stale rows are in image order, as read
+        new_rows, new_lines = new_rows[parsed].astype(np.float32), np.asarray(line_numbers, dtype=np.int32)[parsed]
+
+        # Gather the rows of each image from the previous store or the parsed files
+        counts = np.zeros(len(names), dtype=np.int64)
+        starts = np.zeros(len(names), dtype=np.int64)
+        base = 0
+        if previous is not None:
+            previous_counts = np.diff(previous.offsets)
+            counts[reused >= 0] = previous_counts[reused[reused >= 0]]
+            starts[reused >= 0] = np.asarray(previous.offsets)[reused[reused >= 0]]
+            base = len(previous.rows)
+        new_counts = np.bincount(new_owners, minlength=len(names))
+        counts[stale] = new_counts[stale]
+        starts[stale] = base + np.cumsum(new_counts[stale]) - new_counts[stale]
+
+        index = _segments(starts, counts)
+        if previous is not None:
+            rows = np.concatenate([previous.rows, new_rows])[index]
+            lines = np.concatenate([previous.lines, new_lines])[index]
+        else:
+            rows, lines = new_rows[index], new_lines[index]
+
+        new_malformed = np.array([(stale[k], line) for k, line in malformed], dtype=np.int32).reshape(-1, 2)
+        if previous is not None and len(previous.malformed):
+            to_new = np.full(len(previous), -1, dtype=np.int64)
+            to_new[reused[reused >= 0]] = np.flatnonzero(reused >= 0)
+            kept = np.array(previous.malformed)
+            kept[:, 0] = to_new[kept[:, 0]]
+            new_malformed = np.concatenate([kept[kept[:, 0] >= 0], new_malformed])
+        new_malformed = new_malformed[np.lexsort((new_malformed[:, 1], new_malformed[:, 0]))]
+
+        return cls(
+            root=root,
+            images=names,
+            rows=rows.reshape(-1, 5),
+            offsets=np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+            lines=lines,
+            malformed=new_malformed,
+            stats=stats,
+            parsed=len(stale),
+        )
+
+    def save(self, path: str | Path) -> None:
+        """Writes the store to the directory path, replacing the previous one"""
+        path = Path(path)
+        tmp_path = path.with_name(path.name + ".tmp")
+        if tmp_path.exists():
+            shutil.rmtree(tmp_path)
+        tmp_path.mkdir(parents=True)
+        for name in ARRAYS:
+            np.save(tmp_path / f"{name}.npy", np.ascontiguousarray(getattr(self, name)))
+        (tmp_path / "images.txt").write_text("".join(f"{image}\n" for image in self.images))
+        if path.exists():
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str | Path, root: str | Path, mmap: bool = True) -> "LabelStore":
+        path = Path(path)
+        arrays = {name: np.load(path / f"{name}.npy", mmap_mode="r" if mmap else None) for name in ARRAYS}
+        return cls(root=Path(root), images=(path / "images.txt").read_text().splitlines(), **arrays)
+
+    def valid_classes(self, nc: int | None = None, rows: np.ndarray | None = None) -> np.ndarray:
+        """Mask of the rows whose class is an integer in [0, nc), among the rows of the mask rows if given"""
+        cls = self.rows[:, 0]
+        valid = (cls >= 0) & (cls == np.floor(cls))
+        if nc is not None:
+            valid &= cls < nc
+        if rows is not None:
+            valid &= rows
+        return valid
+
+    def class_counts(self, nc: int | None = None, rows: np.ndarray | None = None) -> np.ndarray:
+        """Number of boxes of each class"""
+        cls = self.rows[:, 0][self.valid_classes(nc, rows)].astype(np.int64)
+        return np.bincount(cls, minlength=nc or 0)
+
+    def image_counts(self, nc: int | None = None, rows: np.ndarray | None = None) -> np.ndarray:
+        """Number of images containing each class"""
+        valid = self.valid_classes(nc, rows)
+        pairs = np.unique(np.column_stack([self.owners[valid], self.rows[:, 0][valid].astype(np.int64)]), axis=0)
+        return np.bincount(pairs[:, 1], minlength=nc or 0)
+
+    def rarest_classes(self) -> np.ndarray:
+        """Class of each image contained in the fewest images (lowest id on ties), -1 for the images without boxes"""
+        valid = self.valid_classes()
+        owners, cls = self.owners[valid], self.rows[:, 0][valid].astype(np.int64)
+        if not len(cls):
+            return np.full(len(self), -1, dtype=np.int64)
+        counts = self.image_counts()
+        n = int(cls.max()) + 1
+        keys = np.full(len(self), np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(keys, owners, counts[cls] * n + cls)
+        return np.where(keys == np.iinfo(np.int64).max, -1, keys % n)
+
+    def export_txt(self) -> int:
+        """
+        Writes the label file of each labelled image from the store (for Ultralytics), malformed lines are dropped.
+
+        Returns:
+            the number of label files written.
+        """
+        buffer = io.StringIO()
+        np.savetxt(buffer, np.asarray(self.rows, dtype=np.float64), fmt=["%d", "%.6f", "%.6f", "%.6f", "%.6f"])
+        lines = buffer.getvalue().splitlines(keepends=True)
+        written = 0
+        for i in np.flatnonzero(self.labelled):
+            label_file = self.label_file(i)
+            label_file.parent.mkdir(parents=True, exist_ok=True)
+            label_file.write_text("".join(lines[self.offsets[i] : self.offsets[i + 1]]))
+            written += 1
+        # The files just written are up to date with the store, no need to parse them again on the next build
+        labelled = np.flatnonzero(self.labelled)
+        self.stats = np.array(self.stats)
+        stats = [_label_stat(self.label_file(i)) for i in labelled]
+        self.stats[labelled] = np.array(stats, dtype=np.int64).reshape(-1, 2)
+        return written
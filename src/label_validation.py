@@ -0,0 +1,170 @@
+"""
+Validation of YOLO label files.
+
+The labels of each split are validated from its packed label store (see src/label_store.py): the boxes of all the files
+of the split are in a single numpy array and every check runs on the whole array at once:
+
+- errors: lines without 5 values (format), class ids that are not integers in [0, nc) (class),
+  x, y, w, h outside [0, 1] (coords), null or negative width / height (size)
+- warnings: boxes going out of the image (bounds), identical boxes in the same file (duplicate)
+
+Only the label files changed since the previous build of the stores are parsed. The validation returns a structured
+report with the class statistics of each split (see ValidationReport).
+"""
+
+import json
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+import numpy as np
+
+from src.label_store import LabelStore
+
+MAX_LINES_REPORTED = 10  # line numbers kept per file and check
+EPS = 1e-6
+
+
+def _new_result() -> dict:
+    return {"boxes": 0, "errors": {}, "warnings": {}}
+
+
+def _flag(result: dict, kind: str, check: str, line: int) -> None:
+    entry = result[kind].setdefault(check, {"count": 0, "lines": []})
+    entry["count"] += 1
+    if len(entry["lines"]) < MAX_LINES_REPORTED:
+        entry["lines"].append(line)
+
+
+def check_rows(rows: np.ndarray, owners: np.ndarray, nc: int | None = None) -> tuple[dict, dict, np.ndarray]:
+    """
+    Vectorized checks of label rows (class, x, y, w, h) parsed from several files.
+
+    Args:
+        owners (np.ndarray): File of each row, for the duplicates.
+
+    Returns:
+        a mask of the rows per error check, a mask per warning check, and the mask of the rows with an error.
+    """
+    cls, xywh = rows[:, 0], rows[:, 1:]
+    x, y, w, h = xywh.T
+
+    class_invalid = (cls != np.floor(cls)) | (cls < 0)
+    if nc is not None:
+        class_invalid |= cls >= nc
+    errors = {
+        "class": class_invalid,
+        "coords": ((xywh < 0) | (xywh > 1)).any(axis=1),
+        "size": (w <= 0) | (h <= 0),
+    }
+    invalid = np.logical_or.reduce(list(errors.values()))
+    # Warnings only for the otherwise valid boxes. Duplicates: every occurrence of a row in a file but the first one
+    _, first = np.unique(np.column_stack([owners, rows]), axis=0, return_index=True)
+    duplicate = ~invalid
+    duplicate[first] = False
+    warnings = {
+        "bounds": ~invalid & ((x - w / 2 < -EPS) | (x + w / 2 > 1 + EPS) | (y - h / 2 < -EPS) | (y + h / 2 > 1 + EPS)),
+        "duplicate": duplicate,
+    }
+    return errors, warnings, invalid
+
+
+def _flag_rows(results: dict, masks: tuple[dict, dict], owners: np.ndarray, line_numbers: np.ndarray) -> None:
+    """Adds the flagged rows to the result of their file (created on the first flag)"""
+    for kind, kind_masks in zip(("errors", "warnings"), masks):
+        for check, mask in kind_masks.items():
+            for row in np.flatnonzero(mask):
+                owner = int(owners[row])
+                if owner not in results:
+                    results[owner] = _new_result()
+                _flag(results[owner], kind, check, int(line_numbers[row]))
+
+
+def _sort_lines(result: dict) -> None:
+    for kind in ("errors", "warnings"):
+        for entry in result[kind].values():
+            entry["lines"].sort()
+
+
+@dataclass
+class ValidationReport:
+    splits: dict[str, dict] = field(default_factory=dict)  # images, labels, missing_labels, boxes, invalid_files
+    errors: dict[str, int] = field(default_factory=dict)  # check: number of lines (or splits / files)
+    warnings: dict[str, int] = field(default_factory=dict)
+    files: dict[str, dict] = field(default_factory=dict)  # label file: result, for the files with errors or warnings
+    checked: int = 0  # label files parsed
+    cached: int = 0  # label files not parsed again, unchanged since the previous build of the stores
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def add(self, kind: str, check: str, count: int = 1) -> None:
+        counts = getattr(self, kind)
+        counts[check] = counts.get(check, 0) + count
+
+    def to_dict(self) -> dict:
+        return {"ok": self.ok, **asdict(self)}
+
+    def save(self, path: str | Path) -> None:
+        Path(path).write_text(json.dumps(self.to_dict(), indent=2))
+
+
+def _add_split(report: ValidationReport, split: str, results: dict[str, dict], summary: dict) -> None:
+    """Adds the results of the label files of a split to the report"""
+    invalid_files = 0
+    for path, result in results.items():
+        invalid_files += bool(result["errors"])
+        for kind in ("errors", "warnings"):
+            for check, entry in result[kind].items():
+                report.add(kind, check, entry["count"])
+        if result["errors"] or result["warnings"]:
+            report.files[path] = result
+    report.splits[split] = {**summary, "invalid_files": invalid_files}
+
+
+def validate_stores(stores: dict[str, LabelStore | None], nc: int | None = None) -> ValidationReport:
+    """
+    Validates the splits of a dataset from their label stores, see the module docstring for the checks.
+
+    Args:
+        stores (dict): split: label store, or None if the split is missing.
+    """
+    start = time.perf_counter()
+    report = ValidationReport()
+    for split, store in stores.items():
+        if store is None:
+            report.add("errors", "missing_split")
+            report.splits[split] = None
+            continue
+        labelled = int(store.labelled.sum())
+        report.checked += store.parsed
+        report.cached += labelled - store.parsed
+
+        owners = store.owners
+        errors, warnings, invalid = check_rows(np.asarray(store.rows, dtype=np.float64), owners, nc)
+        results = {}
+        for i, line in np.asarray(store.malformed).tolist():
+            _flag(results.setdefault(i, _new_result()), "errors", "format" if line else "unreadable", line)
+        _flag_rows(results, (errors, warnings), owners, store.lines)
+        boxes = np.bincount(owners[~invalid], minlength=len(store))
+        for i, result in results.items():
+            result["boxes"] = int(boxes[i])
+            _sort_lines(result)
+
+        missing_labels = len(store) - labelled
+        if missing_labels:
+            report.add("warnings", "missing_label", missing_labels)
+        summary = {
+            "images": len(store),
+            "labels": labelled,
+            "missing_labels": missing_labels,
+            "boxes": int(boxes.sum()),
+            "boxes_per_class": store.class_counts(nc, rows=~invalid).tolist(),
+            "images_per_class": store.image_counts(nc, rows=~invalid).tolist(),
+        }
+        _add_split(report, split, {str(store.label_file(i)): results[i] for i in sorted(results)}, summary)
+
+    report.seconds = time.perf_counter() - start
+    return report
@@ -0,0 +1,348 @@
+"""
+Load test of the serving stack.
+
+Starts YOLOService locally (bentoml serve, with the given environment overrides) and replays a corpus of recorded
+requests against it, either closed-loop (a fixed number of clients sending back to back) or open-loop (requests
+sent at a fixed arrival rate, whatever the response times, so queueing shows up in the latency). The report
+(throughput, p50/p95/p99 latency, error rates) is printed as JSON, to compare batching, backend or cache settings
+run over run. Nothing is downloaded: pass local weights with --model.
+
+    python src/load_test.py --model tmp/models/best.pt --concurrency 8 --duration 30
+    python src/load_test.py --model tmp/models/best.pt --rate 20 --duration 30 --env YOLO_BATCHING=1 --output out.json
+    python src/load_test.py --url http://localhost:3000 --concurrency 4 --requests 200   # already running service
+
+The corpus is a JSON lines file, one request per line (paths relative to the corpus file):
+
+    {"endpoint": "predict", "image": "yolotest.jpeg"}
+    {"endpoint": "predict", "image": "yolotest.jpeg", "accept": "application/x-yolo-detections"}
+    {"endpoint": "predict", "synthetic": [4032, 3024], "seed": 1}   # generated JPEG (or "format": "png")
+"""
+
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_CORPUS = ROOT_DIR / "test_files" / "load_test_corpus.jsonl"
+
+
+@dataclass
+class CorpusRequest:
+    name: str
+    endpoint: str
+    body: bytes
+    content_type: str
+    headers: dict[str, str]
+
+
+@dataclass
+class Sample:
+    name: str
+    status: int | None  # None when the request failed without a response
+    latency: float  # seconds, from the (scheduled) send time to the full response
+    error: str | None = None
+
+
+def synthetic_image(width: int, height: int, seed: int = 0, image_format: str = "jpeg") -> bytes:
+    """Deterministic image of the given size: a smooth gradient with noise, compressing like a photo"""
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = np.stack([np.broadcast_to(x, (height, width)), np.broadcast_to(y, (height, width)), (x + y) / 2], axis=-1)
+    pixels = np.clip(base + rng.normal(0, 12, size=(height, width, 3)), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format=image_format.upper())
+    return buffer.getvalue()
+
+
+def load_corpus(path: str | Path) -> list[CorpusRequest]:
+    path = Path(path)
+    requests = []
+    for line_number, line in enumerate(path.read_text().splitlines(), start=1):
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        if "image" in entry:
+            image_path = path.parent / entry["image"]
+            body = image_path.read_bytes()
+            name = image_path.name
+            suffix = image_path.suffix.lower().lstrip(".")
+            content_type = f"image/{'jpeg' if suffix == 'jpg' else suffix}"
+        elif "synthetic" in entry:
+            width, height = entry["synthetic"]
+            image_format = entry.get("format", "jpeg")
+            body = synthetic_image(width, height, entry.get("seed", 0), image_format)
+            name = f"synthetic_{width}x{height}.{image_format}"
+            content_type = f"image/{image_format}"
+        else:
+            raise ValueError(f"{path}:{line_number}: a request needs an 'image' or a 'synthetic' size")
+
+        headers = {"accept": entry["accept"]} if "accept" in entry else {}
+        requests.append(
+            CorpusRequest(f"{line_number}:{name}", entry.get("endpoint", "predict"), body, content_type, headers)
+        )
+    if not requests:
+        raise ValueError(f"Empty corpus {path}")
+    return requests
+
+
+async def send(client, request: CorpusRequest, scheduled: float | None = None) -> Sample:
+    """Sends one request. The latency counts from `scheduled` (perf_counter) if given, to include the client lag."""
+    start = scheduled if scheduled is not None else time.perf_counter()
+    try:
+        response = await client.post(
+            f"/{request.endpoint}",
+            files={"image": (request.name.split(":", 1)[1], request.body, request.content_type)},
+            headers=request.headers,
+        )
+        await response.aread()
+    except Exception as e:
+        return Sample(request.name, None, time.perf_counter() - start, f"{type(e).__name__}: {e}")
+    latency = time.perf_counter() - start
+    error = None if response.status_code < 400 else f"HTTP {response.status_code}"
+    return Sample(request.name, response.status_code, latency, error)
+
+
+async def run_closed_loop(
+    client,
+    requests: list[CorpusRequest],
+    concurrency: int,
+    num_requests: int | None = None,
+    duration: float | None = None,
+) -> list[Sample]:
+    """
+    `concurrency` clients each sending the corpus requests (round robin) back to back, until either limit is reached
+    """
+    if num_requests is None and duration is None:
+        raise ValueError("Give a number of requests or a duration")
+    samples: list[Sample] = []
+    counter = iter(range(num_requests)) if num_requests is not None else itertools.count()
+    deadline = time.perf_counter() + duration if duration is not None else float("inf")
+
+    async def client_loop() -> None:
+        for i in counter:
+            if time.perf_counter() >= deadline:
+                break
+            samples.append(await send(client, requests[i % len(requests)]))
+
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    return samples
+
+
+async def run_open_loop(
+    client, requests: list[CorpusRequest], rate: float, duration: float, poisson: bool = True, seed: int = 0
+) -> list[Sample]:
+    """
+    Sends requests at `rate` per second for `duration` seconds, exponentially distributed inter-arrival times
+    (poisson) or evenly spaced. A slow server does not slow down the arrivals, latencies count from the scheduled time.
+    """
+    rng = random.Random(seed)
+    tasks = []
+    start = time.perf_counter()
+    offset = 0.0
+    i = 0
+    while True:
+        offset += rng.expovariate(rate) if poisson else 1 / rate
+        if offset >= duration:
+            break
+        scheduled = start + offset
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        tasks.append(asyncio.create_task(send(client, requests[i % len(requests)], scheduled)))
+        i += 1
+    return list(await asyncio.gather(*tasks))
+
+
+def _latency_stats(latencies: list[float]) -> dict:
+    if not latencies:
+        return {"mean": None, "p50": None, "p95": None, "p99": None, "max": None}
+    ms = np.asarray(latencies) * 1000
+    return {
+        "mean": float(ms.mean()),
+        "p50": float(np.percentile(ms, 50)),
+        "p95": float(np.percentile(ms, 95)),
+        "p99": float(np.percentile(ms, 99)),
+        "max": float(ms.max()),
+    }
+
+
+def summarize(samples: list[Sample], elapsed: float) -> dict:
+    """
+    Throughput of the successful requests (per second), their latency (ms) and the error rate, overall and per corpus
+    request
+    """
+    succeeded = [s for s in samples if s.error is None]
+    status_codes: dict[str, int] = {}
+    errors: dict[str, int] = {}
+    for sample in samples:
+        status = str(sample.status) if sample.status is not None else "none"
+        status_codes[status] = status_codes.get(status, 0) + 1
+        if sample.error is not None:
+            errors[sample.error] = errors.get(sample.error, 0) + 1
+
+    by_request = {}
+    for name in sorted({s.name for s in samples}):
+        group = [s for s in samples if s.name == name]
+        ok = [s.latency for s in group if s.error is None]
+        by_request[name] = {"requests": len(group), "errors": len(group) - len(ok), "latency_ms": _latency_stats(ok)}
+
+    return {
+        "requests": len(samples),
+        "errors": len(samples) - len(succeeded),
+        "error_rate": (len(samples) - len(succeeded)) / len(samples) if samples else 0.0,
+        "elapsed_s": elapsed,
+        "throughput_rps": len(succeeded) / elapsed if elapsed > 0 else 0.0,
+        "latency_ms": _latency_stats([s.latency for s in succeeded]),
+        "status_codes": status_codes,
+        "error_types": errors,
+        "by_request": by_request,
+    }
+
+
+class LocalService:
+    """Context manager running `bentoml serve service:YOLOService` from the repository root"""
+
+    def __init__(
+        self,
+        port: int = 3999,
+        env: dict[str, str] | None = None,
+        log_path: str | Path | None = None,
+        startup_timeout: float = 300,
+    ) -> None:
+        self.port = port
+        self.url = f"http://127.0.0.1:{port}"
+        self.env = {**os.environ, "BENTOML_DO_NOT_TRACK": "True", **(env or {})}
+        # Outside the repository by default, the log of every run would end up in the tree
+        self.log_path = Path(log_path) if log_path else Path(tempfile.mkdtemp(prefix="load_test_")) / "server.log"
+        self.startup_timeout = startup_timeout
+        self.process = None
+
+    def __enter__(self) -> "LocalService":
+        import httpx
+
+        self.log_path.parent.mkdir(parents=True, exist_ok=True)
+        self._log = open(self.log_path, "w")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "bentoml", "serve", "service:YOLOService", "--port", str(self.port)],
+            cwd=ROOT_DIR,
+            env=self.env,
+            stdout=self._log,
+            stderr=subprocess.STDOUT,
+        )
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                self.__exit__()
+                raise RuntimeError(f"The service exited during startup, see {self.log_path}")
+            try:
+                if httpx.get(f"{self.url}/readyz", timeout=1).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.5)
+        self.__exit__()
+        raise TimeoutError(f"The service was not ready after {self.startup_timeout}s, see {self.log_path}")
+
+    def __exit__(self, *exc_info) -> None:
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self._log.close()
+
+
+async def run_benchmark(url: str, requests: list[CorpusRequest], args) -> dict:
+    import httpx
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+        for i in range(args.warmup):
+            await send(client, requests[i % len(requests)])
+
+        start = time.perf_counter()
+        if args.rate:
+            samples = await run_open_loop(client, requests, args.rate, args.duration, poisson=not args.uniform)
+        else:
+            samples = await run_closed_loop(client, requests, args.concurrency, args.requests, args.duration)
+        return summarize(samples, time.perf_counter() - start)
+
+
+def parse_env(overrides: list[str]) -> dict[str, str]:
+    env = {}
+    for override in overrides:
+        key, sep, value = override.partition("=")
+        if not sep:
+            raise ValueError(f"Expected KEY=VALUE, got {override}")
+        env[key] = value
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of YOLOService, reported as JSON")
+    parser.add_argument("--corpus", default=str(DEFAULT_CORPUS), help="JSON lines file of the requests to replay")
+    parser.add_argument("--url", help="Benchmark a running service instead of starting one")
+    parser.add_argument("--model", help="Local weights served (MODEL_NAME)")
+    parser.add_argument("--env", nargs="*", default=[], metavar="KEY=VALUE", help="Environment of the started service")
+    parser.add_argument("--port", type=int, default=3999)
+    parser.add_argument("--concurrency", type=int, default=1, help="Clients of the closed-loop mode")
+    parser.add_argument("--rate", type=float, help="Open-loop mode: requests per second")
+    parser.add_argument("--uniform", action="store_true", help="Evenly spaced arrivals instead of poisson ones")
+    parser.add_argument("--requests", type=int, help="Closed-loop mode: total number of requests")
+    parser.add_argument("--duration", type=float, help="Seconds to run (required for the open-loop mode)")
+    parser.add_argument("--warmup", type=int, default=5, help="Requests sent before measuring")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds before a request counts as failed")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    if args.rate and not args.duration:
+        parser.error("--rate needs a --duration")
+    if not args.rate and args.requests is None and args.duration is None:
+        args.requests = 100
+
+    requests = load_corpus(args.corpus)
+    env = parse_env(args.env)
+    if args.model:
+        env["MODEL_NAME"] = str(Path(args.model).resolve())
+
+    report = {
+        "config": {
+            "corpus": args.corpus,
+            "mode": "open-loop" if args.rate else "closed-loop",
+            "concurrency": None if args.rate else args.concurrency,
+            "rate": args.rate,
+            "arrivals": ("uniform" if args.uniform else "poisson") if args.rate else None,
+            "requests": args.requests,
+            "duration": args.duration,
+            "env": env,
+        }
+    }
+    if args.url:
+        report["config"]["url"] = args.url
+        report.update(asyncio.run(run_benchmark(args.url, requests, args)))
+    else:
+        with LocalService(args.port, env) as service:
+            report.update(asyncio.run(run_benchmark(service.url, requests, args)))
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).write_text(output)
+
+
+if __name__ == "__main__":
+    main()
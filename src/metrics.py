@@ -0,0 +1,66 @@
+"""
+Prometheus metrics of the serving path, exposed by BentoML on its /metrics endpoint.
+
+Every request records the time spent in each stage (decode, array conversion, preprocess, inference,
+postprocess, response encoding), labelled with the served model version, as well as the time spent waiting
+in the batching and worker queues and the size of the batches.
+
+prometheus_client must be imported after BentoML set up its multiprocess directory, i.e. when the service
+module is loaded by the server, which is the case here.
+"""
+
+from prometheus_client import Counter, Gauge, Histogram
+
+STAGES = ("decode", "array_conversion", "preprocess", "inference", "postprocess", "encode")
+
+# 0.5 ms to 10 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+stage_duration = Histogram(
+    "yolo_stage_duration_seconds",
+    "Time spent in each stage of a prediction request",
+    labelnames=["stage", "model_version"],
+    buckets=LATENCY_BUCKETS,
+)
+request_duration = Histogram(
+    "yolo_request_duration_seconds",
+    "End to end time of a prediction request, inside the service",
+    labelnames=["model_version", "cached"],
+    buckets=LATENCY_BUCKETS,
+)
+queue_wait = Histogram(
+    "yolo_queue_wait_seconds",
+    "Time spent waiting before being processed, in the batching queue or in a worker queue",
+    labelnames=["queue", "model_version"],
+    buckets=LATENCY_BUCKETS,
+)
+batch_size = Histogram(
+    "yolo_batch_size",
+    "Number of images per forward pass",
+    labelnames=["model_version"],
+    buckets=BATCH_SIZE_BUCKETS,
+)
+rejected_requests = Counter(
+    "yolo_rejected_requests_total",
+    "Requests answered with a 503 because the inference queues were full",
+)
+active_model = Gauge(
+    "yolo_active_model",
+    "1 for the model version currently served, 0 for the versions served before it",
+    labelnames=["model_version", "backend"],
+)
+
+
+def observe_stages(model_version: str, durations_ms: dict[str, float | None]) -> None:
+    """Records the duration (ms) of the stages of one request, skipping the unknown ones"""
+    for stage, duration in durations_ms.items():
+        if duration is not None:
+            stage_duration.labels(stage=stage, model_version=model_version).observe(duration / 1000)
+
+
+def set_active_model(model_version: str, backend: str, previous_version: str | None = None) -> None:
+    if previous_version is not None:
+        # Set to 0 rather than removed: in multiprocess mode (BentoML), remove() leaves the value in the shared files
+        active_model.labels(model_version=previous_version, backend=backend).set(0)
+    active_model.labels(model_version=model_version, backend=backend).set(1)
@@ -0,0 +1,157 @@
+"""
+Local cache of the registered model artifacts, shared by the service and the local inference.
+
+An artifact is identified by the registered model name, the version and its path in the run (e.g.
+yolo11n/3/weights/best.pt). Its content is stored once, under its sha256: objects/<sha256>/<file name>, so that the
+file keeps its name and extension (which the backends rely on, and their exports are cached next to it). index.json
+maps each artifact to its object, with the size and last use of the objects. Versions are immutable, so resolving an
+alias to a version already in the index is a hit without any transfer.
+
+- downloads go to a temporary directory in the cache and are moved into place once complete and hashed (atomic)
+- the cache is bounded in size: the least recently used objects are evicted first, never the one just returned
+- every operation holds an exclusive lock on the cache (.lock, fcntl), so processes sharing the directory (service
+  workers, local inference) do not download the same artifact twice nor corrupt the index
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable
+
+INDEX_NAME = "index.json"
+LOCK_NAME = ".lock"
+OBJECTS_DIR = "objects"
+TMP_DIR = "tmp"
+CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path: str | Path) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class ModelCache:
+    def __init__(self, root: str | Path, max_bytes: int | None = None) -> None:
+        """
+        Args:
+            root (str, Path): Cache directory, created if needed.
+            max_bytes (int): Total size of the objects above which the least recently used are evicted, None for no
+                limit.
+        """
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.index_path = self.root / INDEX_NAME
+        self.objects_dir = self.root / OBJECTS_DIR
+        self._thread_lock = threading.Lock()  # flock is per open file, not per thread
+
+    @contextmanager
+    def lock(self):
+        """Exclusive lock on the cache, across threads and processes"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with self._thread_lock, open(self.root / LOCK_NAME, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _load_index(self) -> dict:
+        if self.index_path.exists():
+            return json.loads(self.index_path.read_text())
+        return {"artifacts": {}, "objects": {}}
+
+    def _save_index(self, index: dict) -> None:
+        tmp_path = self.index_path.with_name(f"{self.index_path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(index, indent=2))
+        os.replace(tmp_path, self.index_path)
+
+    @staticmethod
+    def artifact_key(model_name: str, version: str | int, artifact_path: str) -> str:
+        return f"{model_name}/{version}/{artifact_path}"
+
+    def _object_path(self, obj: str) -> Path:
+        return self.objects_dir / obj
+
+    def _hit(self, index: dict, key: str) -> Path | None:
+        obj = index["artifacts"].get(key)
+        if obj is None or obj not in index["objects"]:
+            return None
+        path = self._object_path(obj)
+        if not path.is_file() or path.stat().st_size != index["objects"][obj]["size"]:
+            # Deleted or truncated behind our back: downloaded again
+            del index["objects"][obj]
+            return None
+        index["objects"][obj]["last_used"] = time.time()
+        return path
+
+    def get(
+        self, model_name: str, version: str | int, artifact_path: str, download: Callable[[Path], str | Path]
+    ) -> Path:
+        """
+        Local path of an artifact, downloaded on a miss.
+
+        Args:
+            model_name (str), version (str, int), artifact_path (str): Identify the artifact.
+            download (Callable): Downloads the artifact into the directory it is given and returns the file path
+                (e.g. MlflowClient.download_artifacts). Called with the cache locked: concurrent callers wait for the
+                download instead of repeating it.
+        """
+        key = self.artifact_key(model_name, version, artifact_path)
+        with self.lock():
+            index = self._load_index()
+            path = self._hit(index, key)
+            if path is None:
+                path = self._store(index, key, download)
+                self._evict(index, keep=index["artifacts"][key])
+            self._save_index(index)
+            return path
+
+    def _store(self, index: dict, key: str, download: Callable[[Path], str | Path]) -> Path:
+        tmp_root = self.root / TMP_DIR
+        tmp_root.mkdir(parents=True, exist_ok=True)
+        tmp_dir = Path(tempfile.mkdtemp(dir=tmp_root))
+        try:
+            downloaded = Path(download(tmp_dir))
+            obj = f"{file_sha256(downloaded)}/{downloaded.name}"
+            path = self._object_path(obj)
+            # Same content already cached (e.g. a version re-registered): replaced, in case it was damaged
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(downloaded, path)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        index["artifacts"][key] = obj
+        index["objects"][obj] = {"size": path.stat().st_size, "last_used": time.time()}
+        return path
+
+    def _evict(self, index: dict, keep: str) -> None:
+        """Removes the least recently used objects (but keep) until the cache fits in max_bytes"""
+        if self.max_bytes is None:
+            return
+        objects = index["objects"]
+        total = sum(entry["size"] for entry in objects.values())
+        for obj in sorted(objects, key=lambda obj: objects[obj]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            directory = obj.split("/")[0]
+            if obj not in objects or directory == keep.split("/")[0]:
+                continue
+            # The whole object directory, with the exports cached next to the weights
+            for other in [other for other in objects if other.split("/")[0] == directory]:
+                total -= objects.pop(other)["size"]
+            shutil.rmtree(self.objects_dir / directory, ignore_errors=True)
+        index["artifacts"] = {key: obj for key, obj in index["artifacts"].items() if obj in objects}
+
+    def size(self) -> int:
+        """Total size of the cached objects, in bytes"""
+        with self.lock():
+            return sum(entry["size"] for entry in self._load_index()["objects"].values())
@@ -0,0 +1,156 @@
+"""
+Resolves the served model from the MLflow model registry and keeps it up to date.
+
+The watcher resolves a registered model alias (e.g. yolo11n@Champion) to a model version, downloads the weights
+logged by Trainer.train_model (weights/best.pt of the version's run), or the fastest of the optimized variants logged
+with them that is accurate enough, and hands them to a callback. The downloads go through the model cache (see
+src/model_cache.py): a version already downloaded, by this process or another one sharing the directory, is not
+downloaded again.
+In the background it polls the alias and calls the callback again whenever the alias moves to another version.
+"""
+
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Callable
+
+from mlflow import MlflowClient
+from mlflow.entities.model_registry import ModelVersion
+
+from src.model_cache import ModelCache
+from src.variants import ARTIFACT_DIR as VARIANTS_ARTIFACT_DIR
+from src.variants import REFERENCE, select_variant
+from src.variants import TABLE_NAME as VARIANTS_TABLE
+
+logger = logging.getLogger(__name__)
+
+WEIGHTS_ARTIFACT_PATH = "weights/best.pt"
+
+
+class RegistryModelWatcher:
+    def __init__(
+        self,
+        model_name: str,
+        alias: str,
+        on_new_version: Callable[[ModelVersion, Path], None],
+        download_dir: str | Path,
+        poll_interval: float = 60,
+        client: MlflowClient | None = None,
+        variant_tolerance: float | None = None,
+        variant_batch_size: int = 1,
+        cache_max_bytes: int | None = None,
+    ) -> None:
+        """
+        Initializes the watcher.
+
+        Args:
+            model_name (str): Name of the registered model (e.g. yolo11n).
+            alias (str): Alias to follow (e.g. Champion).
+            on_new_version (Callable): Called with the model version and the local weights path each time the alias moves.
+                It should load and warm up the model before swapping it in.
+            download_dir (str, Path): Model cache directory where the weights are downloaded.
+            poll_interval (float): Seconds between two alias lookups in the background.
+            client (MlflowClient): Client to use, a default one is created otherwise.
+            variant_tolerance (float): Serve the fastest optimized variant logged with the version (see src/variants.py)
+                whose accuracy drop stays within this tolerance, instead of the .pt weights. None for the .pt weights.
+            variant_batch_size (int): Batch size the variants are compared at.
+            cache_max_bytes (int): Size of the model cache above which the least recently used artifacts are evicted,
+                None for no limit.
+        """
+        self.model_name = model_name
+        self.alias = alias
+        self.on_new_version = on_new_version
+        self.download_dir = Path(download_dir)
+        self.poll_interval = poll_interval
+        self.client = client or MlflowClient()
+        self.variant_tolerance = variant_tolerance
+        self.variant_batch_size = variant_batch_size
+        self.cache = ModelCache(download_dir, max_bytes=cache_max_bytes)
+
+        self.current_version: ModelVersion | None = None
+        self.current_weights: Path | None = None  # .pt weights of the current version, also when a variant is served
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def resolve(self) -> ModelVersion:
+        """Returns the model version currently pointed at by the alias"""
+        return self.client.get_model_version_by_alias(name=self.model_name, alias=self.alias)
+
+    def fetch(self, model_version: ModelVersion) -> Path:
+        """Downloads the weights (or the selected variant) of a model version and returns their local path"""
+        artifact_path = WEIGHTS_ARTIFACT_PATH
+        if self.variant_tolerance is not None:
+            artifact_path = self.select_variant(model_version)
+        return self.download(model_version, artifact_path)
+
+    def download(self, model_version: ModelVersion, artifact_path: str) -> Path:
+        """Local path of an artifact of the version's run, from the model cache"""
+        return self.cache.get(
+            self.model_name,
+            model_version.version,
+            artifact_path,
+            lambda dst_path: self.client.download_artifacts(model_version.run_id, artifact_path, str(dst_path)),
+        )
+
+    def select_variant(self, model_version: ModelVersion) -> str:
+        """Artifact of the fastest variant within the tolerance, the .pt weights if the version has no variants"""
+        try:
+            table_path = self.download(model_version, f"{VARIANTS_ARTIFACT_DIR}/{VARIANTS_TABLE}")
+        except Exception:
+            logger.warning(f"No variants logged with {self.model_name} version {model_version.version}, serving .pt")
+            return WEIGHTS_ARTIFACT_PATH
+        table = json.loads(table_path.read_text())
+        variant = select_variant(table, self.variant_tolerance, self.variant_batch_size)
+        logger.info(f"Variant {variant['variant']} selected (accuracy drop {variant['accuracy_drop']:.4f})")
+        if variant["variant"] == REFERENCE:
+            return WEIGHTS_ARTIFACT_PATH
+        return f"{VARIANTS_ARTIFACT_DIR}/{variant['file']}"
+
+    def load_current(self) -> tuple[ModelVersion, Path]:
+        """Resolves and downloads the current version without calling on_new_version (used at startup)"""
+        model_version = self.resolve()
+        weights_path = self.fetch(model_version)
+        self.current_weights = self.download(model_version, WEIGHTS_ARTIFACT_PATH)  # Already there unless a variant
+        self.current_version = model_version
+        return model_version, weights_path
+
+    def check(self) -> bool:
+        """
+        Resolves the alias and loads the model if it points to a new version.
+
+        Returns:
+            bool: True if a new version was loaded.
+        """
+        model_version = self.resolve()
+        if self.current_version is not None and model_version.version == self.current_version.version:
+            return False
+
+        logger.info(f"Loading {self.model_name}@{self.alias} (version {model_version.version})")
+        weights_path = self.fetch(model_version)
+        pt_weights = self.download(model_version, WEIGHTS_ARTIFACT_PATH)  # Already there unless a variant
+        self.on_new_version(model_version, weights_path)
+        self.current_version, self.current_weights = model_version, pt_weights
+        logger.info(f"Now serving {self.model_name} version {model_version.version}")
+        return True
+
+    def _poll(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.check()
+            except Exception:
+                # Keep serving the current model, the next poll will try again
+                logger.exception(f"Failed to refresh {self.model_name}@{self.alias}")
+
+    def start(self) -> None:
+        """Starts polling the alias in a background thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._poll, name="model-registry-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,112 @@
+"""
+Vectorized postprocessing of YOLO results and response encodings.
+
+The whole boxes tensor of a result is converted in one shot into columns (xyxy, confidence, class_id),
+instead of indexing the tensor box by box. The columns are then either formatted as the JSON response of the
+predict API, or packed into a compact binary payload:
+
+    header: magic b"YOLD", uint32 number of boxes, float32 inference time (ms)   (little-endian, 12 bytes)
+    body:   float32 array of shape (n_boxes, 6): x1, y1, x2, y2, confidence, class_id
+"""
+
+import json
+import struct
+from dataclasses import dataclass
+
+import numpy as np
+
+PACKED_MEDIA_TYPE = "application/x-yolo-detections"
+PACKED_MAGIC = b"YOLD"
+PACKED_HEADER = struct.Struct("<4sIf")
+
+
+@dataclass
+class Detections:
+    xyxy: np.ndarray  # (n, 4) float32
+    confidence: np.ndarray  # (n,) float32
+    class_id: np.ndarray  # (n,) int64
+    names: dict[int, str]
+    inference_time: float
+    decode_time: float | None = None
+    preprocess_time: float | None = None
+    postprocess_time: float | None = None  # only reported in the metrics
+    track_id: np.ndarray | None = None  # (n,) int64, when the result comes from a tracker
+
+    @classmethod
+    def from_result(cls, result) -> "Detections":
+        """Converts an ultralytics result with a single device-to-host copy"""
+        data = result.boxes.data.cpu().numpy()  # (n, 6) or (n, 7) when tracking: xyxy, [track id], conf, cls
+        return cls(
+            xyxy=data[:, :4],
+            confidence=data[:, -2],
+            class_id=data[:, -1].astype(np.int64),
+            names=result.names,
+            inference_time=float(result.speed["inference"]),
+            track_id=data[:, 4].astype(np.int64) if data.shape[1] == 7 else None,
+        )
+
+    def __len__(self) -> int:
+        return len(self.class_id)
+
+    def rescale(self, factors: tuple[float, float], offset: tuple[float, float], size: tuple[int, int]) -> None:
+        """Maps the boxes back to the original image: (xy - offset) * factors, clipped to size (width, height)"""
+        self.xyxy = (self.xyxy - np.tile(offset, 2)) * np.tile(factors, 2)
+        self.xyxy[:, [0, 2]] = self.xyxy[:, [0, 2]].clip(0, size[0])
+        self.xyxy[:, [1, 3]] = self.xyxy[:, [1, 3]].clip(0, size[1])
+        self.xyxy = self.xyxy.astype(np.float32)
+
+    @property
+    def nbytes(self) -> int:
+        return self.xyxy.nbytes + self.confidence.nbytes + self.class_id.nbytes
+
+    def to_dict(self) -> dict:
+        """JSON response of the predict API"""
+        names = self.names
+        boxes = [
+            {"xyxy": xyxy, "confidence": confidence, "class_id": class_id, "class_name": names[class_id]}
+            for xyxy, confidence, class_id in zip(self.xyxy.tolist(), self.confidence.tolist(), self.class_id.tolist())
+        ]
+        if self.track_id is not None:
+            for box, track_id in zip(boxes, self.track_id.tolist()):
+                box["track_id"] = track_id
+        response = {"boxes": boxes, "inference_time": self.inference_time}
+        if self.decode_time is not None:
+            response["decode_time"] = self.decode_time
+        if self.preprocess_time is not None:
+            response["preprocess_time"] = self.preprocess_time
+        return response
+
+    def to_packed(self) -> bytes:
+        """Binary response, see the module docstring for the layout"""
+        rows = np.empty((len(self), 6), dtype="<f4")
+        rows[:, :4] = self.xyxy
+        rows[:, 4] = self.confidence
+        rows[:, 5] = self.class_id
+        return PACKED_HEADER.pack(PACKED_MAGIC, len(self), self.inference_time) + rows.tobytes()
+
+    def class_names_header(self) -> str:
+        """Names of the classes present in the packed payload, as JSON"""
+        return json.dumps({int(i): self.names[int(i)] for i in np.unique(self.class_id)})
+
+
+def decode_packed(payload: bytes, class_names: dict | None = None) -> dict:
+    """Decodes a packed payload into the JSON response format (client side)"""
+    magic, n_boxes, inference_time = PACKED_HEADER.unpack_from(payload)
+    if magic != PACKED_MAGIC:
+        raise ValueError("Not a packed detections payload")
+    rows = np.frombuffer(payload, dtype="<f4", count=n_boxes * 6, offset=PACKED_HEADER.size).reshape(n_boxes, 6)
+    if class_names is not None:
+        class_names = {int(i): name for i, name in class_names.items()}  # JSON header has string keys
+    boxes = []
+    for row in rows.tolist():
+        class_id = int(row[5])
+        box = {"xyxy": row[:4], "confidence": row[4], "class_id": class_id}
+        if class_names is not None:
+            box["class_name"] = class_names[class_id]
+        boxes.append(box)
+    return {"boxes": boxes, "inference_time": inference_time}
+
+
+def accepts_packed(accept_header: str | None) -> bool:
+    """Content negotiation: whether the client asked for the binary encoding"""
+    return bool(accept_header) and PACKED_MEDIA_TYPE in accept_header
@@ -0,0 +1,118 @@
+"""
+Promotion gate of the trained models.
+
+Before a candidate gets an alias, it is evaluated next to the current Champion, in the same process and on the same
+machine, so that their numbers are comparable:
+
+- accuracy on the held-out test split (never seen during training or model selection), with the batched Ultralytics
+  validation, logged as test/<metric>
+- CPU latency and throughput of predict (preprocessing, inference and NMS) at fixed batch sizes, on synthetic images at
+  the training image size after a warm-up, logged as latency/batch_<n>_ms (median) and throughput/batch_<n>_ips
+
+The candidate is promoted only if it is more accurate than the Champion and, at every batch size, its latency stays
+within the budget: at most latency_budget (relative) slower than the Champion, and under max_latency_ms if set.
+"""
+
+import time
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+
+def has_test_split(data_yaml: str | Path) -> bool:
+    with open(data_yaml) as f:
+        return bool(yaml.safe_load(f).get("test"))
+
+
+def evaluate_split(
+    model, data_yaml: str | Path, imgsz: int, device: str | int = "cpu", batch: int = 16, split: str = "test"
+) -> dict:
+    """Metrics of a YOLO model (weights or export) on a split of data_yaml, prefixed with the split"""
+    results = model.val(
+        data=str(data_yaml), split=split, imgsz=imgsz, batch=batch, device=device, plots=False, verbose=False
+    )
+    return {
+        f"{split}/" + name.replace("(", "").replace(")", ""): float(value)
+        for name, value in results.results_dict.items()
+    }
+
+
+def measure_latency(model, imgsz: int, batch_sizes: list[int], iterations: int = 10, warmup: int = 2) -> dict:
+    """
+    CPU latency and throughput of model.predict at each batch size.
+
+    Args:
+        model: YOLO model (anything with a predict method taking a list of images).
+        iterations (int): Timed predictions per batch size, the median is reported.
+        warmup (int): Untimed predictions before, for the lazy initializations and caches.
+    """
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 256, (imgsz, imgsz, 3), dtype=np.uint8) for _ in range(max(batch_sizes))]
+    metrics = {}
+    for batch_size in batch_sizes:
+        batch = images[:batch_size]
+        times = []
+        for i in range(warmup + iterations):
+            start = time.perf_counter()
+            model.predict(batch, imgsz=imgsz, device="cpu", verbose=False)
+            if i >= warmup:
+                times.append(time.perf_counter() - start)
+        latency = float(np.median(times))
+        metrics[f"latency/batch_{batch_size}_ms"] = latency * 1000
+        metrics[f"throughput/batch_{batch_size}_ips"] = batch_size / latency
+    return metrics
+
+
+def evaluate_model(
+    weights: str | Path,
+    data_yaml: str | Path,
+    imgsz: int,
+    device: str | int,
+    batch_sizes: list[int],
+    iterations: int = 10,
+) -> dict:
+    """Test split metrics (if the dataset has one) and CPU latency of the weights"""
+    from ultralytics import YOLO
+
+    model = YOLO(weights)
+    metrics = evaluate_split(model, data_yaml, imgsz, device) if has_test_split(data_yaml) else {}
+    return {**metrics, **measure_latency(model, imgsz, batch_sizes, iterations)}
+
+
+def promotion_decision(
+    candidate: dict,
+    champion: dict,
+    key_metric: str,
+    batch_sizes: list[int],
+    latency_budget: float = 0.1,
+    max_latency_ms: float | None = None,
+) -> tuple[bool, list[str]]:
+    """
+    Whether the candidate should be promoted over the champion, and why.
+
+    Args:
+        candidate (dict), champion (dict): Metrics of the models, see evaluate_model. The accuracy is compared on
+            test/<key_metric>, or on key_metric (validation) if one of them was not evaluated on a test split.
+        latency_budget (float): Maximum relative latency increase over the champion, at each batch size.
+        max_latency_ms (float): Maximum latency at each batch size, None for no limit.
+    """
+    accuracy_key = f"test/{key_metric}"
+    if accuracy_key not in candidate or accuracy_key not in champion:
+        accuracy_key = key_metric
+    reasons = []
+    accuracy, champion_accuracy = candidate.get(accuracy_key, 0), champion.get(accuracy_key, 0)
+    if accuracy <= champion_accuracy:
+        reasons.append(f"{accuracy_key} {accuracy:.4f} not better than the champion's {champion_accuracy:.4f}")
+
+    for batch_size in batch_sizes:
+        key = f"latency/batch_{batch_size}_ms"
+        latency, champion_latency = candidate[key], champion.get(key)
+        if champion_latency is not None and latency > champion_latency * (1 + latency_budget):
+            reasons.append(
+                f"batch {batch_size}: {latency:.1f} ms, over {1 + latency_budget:.0%} of the champion's "
+                f"{champion_latency:.1f} ms"
+            )
+        if max_latency_ms is not None and latency > max_latency_ms:
+            reasons.append(f"batch {batch_size}: {latency:.1f} ms, over the {max_latency_ms:.1f} ms limit")
+    return not reasons, reasons
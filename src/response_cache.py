@@ -0,0 +1,103 @@
+"""
+Content-addressed cache of prediction responses.
+
+Responses are keyed by a hash of the decoded image pixels, the model version and the inference parameters,
+so a re-submitted frame skips the forward pass. The cache is bounded both by number of entries and by
+(approximate) memory, evicting the least recently used entries first; entries also expire after a TTL.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024, ttl: float = 300) -> None:
+        """
+        Initializes the cache.
+
+        Args:
+            max_entries (int): Maximum number of cached responses.
+            max_bytes (int): Maximum total size of the cached responses (measured as JSON).
+            ttl (float): Seconds after which an entry expires, 0 to never expire.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[Any, int, float]] = OrderedDict()  # key -> (value, size, expiry)
+        self._bytes = 0
+        # The cache is cleared from the registry watcher thread
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(image_bytes: bytes, model_version: str, params: dict) -> str:
+        """Hash of the decoded image, the model version and the inference parameters"""
+        h = hashlib.blake2b(digest_size=20)
+        h.update(image_bytes)
+        h.update(model_version.encode())
+        h.update(json.dumps(params, sort_keys=True).encode())
+        return h.hexdigest()
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, size, expiry = entry
+            if expiry and expiry < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: Any, size: int | None = None) -> None:
+        """Caches a value, its size is measured as JSON unless given"""
+        if size is None:
+            size = len(json.dumps(value))
+        if size > self.max_bytes:
+            return
+        expiry = time.monotonic() + self.ttl if self.ttl else 0
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expiry)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Drops every entry, e.g. when the served model changes"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.invalidations += 1
+
+    def _remove(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,304 @@
+"""
+Concurrent hyperparameter sweep with successive halving.
+
+Trials are sampled from a search space (learning rate, image size, model size, augmentation...) and trained by a pool
+of processes. Each process is limited to cpu_count // concurrency threads (torch, OpenMP, MKL) and loads the data in
+its own thread (workers=0), so the concurrent trials do not oversubscribe the cores.
+
+Successive halving: every trial is trained for min_epochs, then only the best 1/eta of them go on until eta times more
+epochs, and so on up to max_epochs. The other trials are stopped at the end of their rung, so most of the budget goes
+to the promising configurations. A trial is a single training of max_epochs, stopped at the end of each rung and
+resumed (optimizer, EMA, learning rate schedule) by the next one, so its last rung trains like a run of max_epochs.
+
+The sweep is an MLflow run and each trial a nested run (sweep.* params, the validation metrics and sweep/fitness at
+the end of each rung, weights/best.pt and a status tag). The best trial is returned, to be registered.
+"""
+
+import math
+import multiprocessing
+import os
+import random
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable
+
+import mlflow
+from mlflow import MlflowClient
+from rich.console import Console
+
+THREAD_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+DEFAULT_SPACE = {
+    "model": ["yolo11n", "yolo11s"],
+    "lr0": {"low": 1e-4, "high": 1e-2, "log": True},
+    "imgsz": [320, 480, 640],
+    "mosaic": [0.0, 0.5, 1.0],
+    "fliplr": [0.0, 0.5],
+    "hsv_v": {"low": 0.0, "high": 0.6},
+}
+
+console = Console()
+
+
+def sample_params(space: dict, n_trials: int, seed: int = 42) -> list[dict]:
+    """
+    Random configurations of the search space.
+
+    Args:
+        space (dict): name: list of choices, or {"low", "high", "log"} for a uniform (log-uniform) range.
+    """
+    rng = random.Random(seed)
+    trials = []
+    for _ in range(n_trials):
+        params = {}
+        for name, values in space.items():
+            if isinstance(values, dict):
+                low, high = values["low"], values["high"]
+                if values.get("log"):
+                    params[name] = math.exp(rng.uniform(math.log(low), math.log(high)))
+                else:
+                    params[name] = rng.uniform(low, high)
+            else:
+                params[name] = rng.choice(values)
+        trials.append(params)
+    return trials
+
+
+def rung_epochs(min_epochs: int, max_epochs: int, eta: int) -> list[int]:
+    """Total epochs of the trials at the end of each rung, e.g. 1, 3, 9 for min_epochs=1, max_epochs=9, eta=3"""
+    epochs = [min_epochs]
+    while epochs[-1] * eta < max_epochs:
+        epochs.append(epochs[-1] * eta)
+    if epochs[-1] < max_epochs:
+        epochs.append(max_epochs)
+    return epochs
+
+
+@dataclass
+class TrialTask:
+    """What a worker needs to train a trial for one rung"""
+
+    trial_id: int
+    params: dict
+    rung: int
+    epochs: int  # total epochs of the trial at the end of this rung
+    max_epochs: int  # length of the training (learning rate schedule), the epochs of the last rung
+    weights: str | None  # checkpoint of the previous rung to resume, None to start from the model of params
+    data_yaml: str
+    trial_dir: str
+    device: str | int
+    run_id: str
+    key_metric: str
+    seed: int = 42
+
+
+@dataclass
+class TrialResult:
+    fitness: float
+    metrics: dict[str, float]
+    best: str  # best weights of the rung
+    last: str  # checkpoint to resume in the next rung
+
+
+@dataclass
+class Trial:
+    trial_id: int
+    params: dict
+    run_id: str = ""
+    epochs: int = 0  # trained so far
+    fitness: float = -math.inf
+    weights: str | None = None  # checkpoint of the last rung
+    best: str | None = None
+    status: str = "running"  # running, stopped (by the scheduler), failed, completed
+    history: list[float] = field(default_factory=list)  # fitness at the end of each rung
+
+
+def limit_threads(threads: int) -> None:
+    """Pool initializer: caps the threads of the trials of this process"""
+    for var in THREAD_VARS:
+        os.environ[var] = str(threads)
+    import torch
+
+    torch.set_num_threads(threads)
+
+
+def model_file(model: str) -> str:
+    """Weights (or yaml) of a model name of the search space"""
+    return model if model.endswith((".pt", ".yaml")) else f"{model}.pt"
+
+
+def train_trial(task: TrialTask) -> TrialResult:
+    """Trains a trial for one rung, in a worker process, logging to its nested run"""
+    from ultralytics import YOLO
+
+    save_dir = Path(task.trial_dir) / "train"
+    checkpoint = save_dir / "weights" / f"rung_{task.rung}.pt"
+
+    def stop_at_rung_end(trainer) -> None:
+        # Copied before the end of the training, which strips the optimizer from last.pt
+        if trainer.epoch + 1 == task.epochs < trainer.epochs:
+            shutil.copy(trainer.last, checkpoint)
+            trainer.stop = True
+
+    train_args = {name: value for name, value in task.params.items() if name != "model"}
+    train_args.setdefault("optimizer", "AdamW")  # optimizer=auto ignores lr0
+    # The Ultralytics callback sets the experiment to MLFLOW_EXPERIMENT_NAME (the project directory otherwise), it must
+    # stay the one of the trial run for the next rungs of this process. It logs the epochs of the first rung to the
+    # active run, then stops as its params (the resumed model) change: the rungs are logged by the sweep.
+    experiment_id = mlflow.get_run(task.run_id).info.experiment_id
+    os.environ["MLFLOW_EXPERIMENT_NAME"] = mlflow.get_experiment(experiment_id).name
+    with mlflow.start_run(run_id=task.run_id, experiment_id=experiment_id):
+        model = YOLO(task.weights or model_file(task.params["model"]))
+        model.add_callback("on_model_save", stop_at_rung_end)  # after last.pt is saved, before the next epoch
+        if task.weights:
+            # The arguments of the training are the checkpoint's, only the ones of this machine are given
+            model.train(resume=True, data=task.data_yaml, device=task.device, workers=0, plots=False)
+        else:
+            model.train(
+                data=task.data_yaml,
+                epochs=task.max_epochs,
+                device=task.device,
+                project=task.trial_dir,
+                name=save_dir.name,
+                exist_ok=True,
+                workers=0,
+                close_mosaic=0,
+                plots=False,
+                seed=task.seed,
+                **train_args,
+            )
+        # Validation of the best weights of the trial so far
+        metrics = {name.replace("(", "").replace(")", ""): float(v) for name, v in model.trainer.metrics.items()}
+        best = model.trainer.best
+        last = checkpoint if task.epochs < task.max_epochs else model.trainer.last
+        mlflow.log_artifact(local_path=str(best), artifact_path="weights")
+    return TrialResult(metrics.get(task.key_metric, 0.0), metrics, str(best), str(last))
+
+
+class Sweep:
+    def __init__(
+        self,
+        data_yaml: str | Path,
+        yolo_dir: str | Path,
+        device: str | int = "cpu",
+        space: dict | None = None,
+        n_trials: int = 8,
+        concurrency: int = 2,
+        min_epochs: int = 1,
+        max_epochs: int = 9,
+        eta: int = 3,
+        key_metric: str = "metrics/mAP50-95B",
+        seed: int = 42,
+        train_fn: Callable[[TrialTask], TrialResult] = train_trial,
+    ) -> None:
+        """
+        Args:
+            data_yaml (str, Path): Dataset of the trials.
+            yolo_dir (str, Path): Directory of the runs, one subdirectory per trial.
+            space (dict): Search space, see sample_params. The values other than model are arguments of YOLO.train.
+            n_trials (int): Trials of the first rung.
+            concurrency (int): Trials trained at the same time, each with cpu_count // concurrency threads.
+            min_epochs (int), max_epochs (int), eta (int): Successive halving, see rung_epochs.
+            key_metric (str): Metric ranking the trials (higher is better).
+            train_fn (Callable): Trains a trial for a rung in a worker process (module level function).
+        """
+        self.data_yaml = str(data_yaml)
+        self.yolo_dir = Path(yolo_dir)
+        self.device = device
+        self.space = space or DEFAULT_SPACE
+        self.n_trials = n_trials
+        self.concurrency = concurrency
+        self.threads = max(1, (os.cpu_count() or 1) // concurrency)
+        self.rungs = rung_epochs(min_epochs, max_epochs, eta)
+        self.eta = eta
+        self.key_metric = key_metric
+        self.seed = seed
+        self.train_fn = train_fn
+
+    def run(self, run_name: str = "sweep") -> Trial:
+        """Runs the sweep in a new MLflow run, returns the best trial"""
+        client = MlflowClient()
+        with mlflow.start_run(run_name=run_name) as parent:
+            mlflow.log_params({"n_trials": self.n_trials, "concurrency": self.concurrency, "rungs": str(self.rungs)})
+            trials = [Trial(i, params) for i, params in enumerate(sample_params(self.space, self.n_trials, self.seed))]
+            for trial in trials:
+                trial.run_id = client.create_run(
+                    parent.info.experiment_id,
+                    run_name=f"{run_name}-trial-{trial.trial_id}",
+                    tags={"mlflow.parentRunId": parent.info.run_id},
+                ).info.run_id
+                for name, value in trial.params.items():
+                    # Prefixed: Ultralytics logs its own train arguments (the model is a path after the first rung)
+                    client.log_param(trial.run_id, f"sweep.{name}", value)
+
+            context = multiprocessing.get_context("spawn")  # Thread limits set before torch is imported
+            with ProcessPoolExecutor(self.concurrency, context, limit_threads, (self.threads,)) as executor:
+                alive = trials
+                for rung, epochs in enumerate(self.rungs):
+                    start = time.perf_counter()
+                    self._run_rung(executor, client, alive, rung, epochs)
+                    alive = self._promote(client, alive, last=rung == len(self.rungs) - 1)
+                    console.log(
+                        f"Rung {rung} ({epochs} epochs, {time.perf_counter() - start:.0f}s): "
+                        f"{len(alive)} trials promoted"
+                    )
+
+            finished = [trial for trial in trials if trial.status != "failed"]
+            if not finished:
+                raise RuntimeError("All the trials of the sweep failed")
+            best = max(finished, key=lambda trial: (trial.epochs, trial.fitness))
+            mlflow.set_tag("best_run_id", best.run_id)
+            mlflow.log_metric("best_fitness", best.fitness)
+            mlflow.log_dict({"trials": [asdict(trial) for trial in trials]}, "sweep.json")
+        console.print(f"[green]Best trial {best.trial_id}: {best.fitness:.4f} with {best.params}[/]")
+        return best
+
+    def _run_rung(
+        self, executor: ProcessPoolExecutor, client: MlflowClient, trials: list[Trial], rung: int, epochs: int
+    ) -> None:
+        futures = {}
+        for trial in trials:
+            task = TrialTask(
+                trial_id=trial.trial_id,
+                params=trial.params,
+                rung=rung,
+                epochs=epochs,
+                max_epochs=self.rungs[-1],
+                weights=trial.weights,
+                data_yaml=self.data_yaml,
+                trial_dir=str(self.yolo_dir / f"trial_{trial.trial_id}"),
+                device=self.device,
+                run_id=trial.run_id,
+                key_metric=self.key_metric,
+                seed=self.seed,
+            )
+            futures[executor.submit(self.train_fn, task)] = trial
+
+        for future in as_completed(futures):
+            trial = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                console.print(f"[red]Trial {trial.trial_id} failed: {e}[/]")
+                trial.status = "failed"
+                client.set_tag(trial.run_id, "status", "failed")
+                client.set_terminated(trial.run_id, "FAILED")
+                continue
+            trial.epochs = epochs
+            trial.fitness = result.fitness
+            trial.weights, trial.best = result.last, result.best
+            trial.history.append(result.fitness)
+            for name, value in {**result.metrics, "sweep/fitness": result.fitness}.items():
+                client.log_metric(trial.run_id, name, value, step=epochs)
+
+    def _promote(self, client: MlflowClient, trials: list[Trial], last: bool) -> list[Trial]:
+        """Trials going on to the next rung, the best 1/eta of the ones that did not fail"""
+        ranked = sorted((trial for trial in trials if trial.status == "running"), key=lambda t: t.fitness, reverse=True)
+        promoted = [] if last else ranked[: max(1, math.ceil(len(ranked) / self.eta))]
+        for trial in ranked[len(promoted) :]:
+            trial.status = "completed" if last else "stopped"
+            client.set_tag(trial.run_id, "status", trial.status)
+            client.set_terminated(trial.run_id)
+        return promoted
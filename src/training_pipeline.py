@@ -6,6 +6,19 @@ from dotenv import load_dotenv
 from rich.console import Console
 import boto3
 from config import config
+from dataset_stats import STATS_NAME, compare_stats, load_stats
+from sweep import Sweep
+from checkpoints import CheckpointUploader, latest_checkpoint
+from promotion import evaluate_model, evaluate_split, measure_latency, promotion_decision
+from variants import (
+    ARTIFACT_DIR,
+    REFERENCE,
+    TABLE_NAME,
+    build_variants,
+    calibration_sample,
+    variant_table,
+    write_sample_yaml,
+)
 
 load_dotenv()
 KEY_METRIC = "metrics/mAP50-95B"
@@ -20,6 +33,7 @@ class Trainer:
         data_yaml: str | Path,
         yolo_dir: str | Path,
         device: str | int,
+        dataset_stats: str | Path | None = None,
     ) -> None:
         """
         Initializes the trainer wraper.
@@ -29,11 +43,13 @@ class Trainer:
             data_yaml (str, Path): Path to the data yaml configuration file.
             yolo_dir (str, Path): Directory where the logs and model will be temporarily stored (overwriting past runs).
             device (str, int): The device to run the model on (e.g. cpu, cuda:0, cuda:1, etc.). Either the device name or a number indicating which GPU to use
+            dataset_stats (str, Path): Statistics of the dataset written by the data pipeline, logged with the run.
         """
         self.model_name = model_name
         self.data_yaml = Path(data_yaml)
         self.yolo_dir = Path(yolo_dir)
         self.device = device
+        self.dataset_stats = Path(dataset_stats) if dataset_stats is not None else None
 
         s3_client = boto3.client(
             "s3",
@@ -46,27 +62,51 @@ class Trainer:
         except Exception:
             s3_client.create_bucket(Bucket="mlflow")
 
-    def train_model(self) -> None:
+    def train_model(self, resume: bool = False) -> None:
         """
         Trains the model configured in __init__.
         Logs the results in yolo_dir (unused; you can delete this freely) and in mlflow for latter retrieval.
+        A checkpoint is uploaded to the run every config.CHECKPOINT_EVERY epochs (see src/checkpoints.py).
+
+        Args:
+            resume (bool): Resume the last interrupted training of the model from its checkpoint, in the same run.
         """
-        with mlflow.start_run(run_name=self.model_name, log_system_metrics=True) as run:
-            model = YOLO(model=self.model_name + ".pt")
-
-            # Training + Validation done automatically by ultralytics
-            model.train(
-                data=str(self.data_yaml),
-                epochs=config.EPOCHS,
-                device=self.device,
-                project=str(self.yolo_dir),  # dir to save runs
-                close_mosaic=0,
-                seed=42,
+        run_id, checkpoint = None, None
+        if resume:
+            run_id, checkpoint = latest_checkpoint(self.model_name, self.yolo_dir / "resume")
+
+        with mlflow.start_run(run_id=run_id, run_name=self.model_name, log_system_metrics=True) as run:
+            if checkpoint is None:
+                self.log_dataset_stats()
+            uploader = CheckpointUploader(
+                run.info.run_id, every=config.CHECKPOINT_EVERY, resumed=checkpoint is not None
             )
+            try:
+                if checkpoint is not None:
+                    model = YOLO(model=checkpoint)
+                    uploader.attach(model)
+                    # Same arguments as the interrupted training (stored in the checkpoint)
+                    model.train(resume=True, data=str(self.data_yaml), device=self.device)
+                else:
+                    model = YOLO(model=self.model_name + ".pt")
+                    uploader.attach(model)
+
+                    # Training + Validation done automatically by ultralytics
+                    model.train(
+                        data=str(self.data_yaml),
+                        epochs=config.EPOCHS,
+                        imgsz=config.IMAGE_SIZE,
+                        device=self.device,
+                        project=str(self.yolo_dir),  # dir to save runs
+                        close_mosaic=0,
+                        seed=42,
+                    )
+            finally:
+                uploader.close()
 
             # upload weights
             mlflow.log_artifact(
-                local_path=self.yolo_dir / "train/weights/best.pt",
+                local_path=model.trainer.best,
                 artifact_path="weights",
                 run_id=run.info.run_id,
             )
@@ -77,13 +117,131 @@ class Trainer:
                 run_id=run.info.run_id,
             )
 
-    def register_model(self) -> None:
+    def sweep(self) -> str:
+        """
+        Hyperparameter sweep (config.SWEEP_*, see src/sweep.py) instead of a single training.
+        Returns the run of the best trial, with the dataset statistics and the environment logged like train_model.
+        """
+        sweep = Sweep(
+            data_yaml=self.data_yaml,
+            yolo_dir=self.yolo_dir / "sweep",
+            device=self.device,
+            space=config.SWEEP_SPACE,
+            n_trials=config.SWEEP_TRIALS,
+            concurrency=config.SWEEP_CONCURRENCY,
+            min_epochs=config.SWEEP_MIN_EPOCHS,
+            max_epochs=config.SWEEP_MAX_EPOCHS,
+            eta=config.SWEEP_ETA,
+            key_metric=KEY_METRIC,
+        )
+        best = sweep.run(run_name=f"{self.model_name}-sweep")
+        with mlflow.start_run(run_id=best.run_id):
+            self.log_dataset_stats()
+            mlflow.log_artifact(local_path="requirements.txt", artifact_path="environment")
+        return best.run_id
+
+    def log_dataset_stats(self) -> None:
+        """
+        Logs the statistics of the dataset to the active run and compares them with the ones of the dataset the
+        Champion was trained on. The drift level is set as the dataset_drift tag, large shifts are printed.
         """
-        Registers the model and assigns an alias.
-        The alias can either be Champion if there is no earlier run of the model or Challenger if it performs better than the current Champion.
+        if self.dataset_stats is None or not self.dataset_stats.exists():
+            console.print("[yellow]No dataset statistics, run the data pipeline to compute them[/]")
+            return
+        stats = load_stats(self.dataset_stats)
+        mlflow.log_dict(stats, f"dataset/{STATS_NAME}")
+        mlflow.log_params(
+            {
+                f"dataset.{split}.{key}": split_stats[key]
+                for split, split_stats in stats["splits"].items()
+                for key in ("images", "boxes")
+            }
+        )
+
+        try:  # Statistics logged with the Champion's run
+            champion_version = MlflowClient().get_model_version_by_alias(self.model_name, "Champion")
+            champion_stats = load_stats(
+                mlflow.artifacts.download_artifacts(
+                    run_id=champion_version.run_id, artifact_path=f"dataset/{STATS_NAME}"
+                )
+            )
+        except Exception:
+            console.print("Couldn't get the dataset statistics of the champion, no drift check")
+            return
+
+        drift = compare_stats(stats, champion_stats)
+        mlflow.log_dict(drift, "dataset/drift.json")
+        mlflow.set_tag("dataset_drift", drift["level"])
+        shifted = [f"{f['split']} {f['feature']} (PSI {f['psi']})" for f in drift["features"] if f["level"] == "large"]
+        if shifted:
+            console.print(f"[red]Large shift from the champion's dataset: {', '.join(shifted)}[/]")
+        else:
+            console.print(f"[green]Dataset drift from the champion's dataset: {drift['level']}[/]")
+
+    @staticmethod
+    def train_imgsz(run_id: str) -> int:
+        """Image size the weights of a run were trained at: sampled by the sweep for a trial, config.IMAGE_SIZE else"""
+        return int(mlflow.get_run(run_id).data.params.get("sweep.imgsz", config.IMAGE_SIZE))
+
+    def evaluate(self, run_id: str) -> dict:
+        """Test split accuracy and CPU latency of the weights of a run at their training size (see src/promotion.py)"""
+        weights = mlflow.artifacts.download_artifacts(
+            run_id=run_id, artifact_path="weights/best.pt", dst_path=str(self.yolo_dir / "promotion" / run_id)
+        )
+        return evaluate_model(
+            weights,
+            self.data_yaml,
+            imgsz=self.train_imgsz(run_id),
+            device=self.device,
+            batch_sizes=config.PROMOTION_BATCH_SIZES,
+            iterations=config.PROMOTION_ITERATIONS,
+        )
+
+    def build_variants(self, run_id: str | None = None) -> None:
+        """
+        Optimized variants (FP16 and INT8 ONNX, fused graph) of the weights of run_id (the last run by default), each
+        calibrated on a sample of the train split (see src/variants.py). The variants and their accuracy-versus-latency
+        table are logged to the run (variants/).
+        """
+        run_id = run_id or mlflow.last_active_run().info.run_id
+        output_dir = self.yolo_dir / "variants" / run_id
+        weights = mlflow.artifacts.download_artifacts(
+            run_id=run_id, artifact_path="weights/best.pt", dst_path=str(output_dir)
+        )
+        imgsz = self.train_imgsz(run_id)
+        images = calibration_sample(self.data_yaml, config.VARIANT_SAMPLE)
+        files = build_variants(weights, output_dir, images, imgsz=imgsz, variants=config.VARIANTS)
+
+        # Calibration run of each variant: accuracy on the sample and CPU latency
+        sample_yaml = write_sample_yaml(self.data_yaml, images, output_dir / "calibration.yaml")
+        results = {}
+        for name, path in files.items():
+            model = YOLO(path, task="detect")
+            results[name] = {
+                **evaluate_split(model, sample_yaml, imgsz=imgsz, split="val"),
+                **measure_latency(model, imgsz, config.PROMOTION_BATCH_SIZES, config.PROMOTION_ITERATIONS),
+            }
+        table = variant_table(files, results, key_metric=f"val/{KEY_METRIC}")
+
+        for name, path in files.items():
+            if name != REFERENCE:  # The reference is weights/best.pt
+                mlflow.log_artifact(local_path=str(path), artifact_path=ARTIFACT_DIR, run_id=run_id)
+        mlflow.log_dict(table, f"{ARTIFACT_DIR}/{TABLE_NAME}", run_id=run_id)
+        for row in table:
+            batch_1 = row.get("latency/batch_1_ms", float("nan"))
+            console.print(
+                f"{row['variant']:<12}{row['size_mb']:>8.1f} MB  accuracy drop {row['accuracy_drop']:+.4f}  "
+                f"batch 1: {batch_1:.1f} ms"
+            )
+
+    def register_model(self, run_id: str | None = None) -> None:
+        """
+        Registers the model of run_id (the last run by default) and assigns an alias.
+        The alias can either be Champion if there is no earlier run of the model or Challenger if it passes the promotion gate against the current Champion:
+        better accuracy on the test split, within the latency budget (see src/promotion.py). Both evaluations are logged to the run.
         An alias is unique in mlflow. The challenger alias refers to the last challenger. All the challenger models are identified via the "status" tag
         """
-        run_id = mlflow.last_active_run().info.run_id
+        run_id = run_id or mlflow.last_active_run().info.run_id
         model_version = mlflow.register_model(model_uri=f"runs:/{run_id}/weights/best.pt", name=self.model_name)
         client = MlflowClient()
 
@@ -94,15 +252,41 @@ class Trainer:
             console.print("Couldn't get champion. Current model will be crowned")
             pass
 
+        # Validation metrics of the candidate and the champion, in a single query
+        run_ids = [run_id] + ([champion_version.run_id] if champion_version is not None else [])
+        runs = mlflow.search_runs(
+            filter_string=f"attributes.run_id IN ({', '.join(repr(r) for r in run_ids)})",
+            search_all_experiments=True,
+            output_format="list",
+        )
+        metrics = {run.info.run_id: run.data.metrics for run in runs}
+
+        evaluation = self.evaluate(run_id)
+        mlflow.log_metrics(evaluation, run_id=run_id)
+        current_metrics = {**metrics[run_id], **evaluation}
+
         if champion_version is None:
             client.set_registered_model_alias(name=self.model_name, alias="Champion", version=model_version.version)
             client.set_registered_model_tag(name=self.model_name, key="status", value="Champion")
+            client.set_tag(run_id, "promotion", "Champion")
         else:
-            current_metrics = mlflow.get_run(run_id).data.metrics
-            champion_metrics = mlflow.get_run(champion_version.run_id).data.metrics
+            champion_metrics = {**metrics.get(champion_version.run_id, {}), **self.evaluate(champion_version.run_id)}
+            promote, reasons = promotion_decision(
+                current_metrics,
+                champion_metrics,
+                key_metric=KEY_METRIC,
+                batch_sizes=config.PROMOTION_BATCH_SIZES,
+                latency_budget=config.LATENCY_BUDGET,
+                max_latency_ms=config.MAX_LATENCY_MS,
+            )
+            mlflow.log_dict(
+                {"candidate": current_metrics, "champion": champion_metrics, "promoted": promote, "reasons": reasons},
+                "promotion.json",
+                run_id=run_id,
+            )
 
             console.print(f"current : {current_metrics}\nchampion : {champion_metrics}")
-            if current_metrics.get(KEY_METRIC, 0) > champion_metrics.get(KEY_METRIC, 0):
+            if promote:
                 console.print("[green]Current model is better than champion: setting alias Challenger[/]")
                 client.set_registered_model_alias(
                     name=self.model_name,
@@ -110,8 +294,10 @@ class Trainer:
                     version=model_version.version,
                 )
                 client.set_registered_model_tag(name=self.model_name, key="status", value="Challenger")
+                client.set_tag(run_id, "promotion", "Challenger")
             else:
-                console.print("[green]Current model is worse than champion: not setting alias[/]")
+                console.print(f"[green]Current model not promoted: {'; '.join(reasons)}[/]")
+                client.set_tag(run_id, "promotion", "rejected")
 
 
 def main():
@@ -120,12 +306,21 @@ def main():
         data_yaml=Path.cwd() / config.DATA_YAML,
         yolo_dir=Path.cwd() / config.YOLO_DIR_TMP,
         device=config.DEVICE,
+        dataset_stats=Path.cwd() / config.DATASET_STATS,
     )
     # PIPELINE ML 4 & 5 : Training + Evaluation
-    trainer.train_model()
+    run_id = None
+    if config.SWEEP:
+        run_id = trainer.sweep()  # Only the best trial is registered
+    else:
+        trainer.train_model(resume=config.RESUME)
+
+    # Optimized variants of the weights, for serving
+    if config.VARIANTS:
+        trainer.build_variants(run_id)
 
     # PIPELINE ML 6 : Model Validation
-    trainer.register_model()
+    trainer.register_model(run_id)
 
 
 if __name__ == "__main__":
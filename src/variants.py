@@ -0,0 +1,229 @@
+"""
+Optimized variants of the trained weights.
+
+After training, the weights are exported to ONNX and turned into variants that are smaller or faster on CPU:
+
+- onnx: FP32 export, with dynamic batch and image dimensions like the serving backends (see src/backends.py)
+- onnx-fp16: weights stored in FP16, half the size (inputs and outputs stay FP32)
+- onnx-int8: static INT8 quantization (QDQ), the activation ranges calibrated on a sample of the train split
+- onnx-fused: graph pre-optimized by ONNX Runtime (constant folding, Conv + BN + activation fusions) and saved, so the
+  serving sessions load it without optimizing it again
+
+Each variant, and the torch weights as reference, gets a calibration run on the same sample of the train split:
+accuracy (Ultralytics validation on the sample) and CPU latency at fixed batch sizes. The accuracy-versus-latency table
+(variants.json) is logged with the variants in the run (variants/), and select_variant picks from it the fastest
+variant whose accuracy drop stays within a tolerance, so serving can switch variants without retraining.
+
+Pruning is left out: without fine-tuning it costs accuracy, and unstructured sparsity does not speed up dense CPU
+kernels.
+"""
+
+import os
+import random
+import shutil
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+VARIANTS = ("onnx", "onnx-fp16", "onnx-int8", "onnx-fused")
+REFERENCE = "torch"
+ARTIFACT_DIR = "variants"
+TABLE_NAME = "variants.json"
+FILE_NAMES = {
+    "onnx": "model.onnx",
+    "onnx-fp16": "model.fp16.onnx",
+    "onnx-int8": "model.int8.onnx",
+    "onnx-fused": "model.fused.onnx",
+}
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def list_images(source: str | Path) -> list[Path]:
+    """Images of a split as Ultralytics reads it: a directory, or an index file (./ relative to the file)"""
+    source = Path(source)
+    if source.is_dir():
+        return sorted(path for path in source.rglob("*") if path.suffix.lower() in IMAGE_SUFFIXES)
+    parent = str(source.parent) + os.sep
+    lines = source.read_text().splitlines()
+    return [Path(line.replace("./", parent, 1) if line.startswith("./") else line) for line in lines if line]
+
+
+def write_sample_yaml(data_yaml: str | Path, images: list[Path], path: str | Path) -> Path:
+    """Dataset yaml validating on the images only (index file next to it), with the classes of data_yaml"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    index = path.with_suffix(".txt")
+    index.write_text("".join(f"{Path(image).resolve()}\n" for image in images))
+    with open(data_yaml) as f:
+        data = yaml.safe_load(f)
+    with open(path, "w") as f:
+        yaml.safe_dump({"train": str(index), "val": str(index), "names": data["names"]}, f)
+    return path
+
+
+def calibration_sample(data_yaml: str | Path, size: int, seed: int = 42) -> list[Path]:
+    """Random images of the train split of data_yaml"""
+    from ultralytics.data.utils import check_det_dataset
+
+    train = check_det_dataset(str(data_yaml))["train"]
+    images = [image for source in (train if isinstance(train, list) else [train]) for image in list_images(source)]
+    return sorted(random.Random(seed).sample(images, min(size, len(images))))
+
+
+def copy_metadata(source: Path, target: Path) -> None:
+    """Ultralytics metadata (names, stride, imgsz...) of the export, lost by some ONNX Runtime transforms"""
+    import onnx
+
+    metadata = {prop.key: prop.value for prop in onnx.load(str(source), load_external_data=False).metadata_props}
+    model = onnx.load(str(target))
+    onnx.helper.set_model_props(model, metadata)
+    onnx.save(model, str(target))
+
+
+class ImageCalibrationReader:
+    """Calibration batches of ONNX Runtime static quantization: the images letterboxed like Ultralytics predict"""
+
+    def __init__(self, images: list[Path], imgsz: int, input_name: str) -> None:
+        self.images = iter(images)
+        self.imgsz = imgsz
+        self.input_name = input_name
+
+    def get_next(self) -> dict | None:
+        import cv2
+        from ultralytics.data.augment import LetterBox
+
+        for path in self.images:
+            image = cv2.imread(str(path))
+            if image is None:
+                continue
+            image = LetterBox((self.imgsz, self.imgsz), auto=False)(image=image)
+            # BGR HWC uint8 -> RGB CHW float
+            array = np.ascontiguousarray(image[..., ::-1].transpose(2, 0, 1)[None], dtype=np.float32) / 255
+            return {self.input_name: array}
+        return None
+
+    def rewind(self) -> None:  # Not needed: a single calibration pass
+        pass
+
+
+def export_onnx(weights: Path, path: Path, imgsz: int) -> Path:
+    from ultralytics import YOLO
+
+    exported = YOLO(weights).export(format="onnx", imgsz=imgsz, dynamic=True)
+    shutil.move(exported, path)
+    return path
+
+
+def convert_fp16(onnx_path: Path, path: Path) -> Path:
+    import onnx
+    from onnxruntime.transformers.float16 import convert_float_to_float16
+
+    model = convert_float_to_float16(onnx.load(str(onnx_path)), keep_io_types=True)
+    onnx.save(model, str(path))
+    return path
+
+
+def quantize_int8(onnx_path: Path, path: Path, images: list[Path], imgsz: int) -> Path:
+    import onnxruntime as ort
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    input_name = ort.InferenceSession(str(onnx_path), providers=["CPUExecutionProvider"]).get_inputs()[0].name
+    # Shape inference and graph cleanup first, so that more nodes are quantized (the symbolic shape inference does not
+    # handle the dynamic dimensions of the export)
+    preprocessed = path.with_suffix(".pre.onnx")
+    quant_pre_process(str(onnx_path), str(preprocessed), skip_symbolic_shape=True)
+    quantize_static(
+        str(preprocessed),
+        str(path),
+        ImageCalibrationReader(images, imgsz, input_name),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+        calibrate_method=CalibrationMethod.MinMax,
+    )
+    preprocessed.unlink()
+    copy_metadata(onnx_path, path)
+    return path
+
+
+def fuse_graph(onnx_path: Path, path: Path) -> Path:
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+    options.optimized_model_filepath = str(path)
+    ort.InferenceSession(str(onnx_path), options, providers=["CPUExecutionProvider"])
+    copy_metadata(onnx_path, path)
+    return path
+
+
+def build_variants(
+    weights: str | Path, output_dir: str | Path, images: list[Path], imgsz: int, variants: list[str] = VARIANTS
+) -> dict[str, Path]:
+    """
+    Exports the variants of the weights.
+
+    Args:
+        weights (str, Path): Trained .pt weights.
+        output_dir (str, Path): Directory of the variants (FILE_NAMES).
+        images (list[Path]): Calibration sample of the INT8 quantization.
+        variants (list[str]): Variants to build, among VARIANTS.
+
+    Returns:
+        the file of each variant, and of the torch reference.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    onnx_path = export_onnx(Path(weights), output_dir / FILE_NAMES["onnx"], imgsz)
+    builders = {
+        "onnx": lambda path: onnx_path,
+        "onnx-fp16": lambda path: convert_fp16(onnx_path, path),
+        "onnx-int8": lambda path: quantize_int8(onnx_path, path, images, imgsz),
+        "onnx-fused": lambda path: fuse_graph(onnx_path, path),
+    }
+    files = {REFERENCE: Path(weights)}
+    for name in variants:
+        if name not in builders:
+            raise ValueError(f"Unknown variant {name}, expected one of {VARIANTS}")
+        files[name] = builders[name](output_dir / FILE_NAMES[name])
+    return files
+
+
+def variant_table(files: dict[str, Path], results: dict[str, dict], key_metric: str) -> list[dict]:
+    """
+    Accuracy-versus-latency table of the variants.
+
+    Args:
+        files (dict): File of each variant, see build_variants.
+        results (dict): Metrics of each variant (key_metric and latency/throughput, see promotion.measure_latency).
+
+    Returns:
+        a row per variant: file name, size, metrics and accuracy_drop, the loss of key_metric from the reference.
+    """
+    reference = results[REFERENCE].get(key_metric, 0.0)
+    return [
+        {
+            "variant": name,
+            "file": files[name].name,
+            "size_mb": round(files[name].stat().st_size / 2**20, 2),
+            **metrics,
+            "accuracy_drop": reference - metrics.get(key_metric, 0.0),
+        }
+        for name, metrics in results.items()
+    ]
+
+
+def select_variant(table: list[dict], tolerance: float, batch_size: int = 1) -> dict:
+    """
+    Fastest variant at batch_size (the closest one measured) whose accuracy drop from the reference is at most
+    tolerance (absolute, in the units of the key metric). The reference itself always qualifies.
+    """
+    # Closest batch size measured
+    sizes = {int(key.split("_")[1]) for row in table for key in row if key.startswith("latency/batch_")}
+    latency = f"latency/batch_{min(sizes, key=lambda size: abs(size - batch_size), default=batch_size)}_ms"
+    eligible = [row for row in table if row["variant"] == REFERENCE or row["accuracy_drop"] <= tolerance]
+    return min(eligible, key=lambda row: row.get(latency, float("inf")))
@@ -0,0 +1,309 @@
+"""
+Bounded frame reading for video inference.
+
+A FrameReader decodes frames in a background thread into a bounded queue, so memory stays constant whatever
+the length of the video. When the consumer is slower than the decoding, the reader either waits (block) or
+drops the frames that do not fit in the queue (drop), the frame index telling the consumer which ones it got.
+
+A VideoPipeline chains three stages running in their own threads, connected by bounded queues with the same policy:
+
+    decode (FrameReader) -> track (model.track, keeping the tracker state) -> write (annotated video, detections log)
+
+so the decoding, the inference and the rendering/encoding run in parallel, with at most a few frames held between two
+stages for files or camera streams of any length. Nothing is displayed. Each stage reports the frames it went through
+and its own speed (frames per second of work, without the waits), the slowest stage being the bottleneck.
+"""
+
+import json
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import numpy as np
+
+_END = object()
+
+
+def video_frames(source: str | int | Path) -> Iterator[np.ndarray]:
+    """Frames of a video file, stream URL or camera index, decoded with OpenCV"""
+    import cv2
+
+    capture = cv2.VideoCapture(str(source) if isinstance(source, Path) else source)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open video source {source}")
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            yield frame
+    finally:
+        capture.release()
+
+
+def video_fps(source: str | int | Path, default: float = 30.0) -> float:
+    """Frame rate of a video file, default for the cameras and the sources that do not report it"""
+    import cv2
+
+    if isinstance(source, int):
+        return default
+    capture = cv2.VideoCapture(str(source))
+    fps = capture.get(cv2.CAP_PROP_FPS) if capture.isOpened() else 0
+    capture.release()
+    return fps if fps and fps > 0 else default
+
+
+def image_frames(paths: Iterable[str | Path]) -> Iterator[np.ndarray]:
+    """Frames given as a sequence of image files"""
+    import cv2
+
+    for path in paths:
+        frame = cv2.imread(str(path))
+        if frame is None:
+            raise ValueError(f"Could not read frame {path}")
+        yield frame
+
+
+class FrameReader:
+    def __init__(self, frames: Iterable[np.ndarray], buffer_size: int = 8, drop_frames: bool = False) -> None:
+        """
+        Initializes the reader (call start() to begin decoding).
+
+        Args:
+            frames (Iterable): Frames to read, e.g. video_frames(path).
+            buffer_size (int): Maximum number of decoded frames waiting for the consumer.
+            drop_frames (bool): Drop the frames that do not fit in the buffer instead of waiting for the consumer.
+        """
+        self.frames = frames
+        self.drop_frames = drop_frames
+        self.queue: queue.Queue = queue.Queue(maxsize=buffer_size)
+        self.read = 0
+        self.dropped = 0
+        self.busy = 0.0  # seconds spent decoding
+        self.error: Exception | None = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="frame-reader", daemon=True)
+
+    def start(self) -> "FrameReader":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stops decoding, e.g. when the consumer went away. A consumer waiting in get() gets None"""
+        self._stop.set()
+        self._thread.join()
+        # The reader gave up queuing the end on the stop: the buffered frames are dropped to make room for it
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        self.queue.put_nowait(_END)
+
+    def _put(self, item) -> bool:
+        """Blocking put that gives up when the reader is stopped"""
+        while not self._stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self) -> None:
+        try:
+            start = time.perf_counter()
+            for index, frame in enumerate(self.frames):
+                self.busy += time.perf_counter() - start
+                if self._stop.is_set():
+                    break
+                self.read += 1
+                if self.drop_frames:
+                    try:
+                        self.queue.put_nowait((index, frame))
+                    except queue.Full:
+                        self.dropped += 1
+                elif not self._put((index, frame)):
+                    break
+                start = time.perf_counter()
+        except Exception as e:
+            self.error = e
+        finally:
+            self._put(_END)
+
+    def get(self, timeout: float | None = None) -> tuple[int, np.ndarray] | None:
+        """
+        Next (frame index, frame), or None once every frame was read.
+
+        Raises:
+            Exception: the error raised while decoding, if any.
+        """
+        item = self.queue.get(timeout=timeout)
+        if item is _END:
+            if self.error is not None:
+                raise self.error
+            return None
+        return item
+
+    def __iter__(self) -> Iterator[tuple[int, np.ndarray]]:
+        while (item := self.get()) is not None:
+            yield item
+
+
+def frame_record(index: int, result) -> dict:
+    """Detections of a tracked frame, as in the track API of the service"""
+    data = result.boxes.data.cpu().numpy()  # (n, 6) or (n, 7) when tracking: xyxy, [track id], conf, cls
+    names = result.names
+    boxes = []
+    for row in data.tolist():
+        box = {"xyxy": row[:4], "confidence": row[-2], "class_id": int(row[-1]), "class_name": names[int(row[-1])]}
+        if len(row) == 7:
+            box["track_id"] = int(row[4])
+        boxes.append(box)
+    return {"frame": index, "boxes": boxes, "inference_time": float(result.speed["inference"])}
+
+
+@dataclass
+class StageStats:
+    frames: int = 0
+    busy: float = 0.0  # seconds of work, without the waits on the queues
+    dropped: int = 0  # frames that did not fit in the queue before the stage (drop_frames)
+
+    def to_dict(self, elapsed: float) -> dict:
+        return {
+            "frames": self.frames,
+            "dropped": self.dropped,
+            "fps": self.frames / elapsed if elapsed else 0.0,
+            "busy_fps": self.frames / self.busy if self.busy else 0.0,  # speed of the stage alone
+        }
+
+
+class VideoPipeline:
+    def __init__(
+        self,
+        model,
+        tracker: str = "bytetrack.yaml",
+        buffer_size: int = 8,
+        drop_frames: bool = False,
+        output_video: str | Path | None = None,
+        detections_log: str | Path | None = None,
+        fps: float = 30.0,
+        **predict_params,
+    ) -> None:
+        """
+        Initializes the pipeline.
+
+        Args:
+            model: YOLO model, used by this pipeline only (ultralytics keeps the tracker state on it).
+            tracker (str): Ultralytics tracker configuration.
+            buffer_size (int): Maximum number of frames waiting between two stages.
+            drop_frames (bool): Drop the frames a stage has no room for instead of waiting for it, to keep up with
+                live sources. Dropped before tracking they are not tracked, dropped before writing they are missing
+                from the outputs.
+            output_video (str, Path): Video the annotated frames are written to (.mp4 or .avi), None to not write it.
+            detections_log (str, Path): JSON lines file of the detections of each frame, None to not write it.
+            fps (float): Frame rate of the output video, see video_fps.
+            predict_params: Passed to model.track (conf, iou, imgsz...).
+        """
+        self.model = model
+        self.tracker = tracker
+        self.buffer_size = buffer_size
+        self.drop_frames = drop_frames
+        self.output_video = Path(output_video) if output_video is not None else None
+        self.detections_log = Path(detections_log) if detections_log is not None else None
+        self.fps = fps
+        self.predict_params = predict_params
+
+        self.reader: FrameReader | None = None
+        self.stats = {"track": StageStats(), "write": StageStats()}
+        self._started = 0.0
+        self._queue: queue.Queue = queue.Queue(maxsize=buffer_size)
+        self._writer_error: Exception | None = None
+
+    def _write(self) -> None:
+        import cv2
+
+        stats = self.stats["write"]
+        video, log = None, None
+        try:
+            if self.detections_log is not None:
+                self.detections_log.parent.mkdir(parents=True, exist_ok=True)
+                log = open(self.detections_log, "w")
+            while (item := self._queue.get()) is not _END:
+                index, result = item
+                start = time.perf_counter()
+                if log is not None:
+                    log.write(json.dumps(frame_record(index, result)) + "\n")
+                if self.output_video is not None:
+                    frame = result.plot()
+                    if video is None:
+                        self.output_video.parent.mkdir(parents=True, exist_ok=True)
+                        fourcc = cv2.VideoWriter_fourcc(*("MJPG" if self.output_video.suffix == ".avi" else "mp4v"))
+                        video = cv2.VideoWriter(str(self.output_video), fourcc, self.fps, frame.shape[1::-1])
+                    video.write(frame)
+                stats.frames += 1
+                stats.busy += time.perf_counter() - start
+        except Exception as e:
+            self._writer_error = e
+            # Keep emptying the queue so the tracking stage does not wait forever
+            while self._queue.get() is not _END:
+                pass
+        finally:
+            if video is not None:
+                video.release()
+            if log is not None:
+                log.close()
+
+    def _put(self, item) -> None:
+        if self.drop_frames:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                self.stats["write"].dropped += 1
+        else:
+            self._queue.put(item)
+
+    def run(self, frames: Iterable[np.ndarray]) -> dict:
+        """
+        Tracks the frames (e.g. video_frames(source)) until the end of the source, or an interruption.
+
+        Returns:
+            the report of the run, see report.
+        """
+        self._started = time.perf_counter()
+        self.reader = FrameReader(frames, buffer_size=self.buffer_size, drop_frames=self.drop_frames).start()
+        writer = threading.Thread(target=self._write, name="video-writer", daemon=True)
+        writer.start()
+        stats = self.stats["track"]
+        try:
+            while (item := self.reader.get()) is not None:
+                index, frame = item
+                start = time.perf_counter()
+                results = self.model.track(
+                    frame, persist=True, tracker=self.tracker, verbose=False, **self.predict_params
+                )
+                stats.frames += 1
+                stats.busy += time.perf_counter() - start
+                if self._writer_error is not None:
+                    raise self._writer_error
+                self._put((index, results[0]))
+        finally:
+            self.reader.stop()
+            self._queue.put(_END)
+            writer.join()
+        if self._writer_error is not None:
+            raise self._writer_error
+        return self.report()
+
+    def report(self) -> dict:
+        """Frames read and per-stage counts and speeds so far (also readable while running or after an interruption)"""
+        elapsed = time.perf_counter() - self._started
+        decode = StageStats()
+        if self.reader is not None:
+            decode = StageStats(frames=self.reader.read, busy=self.reader.busy)
+            self.stats["track"].dropped = self.reader.dropped  # Did not fit in the queue of the tracking stage
+        stages = {"decode": decode, **self.stats}
+        return {"seconds": elapsed, "stages": {name: stats.to_dict(elapsed) for name, stats in stages.items()}}
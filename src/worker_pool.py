@@ -0,0 +1,114 @@
+"""
+Bounded pool of model replicas used to run blocking inference off the event loop.
+
+Each worker owns one model replica and a single thread (the models are not thread-safe), so the number of
+workers is the number of inferences that can run in parallel. Jobs go to the least loaded worker; when every
+worker already holds max_queue_size jobs the pool refuses new ones instead of letting latency grow unbounded.
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+
+class PoolSaturatedError(Exception):
+    """Raised when every worker queue is full"""
+
+
+def _limit_threads(num_threads: int) -> None:
+    """Limit the intra-op threads used by torch. The setting is process-wide: it is shared by every replica"""
+    import torch
+
+    torch.set_num_threads(num_threads)
+
+
+class Worker:
+    def __init__(self, index: int, model: Any) -> None:
+        self.index = index
+        self.model = model
+        self.depth = 0  # queued + running jobs, only touched from the event loop
+        self.processed = 0
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"yolo-worker-{index}")
+
+
+class WorkerPool:
+    def __init__(
+        self,
+        model_factory: Callable[[], Any],
+        num_workers: int = 1,
+        max_queue_size: int = 16,
+        threads_per_worker: int = 0,
+        on_job_start: Callable[[float], None] | None = None,
+    ) -> None:
+        """
+        Initializes the pool and loads one model replica per worker.
+
+        Args:
+            model_factory (Callable): Called once per worker to build its model replica.
+            num_workers (int): Number of model replicas / inference threads.
+            max_queue_size (int): Maximum number of jobs (running + waiting) per worker before refusing new ones.
+            threads_per_worker (int): Torch intra-op threads per worker (0: the cores split between the workers).
+                Torch has a single process-wide thread pool, so this is set once for the whole pool.
+            on_job_start (Callable): Called from the worker thread with the time (s) the job waited in the queue.
+        """
+        if num_workers < 1:
+            raise ValueError("num_workers must be at least 1")
+        if max_queue_size < 1:
+            raise ValueError("max_queue_size must be at least 1")
+        self.max_queue_size = max_queue_size
+        self.on_job_start = on_job_start
+        _limit_threads(threads_per_worker or max(1, (os.cpu_count() or 1) // num_workers))
+        self.workers = [Worker(i, model_factory()) for i in range(num_workers)]
+
+    def __len__(self) -> int:
+        return len(self.workers)
+
+    async def submit(self, fn: Callable, *args) -> Any:
+        """
+        Runs fn(model, *args) on the least loaded worker.
+
+        Raises:
+            PoolSaturatedError: if every worker queue is full.
+        """
+        worker = min(self.workers, key=lambda w: w.depth)
+        if worker.depth >= self.max_queue_size:
+            raise PoolSaturatedError(f"All {len(self.workers)} workers have {self.max_queue_size} queued jobs")
+
+        model = worker.model
+        enqueued = time.perf_counter()
+
+        def job():
+            if self.on_job_start is not None:
+                self.on_job_start(time.perf_counter() - enqueued)
+            return fn(model, *args)
+
+        worker.depth += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(worker.executor, job)
+            worker.processed += 1
+            return result
+        finally:
+            worker.depth -= 1
+
+    def swap_models(self, model_factory: Callable[[], Any]) -> None:
+        """
+        Loads new replicas, then swaps them in one worker at a time.
+        Nothing is dropped: jobs already queued finish on the replica they were submitted with.
+        """
+        models = [model_factory() for _ in self.workers]
+        for worker, model in zip(self.workers, models):
+            worker.model = model
+
+    def stats(self) -> list[dict]:
+        """Per-worker queue depth, to size the number of replicas against the core count"""
+        return [
+            {"worker": w.index, "queue_depth": w.depth, "max_queue_size": self.max_queue_size, "processed": w.processed}
+            for w in self.workers
+        ]
+
+    def shutdown(self) -> None:
+        for worker in self.workers:
+            worker.executor.shutdown(wait=False)
@@ -0,0 +1,13 @@
+import pytest
+
+
+@pytest.fixture
+def tracking_uri(tmp_path, monkeypatch):
+    """Local sqlite tracking store and model registry, the artifacts in tmp_path/mlruns instead of ./mlruns"""
+    mlflow = pytest.importorskip("mlflow")
+    monkeypatch.chdir(tmp_path)  # The default artifact root is relative to the working directory
+    uri = f"sqlite:///{tmp_path / 'mlflow.db'}"
+    monkeypatch.setenv("MLFLOW_TRACKING_URI", uri)  # for the spawned workers too
+    mlflow.set_tracking_uri(uri)
+    yield uri
+    mlflow.set_tracking_uri(None)
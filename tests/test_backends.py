@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from src.backends import compare_detections, letterbox, letterbox_shape
+
+
+class FakeTensor:
+    def __init__(self, array):
+        self.array = array
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+
+class FakeResult:
+    def __init__(self, data):
+        self.boxes = type("Boxes", (), {"data": FakeTensor(np.asarray(data, dtype=np.float32).reshape(-1, 6))})
+
+
+def test_letterbox_shape_uses_minimal_padding():
+    assert letterbox_shape((480, 640), 640) == (480, 640)
+    assert letterbox_shape((1080, 1920), 640) == (384, 640)  # 360 padded to a multiple of 32
+    assert letterbox_shape((640, 640), 640) == (640, 640)
+
+
+def test_letterbox_pads_and_reports_transform():
+    pytest.importorskip("cv2")
+    image = np.full((100, 200, 3), 255, dtype=np.uint8)
+    out = np.zeros((64, 64, 3), dtype=np.uint8)
+
+    boxed, scale, (left, top) = letterbox(image, (64, 64), out=out)
+
+    assert boxed is out
+    assert scale == pytest.approx(0.32)
+    assert (left, top) == (0, 16)
+    assert (boxed[:16] == 114).all() and (boxed[16:48] == 255).all() and (boxed[48:] == 114).all()
+
+
+def test_compare_detections():
+    reference = FakeResult([[0, 0, 10, 10, 0.9, 0], [20, 20, 30, 30, 0.8, 1]])
+    same = FakeResult([[0, 0, 10, 10.1, 0.89, 0], [20, 20, 30, 30, 0.8, 1]])
+    other_class = FakeResult([[0, 0, 10, 10, 0.9, 2], [20, 20, 30, 30, 0.8, 1]])
+
+    assert compare_detections(reference, same)["matched"] == 2
+    assert compare_detections(reference, same)["max_conf_diff"] == pytest.approx(0.01)
+    assert compare_detections(reference, other_class)["matched"] == 1
+    assert compare_detections(reference, FakeResult([]))["matched"] == 0
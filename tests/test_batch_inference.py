@@ -0,0 +1,106 @@
+import json
+
+import cv2
+import numpy as np
+import pytest
+import torch
+from ultralytics.engine.results import Results
+
+from src.batch_inference import BatchInference, JsonlWriter, list_images, open_writer
+
+NAMES = {0: "bottle", 1: "can"}
+
+
+class FakeModel:
+    """One box per image, its class given by the first pixel"""
+
+    def __init__(self, fail_after: int | None = None):
+        self.batches = []
+        self.fail_after = fail_after
+
+    def predict(self, images, **kwargs):
+        if self.fail_after is not None and len(self.batches) == self.fail_after:
+            raise KeyboardInterrupt
+        self.batches.append(len(images))
+        results = []
+        for image in images:
+            h, w = image.shape[:2]
+            boxes = torch.tensor([[0.0, 0.0, w / 2, h / 2, 0.9, float(image[0, 0, 0] % 2)]])
+            results.append(Results(image, path="", names=NAMES, boxes=boxes))
+        return results
+
+
+@pytest.fixture
+def images(tmp_path):
+    directory = tmp_path / "shelves"
+    (directory / "aisle").mkdir(parents=True)
+    for i in range(7):
+        cv2.imwrite(str(directory / "aisle" / f"{i}.png"), np.full((20, 30, 3), i, dtype=np.uint8))
+    (directory / "broken.jpg").write_bytes(b"not an image")
+    (directory / "notes.txt").write_text("")
+    return directory
+
+
+def read_jsonl(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_list_images(images, tmp_path):
+    paths, root = list_images(images)
+    assert root == images and len(paths) == 8 and paths == sorted(paths)
+
+    paths, root = list_images(f"{images}/**/*.png")
+    assert root is None and len(paths) == 7
+
+    (tmp_path / "list.txt").write_text(f"{paths[0]}\n{paths[1]}\n")
+    assert list_images(tmp_path / "list.txt") == (paths[:2], None)
+    with pytest.raises(FileNotFoundError):
+        list_images(f"{images}/*.gif")
+
+
+def test_batch_inference_jsonl(images, tmp_path):
+    paths, root = list_images(images)
+    model = FakeModel()
+    engine = BatchInference(model, batch_size=3, workers=2, annotate_dir=tmp_path / "annotated")
+    report = engine.run(paths, open_writer(tmp_path / "results.jsonl"), root)
+
+    assert (report.images, report.processed, report.errors) == (8, 8, 1)
+    assert model.batches == [3, 3, 1]  # broken.jpg is not predicted
+    records = read_jsonl(tmp_path / "results.jsonl")
+    assert [record["path"] for record in records] == [str(path) for path in paths]
+    assert records[0]["error"] is None and records[0]["width"] == 30 and records[0]["height"] == 20
+    box = {"xyxy": [0.0, 0.0, 15.0, 10.0], "confidence": pytest.approx(0.9), "class_id": 1, "class_name": "can"}
+    assert records[1]["boxes"] == [box]
+    assert records[-1]["error"].startswith("ValueError")
+    assert (tmp_path / "annotated" / "aisle" / "6.png").exists()
+
+
+def test_interrupted_run_is_resumed(images, tmp_path):
+    paths, root = list_images(images)
+    output = tmp_path / "results.jsonl"
+    with pytest.raises(KeyboardInterrupt):
+        BatchInference(FakeModel(fail_after=1), batch_size=3, workers=2).run(paths, JsonlWriter(output), root)
+    with open(output, "a") as f:
+        f.write('{"path": "cut')  # Line cut by the interruption
+
+    model = FakeModel()
+    report = BatchInference(model, batch_size=3, workers=2).run(paths, JsonlWriter(output), root)
+    assert (report.skipped, report.processed) == (3, 5)
+    assert [record["path"] for record in read_jsonl(output)] == [str(path) for path in paths]
+
+
+def test_batch_inference_parquet(images, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    paths, root = list_images(images)
+    output = tmp_path / "results.parquet"
+
+    writer = open_writer(output)
+    writer.part_size = 4
+    BatchInference(FakeModel(), batch_size=3, workers=2).run(paths[:5], writer, root)
+    report = BatchInference(FakeModel(), batch_size=3, workers=2).run(paths, open_writer(output), root)
+
+    assert (report.skipped, report.processed) == (5, 3)
+    assert len(list(output.glob("part-*.parquet"))) == 2  # 5 records flushed after the second batch, then 3
+    table = pq.read_table(output)
+    assert sorted(table["path"].to_pylist()) == sorted(str(path) for path in paths)
+    assert table["boxes"].to_pylist()[0][0]["class_name"] == "bottle"
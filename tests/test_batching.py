@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from src.batching import MicroBatcher
+
+
+def test_batches_concurrent_requests():
+    """Test that concurrent requests are grouped and each caller gets its own result"""
+    batch_sizes = []
+
+    async def handler(items):
+        batch_sizes.append(len(items))
+        return [item * 2 for item in items]
+
+    async def run():
+        batcher = MicroBatcher(handler, max_batch_size=4, max_wait_ms=50)
+        return await asyncio.gather(*(batcher.submit(i) for i in range(10)))
+
+    results = asyncio.run(run())
+
+    assert results == [i * 2 for i in range(10)]
+    assert max(batch_sizes) <= 4
+    assert sum(batch_sizes) == 10
+    assert len(batch_sizes) < 10  # requests were actually grouped
+
+
+def test_single_request_is_not_delayed_past_max_wait():
+    """Test that a lone request is flushed once max_wait_ms is spent"""
+
+    async def handler(items):
+        return items
+
+    async def run():
+        batcher = MicroBatcher(handler, max_batch_size=8, max_wait_ms=10)
+        return await asyncio.wait_for(batcher.submit("image"), timeout=1)
+
+    assert asyncio.run(run()) == "image"
+
+
+def test_handler_error_is_propagated_to_callers():
+    """Test that a failing batch fails every request of the batch, and the batcher keeps working"""
+    calls = 0
+
+    async def handler(items):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise RuntimeError("boom")
+        return items
+
+    async def run():
+        batcher = MicroBatcher(handler, max_batch_size=2, max_wait_ms=50)
+        failed = await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+        ok = await batcher.submit(3)
+        return failed, ok
+
+    failed, ok = asyncio.run(run())
+
+    assert all(isinstance(e, RuntimeError) for e in failed)
+    assert ok == 3
+
+
+def test_invalid_batch_size():
+    async def handler(items):
+        return items
+
+    with pytest.raises(ValueError):
+        MicroBatcher(handler, max_batch_size=0)
+
+
+def test_concurrent_batches_and_bounded_queue():
+    """Test that several batches can be in flight and that the pending queue is bounded"""
+    in_flight = 0
+    max_in_flight = 0
+
+    async def handler(items):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.05)
+        in_flight -= 1
+        return items
+
+    async def run():
+        batcher = MicroBatcher(handler, max_batch_size=1, max_wait_ms=1, max_concurrent_batches=2, max_pending=3)
+        tasks = [asyncio.create_task(batcher.submit(i)) for i in range(3)]
+        await asyncio.sleep(0)
+        with pytest.raises(asyncio.QueueFull):
+            await batcher.submit(99)
+        return await asyncio.gather(*tasks)
+
+    assert asyncio.run(run()) == [0, 1, 2]
+    assert max_in_flight == 2
+
+
+def test_on_batch_reports_size_and_waits():
+    observed = []
+
+    async def handler(items):
+        return items
+
+    async def run():
+        batcher = MicroBatcher(handler, max_batch_size=3, max_wait_ms=20, on_batch=lambda *args: observed.append(args))
+        await asyncio.gather(*(batcher.submit(i) for i in range(3)))
+
+    asyncio.run(run())
+
+    size, waits = observed[0]
+    assert size == 3
+    assert len(waits) == 3 and all(wait >= 0 for wait in waits)
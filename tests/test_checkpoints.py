@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+
+import mlflow
+
+from src.checkpoints import CheckpointUploader, latest_checkpoint
+
+
+class FakeModel:
+    def __init__(self):
+        self.callbacks = {}
+
+    def add_callback(self, event, callback):
+        self.callbacks[event] = callback
+
+
+def train(uploader, tmp_path, epochs, crash_after):
+    """Epochs of a fake training writing last.pt, dying after crash_after epochs"""
+    model = FakeModel()
+    uploader.attach(model)
+    trainer = SimpleNamespace(epochs=epochs, last=tmp_path / "last.pt")
+    for epoch in range(min(epochs, crash_after)):
+        trainer.epoch = epoch
+        trainer.last.write_text(f"epoch {epoch + 1}")
+        model.callbacks["on_model_save"](trainer)
+        if uploader.pending is not None:
+            uploader.pending.result()  # Fast epochs would skip the checkpoints still uploading
+    if crash_after >= epochs:
+        model.callbacks["on_train_end"](trainer)
+    else:
+        uploader.close()
+
+
+def test_resume_from_the_last_checkpoint(tmp_path, tracking_uri):
+    with mlflow.start_run(run_name="yolo11n") as run:
+        train(CheckpointUploader(run.info.run_id, every=2), tmp_path, epochs=6, crash_after=5)
+
+    run_id, checkpoint = latest_checkpoint("yolo11n", tmp_path / "resume")
+    assert run_id == run.info.run_id
+    assert checkpoint.read_text() == "epoch 4"
+    assert mlflow.get_run(run_id).data.tags["checkpoint_epoch"] == "4"
+    assert latest_checkpoint("yolo11s", tmp_path / "resume") == (None, None)
+
+    # Resumed in the same run up to the end: nothing left to resume
+    with mlflow.start_run(run_id=run_id):
+        train(CheckpointUploader(run_id, every=2, resumed=True), tmp_path, epochs=6, crash_after=6)
+    assert mlflow.get_run(run_id).data.tags["training_state"] == "complete"
+    assert latest_checkpoint("yolo11n", tmp_path / "resume") == (None, None)
+
+
+def test_no_checkpoint_after_the_last_epoch(tmp_path, tracking_uri):
+    with mlflow.start_run(run_name="yolo11n") as run:
+        train(CheckpointUploader(run.info.run_id, every=1), tmp_path, epochs=1, crash_after=1)
+
+    assert "checkpoint_epoch" not in mlflow.get_run(run.info.run_id).data.tags
+    assert not mlflow.MlflowClient().list_artifacts(run.info.run_id, "checkpoints")
@@ -0,0 +1,83 @@
+import os
+
+import pytest
+import yaml
+
+from src.data_pipeline import create_yaml_yolo, validate_dataset
+from src.dataset_index import SPLITS, assign_splits, index_split_dataset, label_path, list_images, read_split
+
+
+@pytest.fixture
+def flat_dataset(tmp_path):
+    """Images and labels side by side, as downloaded and extracted. Class 2 is rare."""
+    dataset_path = tmp_path / "dataset"
+    dataset_path.mkdir()
+    for i in range(100):
+        (dataset_path / f"image_{i}.jpg").write_bytes(b"jpg")
+        cls = 2 if i % 10 == 0 else i % 2
+        (dataset_path / f"image_{i}.txt").write_text(f"{cls} 0.5 0.5 0.1 0.1\n1 0.2 0.2 0.1 0.1\n")
+    return dataset_path
+
+
+def test_label_path_matches_ultralytics(tmp_path):
+    from ultralytics.data.utils import img2label_paths
+
+    paths = [tmp_path / "image.jpg", tmp_path / "train" / "images" / "image.png", tmp_path / "images" / "a" / "b.jpeg"]
+    assert [str(label_path(p)) for p in paths] == img2label_paths(paths)
+
+
+@pytest.mark.parametrize("mode", ["index", "symlink", "hardlink"])
+def test_split_without_moving_files(flat_dataset, mode):
+    before = {p.name: p.stat().st_ino for p in flat_dataset.iterdir()}
+
+    split_paths = index_split_dataset(flat_dataset, 0.6, 0.2, mode=mode)
+
+    assert {p.name: p.stat().st_ino for p in flat_dataset.glob("image_*")} == before
+    splits = {split: read_split(flat_dataset, split_paths[split]) for split in SPLITS}
+    assert [len(splits[split]) for split in SPLITS] == [60, 20, 20]
+    split_names = sorted(p.name for images in splits.values() for p in images)
+    assert split_names == sorted(p for p in before if p.endswith(".jpg"))
+    for images in splits.values():
+        assert all(label_path(image).exists() for image in images)
+    validate_dataset(flat_dataset, split_paths)
+
+
+def test_resplit_replaces_the_previous_split(flat_dataset):
+    index_split_dataset(flat_dataset, 0.6, 0.2, mode="symlink")
+    split_paths = index_split_dataset(flat_dataset, 0.8, 0.1, mode="index")
+
+    assert not (flat_dataset / "splits").exists()
+    assert len(read_split(flat_dataset, split_paths["train"])) == 80
+    assert len(list_images(flat_dataset)) == 100
+
+    again = index_split_dataset(flat_dataset, 0.8, 0.1, mode="index")
+    assert read_split(flat_dataset, again["train"]) == read_split(flat_dataset, split_paths["train"])
+
+
+def test_stratified_split_keeps_class_proportions(flat_dataset):
+    images = list_images(flat_dataset)
+    rare = {image for image in images if int(image.stem.split("_")[1]) % 10 == 0}
+
+    for seed in range(5):
+        splits = assign_splits(images, 0.6, 0.2, seed=seed, stratify=True)
+        assert [len(set(splits[split]) & rare) for split in SPLITS] == [6, 2, 2]
+        assert [len(splits[split]) for split in SPLITS] == [60, 20, 20]
+
+
+def test_yaml_points_to_index_files(flat_dataset):
+    split_paths = index_split_dataset(flat_dataset, 0.6, 0.2)
+    create_yaml_yolo(flat_dataset, ["a", "b", "c"], split_paths)
+
+    config = yaml.safe_load((flat_dataset / "yolo.yaml").read_text())
+    assert config["train"] == "./train.txt" and config["val"] == "./valid.txt" and config["test"] == "./test.txt"
+    first = (flat_dataset / "train.txt").read_text().splitlines()[0]
+    assert first.startswith("./") and os.path.exists(first.replace("./", f"{flat_dataset}{os.sep}", 1))
+
+
+def test_validate_index_split_detects_bad_labels(flat_dataset):
+    split_paths = index_split_dataset(flat_dataset, 0.6, 0.2)
+    label = label_path(read_split(flat_dataset, split_paths["valid"])[0])
+    label.write_text("invalid format")
+
+    with pytest.raises(ValueError):
+        validate_dataset(flat_dataset, split_paths)
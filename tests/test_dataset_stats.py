@@ -0,0 +1,63 @@
+import numpy as np
+from PIL import Image
+
+from src.dataset_stats import EDGES, bin_counts, compare_stats, compute_dataset_stats, population_stability_index
+from src.label_store import LabelStore
+
+
+def make_split(root, n, box_size=0.1, image_size=(640, 480)):
+    images_path = root / "train" / "images"
+    labels_path = root / "train" / "labels"
+    images_path.mkdir(parents=True)
+    labels_path.mkdir(parents=True)
+    images = []
+    for i in range(n):
+        images.append(images_path / f"image_{i}.jpg")
+        Image.new("RGB", image_size).save(images[-1])
+        boxes = "".join(f"{j % 2} 0.5 0.5 {box_size} {box_size}\n" for j in range(i % 3))
+        (labels_path / f"image_{i}.txt").write_text(boxes)
+    return LabelStore.build(images, root)
+
+
+def test_bin_counts_open_ended():
+    assert bin_counts(np.array([-1, 0, 0.5, 1, 7]), np.array([0, 1, 2, 3])).tolist() == [3, 1, 1]
+
+
+def test_split_stats(tmp_path):
+    store = make_split(tmp_path, 10)
+
+    stats = compute_dataset_stats({"train": store, "valid": None}, nc=3)["splits"]["train"]
+
+    assert list(compute_dataset_stats({"train": store})["splits"]) == ["train"]
+    assert stats["images"] == 10 and stats["boxes"] == 9 and stats["unreadable_images"] == 0
+    assert stats["histograms"]["classes"]["counts"] == [6, 3, 0]
+    assert stats["histograms"]["boxes_per_image"]["counts"][:3] == [4, 3, 3]
+    assert stats["histograms"]["resolution"]["counts"][EDGES["resolution"].tolist().index(640)] == 10
+    assert stats["box_width"]["mean"] == np.float32(0.1).item() and stats["box_width"]["std"] < 1e-6
+
+
+def test_chunks_do_not_change_the_stats(tmp_path, monkeypatch):
+    store = make_split(tmp_path, 25)
+    from src import dataset_stats
+
+    whole = compute_dataset_stats({"train": store})
+    monkeypatch.setattr(dataset_stats, "CHUNK_SIZE", 4)
+    assert compute_dataset_stats({"train": store}) == whole
+
+
+def test_drift(tmp_path):
+    reference = compute_dataset_stats({"train": make_split(tmp_path / "a", 20)})
+    same = compute_dataset_stats({"train": make_split(tmp_path / "b", 20)})
+    smaller_boxes = compute_dataset_stats({"train": make_split(tmp_path / "c", 20, box_size=0.02)})
+
+    assert compare_stats(same, reference)["level"] == "none"
+    drift = compare_stats(smaller_boxes, reference)
+    assert drift["level"] == "large"
+    assert {f["feature"] for f in drift["features"] if f["level"] == "large"} == {"box_size"}
+
+
+def test_population_stability_index():
+    assert population_stability_index([10, 10], [10, 10]) == 0
+    assert population_stability_index([50, 50], [55, 45]) < 0.1
+    assert population_stability_index([90, 10], [10, 90]) > 0.25
+    assert population_stability_index([5, 5], [5, 5, 0]) == 0  # A new, empty class
@@ -0,0 +1,100 @@
+import json
+import zipfile
+
+import pytest
+
+from src.dataset_sync import SPLITS, assign_split, sync_dataset
+from src.download_manager import MANIFEST_NAME, LocalDatasetClient
+
+
+def write_export(path, labels):
+    """YOLO annotation export as made by Picsellia: a zip of <image stem>.txt"""
+    with zipfile.ZipFile(path, "w") as zip_file:
+        for stem, content in labels.items():
+            zip_file.writestr(f"export/labels/{stem}.txt", content)
+    return path
+
+
+@pytest.fixture
+def remote(tmp_path):
+    root = tmp_path / "remote"
+    root.mkdir()
+    for i in range(40):
+        (root / f"image_{i}.jpg").write_bytes(f"pixels {i}".encode())
+    return root
+
+
+@pytest.fixture
+def labels():
+    return {f"image_{i}": f"{i % 3} 0.5 0.5 0.1 0.1\n" for i in range(40)}
+
+
+def split_of(dataset_path, name):
+    return next(split for split in SPLITS if (dataset_path / split / "images" / name).exists())
+
+
+def test_assign_split_is_deterministic_and_follows_ratios():
+    splits = [assign_split(f"image_{i}.jpg", 0.6, 0.2) for i in range(10000)]
+
+    assert splits == [assign_split(f"image_{i}.jpg", 0.6, 0.2) for i in range(10000)]
+    assert splits.count("train") / len(splits) == pytest.approx(0.6, abs=0.02)
+    assert splits.count("valid") / len(splits) == pytest.approx(0.2, abs=0.02)
+
+
+def test_initial_sync(remote, labels, tmp_path):
+    dataset_path = tmp_path / "dataset"
+    export = write_export(tmp_path / "export.zip", labels)
+
+    report = sync_dataset(LocalDatasetClient(remote), dataset_path, export)
+
+    assert report.added == 40 and report.labels_written == 40
+    for i in range(40):
+        split = split_of(dataset_path, f"image_{i}.jpg")
+        assert split == assign_split(f"image_{i}.jpg", 0.6, 0.2)
+        assert (dataset_path / split / "labels" / f"image_{i}.txt").read_text() == labels[f"image_{i}"]
+    assert not list(dataset_path.glob("*.jpg"))
+
+
+def test_sync_only_applies_changes(remote, labels, tmp_path):
+    dataset_path = tmp_path / "dataset"
+    sync_dataset(LocalDatasetClient(remote), dataset_path, write_export(tmp_path / "export.zip", labels))
+    splits_before = {f"image_{i}.jpg": split_of(dataset_path, f"image_{i}.jpg") for i in range(1, 40)}
+
+    (remote / "image_0.jpg").unlink()
+    (remote / "image_1.jpg").write_bytes(b"new pixels")
+    (remote / "image_40.jpg").write_bytes(b"pixels 40")
+    labels.pop("image_0")
+    labels.pop("image_2")
+    labels["image_3"] = "1 0.2 0.2 0.1 0.1\n"
+    labels["image_40"] = "2 0.5 0.5 0.3 0.3\n"
+
+    report = sync_dataset(LocalDatasetClient(remote), dataset_path, write_export(tmp_path / "export2.zip", labels))
+
+    assert (report.added, report.updated, report.removed) == (1, 1, 1)
+    assert (report.labels_written, report.labels_removed) == (2, 1)  # image_3, image_40 / image_2
+    assert not any((dataset_path / split / "images" / "image_0.jpg").exists() for split in SPLITS)
+    assert not any((dataset_path / split / "labels" / "image_0.txt").exists() for split in SPLITS)
+    assert all(split_of(dataset_path, name) == split for name, split in splits_before.items())
+    split = split_of(dataset_path, "image_1.jpg")
+    assert (dataset_path / split / "images" / "image_1.jpg").read_bytes() == b"new pixels"
+    split = split_of(dataset_path, "image_3.jpg")
+    assert (dataset_path / split / "labels" / "image_3.txt").read_text() == labels["image_3"]
+    assert not (dataset_path / split_of(dataset_path, "image_2.jpg") / "labels" / "image_2.txt").exists()
+
+    nothing = sync_dataset(LocalDatasetClient(remote), dataset_path, write_export(tmp_path / "export3.zip", labels))
+    assert (nothing.added, nothing.updated, nothing.removed, nothing.labels_written) == (0, 0, 0, 0)
+
+
+def test_adopts_a_dataset_split_before_the_sync(remote, labels, tmp_path):
+    """Images moved by split_dataset keep their split and are not downloaded again"""
+    dataset_path = tmp_path / "dataset"
+    (dataset_path / "valid" / "images").mkdir(parents=True)
+    (dataset_path / "valid" / "images" / "image_5.jpg").write_bytes((remote / "image_5.jpg").read_bytes())
+
+    report = sync_dataset(LocalDatasetClient(remote), dataset_path, write_export(tmp_path / "export.zip", labels))
+
+    assert report.added == 39
+    assert split_of(dataset_path, "image_5.jpg") == "valid"
+    assert (dataset_path / "valid" / "labels" / "image_5.txt").exists()
+    manifest = json.loads((dataset_path / MANIFEST_NAME).read_text())
+    assert manifest["files"]["image_5.jpg"]["path"] == "valid/images/image_5.jpg"
@@ -0,0 +1,188 @@
+import json
+import os
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+from src.download_manager import MANIFEST_NAME, DownloadManager, LocalDatasetClient, PicselliaDatasetClient, file_sha256
+
+
+@pytest.fixture
+def remote(tmp_path):
+    """Local stand-in for the Picsellia dataset"""
+    root = tmp_path / "remote"
+    root.mkdir()
+    for i in range(12):
+        (root / f"image_{i}.jpg").write_bytes(os.urandom(1000 + i * 500))
+    return root
+
+
+class FlakyClient(LocalDatasetClient):
+    """Connection dropped after `fail_after` bytes, for the first `failures` requests of each file"""
+
+    def __init__(self, root, fail_after=700, failures=1, **kwargs):
+        super().__init__(root, **kwargs)
+        self.fail_after = fail_after
+        self.failures = failures
+        self.offsets = []
+
+    def open(self, file, offset=0):
+        self.offsets.append((file.name, offset))
+        start, chunks = super().open(file, offset)
+        if sum(1 for name, _ in self.offsets if name == file.name) > self.failures:
+            return start, chunks
+
+        def interrupted():
+            data = b"".join(chunks)
+            yield data[: self.fail_after]
+            raise ConnectionError("connection reset")
+
+        return start, interrupted()
+
+
+def test_download_and_manifest(remote, tmp_path):
+    target = tmp_path / "dataset"
+    report = DownloadManager(LocalDatasetClient(remote), target, max_workers=4).download()
+
+    assert report.downloaded == 12 and not report.failed
+    assert report.bytes == sum(p.stat().st_size for p in remote.iterdir())
+    for path in remote.iterdir():
+        assert (target / path.name).read_bytes() == path.read_bytes()
+
+    manifest = json.loads((target / MANIFEST_NAME).read_text())
+    assert manifest["complete"]
+    assert manifest["files"]["image_3.jpg"]["sha256"] == file_sha256(remote / "image_3.jpg")
+    assert not list(target.glob("*.part"))
+
+
+def test_second_run_only_fetches_missing_and_changed_files(remote, tmp_path):
+    target = tmp_path / "dataset"
+    DownloadManager(LocalDatasetClient(remote), target).download()
+    (target / "image_0.jpg").unlink()
+    (remote / "image_1.jpg").write_bytes(b"new content")
+
+    report = DownloadManager(LocalDatasetClient(remote), target).download()
+
+    assert report.downloaded == 2 and report.skipped == 10
+    assert (target / "image_1.jpg").read_bytes() == b"new content"
+
+
+def test_verify_detects_corrupt_files(remote, tmp_path):
+    target = tmp_path / "dataset"
+    DownloadManager(LocalDatasetClient(remote), target).download()
+    corrupt = bytearray((target / "image_2.jpg").read_bytes())
+    corrupt[10] ^= 0xFF
+    (target / "image_2.jpg").write_bytes(bytes(corrupt))
+
+    assert DownloadManager(LocalDatasetClient(remote), target).download().downloaded == 0  # Same size
+    report = DownloadManager(LocalDatasetClient(remote), target, verify=True).download()
+
+    assert report.downloaded == 1
+    assert (target / "image_2.jpg").read_bytes() == (remote / "image_2.jpg").read_bytes()
+
+
+def test_interrupted_downloads_are_resumed(remote, tmp_path):
+    target = tmp_path / "dataset"
+    client = FlakyClient(remote, fail_after=700)
+
+    report = DownloadManager(client, target, max_workers=3, retries=2).download()
+
+    assert report.downloaded == 12
+    assert all(offset == 700 for name, offset in client.offsets[12:] if offset)
+    assert sorted(name for name, offset in client.offsets if offset == 700) == sorted(p.name for p in remote.iterdir())
+    for path in remote.iterdir():
+        assert (target / path.name).read_bytes() == path.read_bytes()
+
+
+def test_resume_after_the_process_stopped(remote, tmp_path):
+    target = tmp_path / "dataset"
+    first = DownloadManager(FlakyClient(remote, failures=10), target, retries=1).download()
+
+    assert first.downloaded == 0 and len(first.failed) == 12
+    assert len(list(target.glob("*.part"))) == 12
+    assert not json.loads((target / MANIFEST_NAME).read_text())["complete"]
+
+    client = FlakyClient(remote, failures=0)
+    second = DownloadManager(client, target).download()
+
+    assert second.downloaded == 12
+    assert second.bytes == sum(p.stat().st_size for p in remote.iterdir()) - 12 * 700
+    assert {offset for _, offset in client.offsets} == {700}
+
+
+def test_checksum_mismatch_is_not_kept(remote, tmp_path):
+    class WrongChecksums(LocalDatasetClient):
+        def list_files(self):
+            files = super().list_files()
+            files[0].sha256 = "0" * 64
+            return files
+
+    target = tmp_path / "dataset"
+    report = DownloadManager(WrongChecksums(remote), target, retries=2).download()
+
+    assert list(report.failed) == ["image_0.jpg"]
+    assert not (target / "image_0.jpg").exists() and not (target / "image_0.jpg.part").exists()
+    assert not json.loads((target / MANIFEST_NAME).read_text())["complete"]
+
+
+class RangeHandler(SimpleHTTPRequestHandler):
+    """Files of the directory with Range support like the object storage: 416 when the range starts past the end"""
+
+    ranges = []
+
+    def do_GET(self):
+        path = self.translate_path(self.path)
+        data = open(path, "rb").read()
+        self.ranges.append((os.path.basename(path), self.headers.get("Range")))
+        start = int(self.headers["Range"][len("bytes=") : -1]) if self.headers.get("Range") else 0
+        if start >= len(data):
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{len(data)}")
+            self.end_headers()
+            return
+        self.send_response(206 if start else 200)
+        self.send_header("Content-Length", str(len(data) - start))
+        self.end_headers()
+        self.wfile.write(data[start:])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def picsellia_client(remote):
+    """PicselliaDatasetClient of a fake dataset version, its assets served over HTTP from the remote directory"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(RangeHandler, directory=str(remote)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+    assets = [
+        SimpleNamespace(filename=path.name, object_name=path.name, url=f"{url}/{path.name}", reset_url=None)
+        for path in sorted(remote.iterdir())
+    ]
+    RangeHandler.ranges = []
+    yield PicselliaDatasetClient(SimpleNamespace(list_assets=lambda: assets))
+    server.shutdown()
+    server.server_close()
+
+
+def test_complete_part_is_not_fetched_again(remote, tmp_path, picsellia_client):
+    """A .part fully written but not renamed: the server answers 416 to its range, it is checked and kept"""
+    target = tmp_path / "dataset"
+    target.mkdir()
+    content = (remote / "image_0.jpg").read_bytes()
+    (target / "image_0.jpg.part").write_bytes(content)
+    corrupt = (remote / "image_1.jpg").read_bytes() + b"corrupt"
+    (target / "image_1.jpg.part").write_bytes(corrupt)
+
+    report = DownloadManager(picsellia_client, target).download()
+
+    assert report.downloaded == 12 and not report.failed
+    assert (target / "image_0.jpg").read_bytes() == content
+    assert [r for name, r in RangeHandler.ranges if name == "image_0.jpg"] == [f"bytes={len(content)}-"]
+    # Longer than the file: restarted from 0
+    assert [r for name, r in RangeHandler.ranges if name == "image_1.jpg"] == [f"bytes={len(corrupt)}-", None]
+    assert (target / "image_1.jpg").read_bytes() == (remote / "image_1.jpg").read_bytes()
+    assert not list(target.glob("*.part"))
@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from src import image_cache
+from src.image_cache import ImageCache, near_duplicate_pairs, popcount
+
+
+def write_image(path, seed, size=(320, 240)):
+    """Smooth random image: its perceptual hash survives resizing and re-encoding"""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 255, (6, 8, 3), dtype=np.uint8)
+    Image.fromarray(small).resize(size, Image.Resampling.BICUBIC).save(path, quality=90)
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    """train/valid/test of split_dataset, with a resized copy of a train image in valid and an exact one in test"""
+    for split in ("train", "valid", "test"):
+        (tmp_path / split / "images").mkdir(parents=True)
+        (tmp_path / split / "labels").mkdir(parents=True)
+    for i in range(6):
+        split = ("train", "train", "train", "valid", "valid", "test")[i]
+        write_image(tmp_path / split / "images" / f"image_{i}.jpg", seed=i)
+        (tmp_path / split / "labels" / f"image_{i}.txt").write_text(f"0 0.5 0.5 0.1 0.{i + 1}\n")
+    with Image.open(tmp_path / "train" / "images" / "image_0.jpg") as image:
+        image.resize((640, 480)).save(tmp_path / "valid" / "images" / "near_copy.jpg", quality=70)
+    image_1 = (tmp_path / "train" / "images" / "image_1.jpg").read_bytes()
+    (tmp_path / "test" / "images" / "exact_copy.jpg").write_bytes(image_1)
+    (tmp_path / "test" / "images" / "corrupt.jpg").write_bytes(b"\xff\xd8not a jpeg")
+    return tmp_path
+
+
+def splits_of(dataset):
+    return {split: sorted((dataset / split / "images").iterdir()) for split in ("train", "valid", "test")}
+
+
+def test_popcount():
+    values = np.array([0, 1, 2**63, 2**64 - 1, 0x0F0F], dtype=np.uint64)
+    assert popcount(values).tolist() == [bin(int(value)).count("1") for value in values]
+    assert popcount(values.reshape(5, 1)).shape == (5, 1) and int(popcount(np.uint64(7))) == 3
+
+
+def test_near_duplicate_pairs_match_brute_force():
+    rng = np.random.default_rng(0)
+    hashes = rng.integers(0, 2**63, 300, dtype=np.uint64)
+    hashes[100:150] = hashes[:50] ^ (np.uint64(1) << rng.integers(0, 64, 50).astype(np.uint64))  # 1 bit apart
+    distances = popcount(hashes[:, None] ^ hashes[None, :])
+
+    expected = [[i, j] for i, j in zip(*np.nonzero(np.triu(distances <= 3, k=1)))]
+    assert near_duplicate_pairs(hashes, 3).tolist() == expected
+    assert len(expected) >= 50
+
+
+def test_build_drops_duplicates_and_unreadable_images(dataset):
+    split_paths, report = ImageCache(dataset, imgsz=160, workers=1).build(splits_of(dataset))
+
+    assert split_paths["valid"] == "./image_cache/160/valid/images"
+    assert report.kept == {"train": 3, "valid": 2, "test": 1}
+    assert list(report.unreadable) == [str(dataset / "test" / "images" / "corrupt.jpg")]
+    assert {(d["image"].split("/")[-1], d["exact"]) for d in report.duplicates} == {
+        ("near_copy.jpg", False),
+        ("exact_copy.jpg", True),
+    }
+    assert report.leaked == 2
+
+    cached = dataset / "image_cache" / "160" / "train"
+    with Image.open(cached / "images" / "image_0.jpg") as image:
+        assert image.size == (160, 120)
+    assert (cached / "labels" / "image_0.txt").read_text() == "0 0.5 0.5 0.1 0.1\n"
+    assert not (dataset / "image_cache" / "160" / "valid" / "images" / "near_copy.jpg").exists()
+
+
+def test_images_with_the_same_stem_in_a_split_are_refused(dataset):
+    (dataset / "other").mkdir()
+    write_image(dataset / "other" / "image_1.jpg", seed=7)
+    write_image(dataset / "train" / "images" / "image_0.png", seed=8)
+    cache = ImageCache(dataset, imgsz=160, workers=1)
+    splits = splits_of(dataset)
+
+    with pytest.raises(ValueError, match="image_0.jpg and .*image_0.png would both be train/images/image_0.jpg"):
+        cache.build(splits)
+    splits["train"].remove(dataset / "train" / "images" / "image_0.png")
+    with pytest.raises(ValueError, match="would both be train/images/image_1.jpg"):
+        cache.build({**splits, "train": splits["train"] + [dataset / "other" / "image_1.jpg"]})
+
+    # Same name in another split
+    _, report = cache.build({**splits, "test": splits["test"] + [dataset / "other" / "image_1.jpg"]})
+    assert report.kept["test"] == 2
+
+
+def test_cache_is_reused_and_invalidated_by_content(dataset, monkeypatch):
+    cache = ImageCache(dataset, imgsz=160, workers=1)
+    cache.build(splits_of(dataset))
+    objects = sorted(p.name for p in cache.objects_dir.iterdir())
+
+    _, report = cache.build(splits_of(dataset))
+    assert report.processed == 0
+    assert sorted(p.name for p in cache.objects_dir.iterdir()) == objects
+
+    write_image(dataset / "train" / "images" / "image_2.jpg", seed=42)
+    (dataset / "valid" / "images" / "image_4.jpg").unlink()
+    _, report = cache.build(splits_of(dataset))
+    assert report.processed == 1
+    assert len(list(cache.objects_dir.iterdir())) == len(objects) - 1  # image_2 replaced, image_4 gone
+
+
+def test_process_pool(dataset, monkeypatch):
+    monkeypatch.setattr(image_cache, "MIN_FILES_FOR_POOL", 2)
+    _, serial = ImageCache(dataset, imgsz=160, workers=1).build(splits_of(dataset))
+    _, pooled = ImageCache(dataset, imgsz=96, workers=2).build(splits_of(dataset))
+
+    # Another image size: the resized copies are missing, the unreadable image is known
+    assert serial.processed == 9
+    assert pooled.processed == 8
+    assert pooled.kept == serial.kept
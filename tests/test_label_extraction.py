@@ -0,0 +1,53 @@
+import zipfile
+
+from src import label_extraction
+from src.label_extraction import make_synthetic_export, stream_extract_labels
+
+
+def read_dir(path):
+    return {file.name: file.read_bytes() for file in path.iterdir()}
+
+
+def test_labels_are_extracted_flat(tmp_path):
+    archive = tmp_path / "annotations.zip"
+    with zipfile.ZipFile(archive, "w") as zip_file:
+        zip_file.writestr("export/labels/a.txt", "0 0.5 0.5 0.1 0.1\n")
+        zip_file.writestr("export/labels/nested/b.txt", "1 0.2 0.2 0.1 0.1\n")
+        zip_file.writestr("export/readme.md", "not a label")
+        zip_file.writestr("export/labels/big.txt", "2 0.5 0.5 0.1 0.1\n" * 10000)  # Copied by chunks
+
+    report = stream_extract_labels(archive, tmp_path / "dataset")
+
+    files = read_dir(tmp_path / "dataset")
+    assert sorted(files) == ["a.txt", "b.txt", "big.txt"]
+    assert files["b.txt"] == b"1 0.2 0.2 0.1 0.1\n"
+    assert len(files["big.txt"]) > label_extraction.BUFFER_SIZE
+    assert report.written == 3
+    assert report.bytes == sum(len(content) for content in files.values())
+
+
+def test_stale_labels_are_removed_and_images_kept(tmp_path):
+    dataset = tmp_path / "dataset"
+    dataset.mkdir()
+    (dataset / "image_000000.txt").write_text("old label")
+    (dataset / "gone.txt").write_text("0 0.5 0.5 0.1 0.1\n")
+    (dataset / "image_000000.jpg").write_bytes(b"pixels")
+    archive = make_synthetic_export(tmp_path / "annotations.zip", 5)
+
+    report = stream_extract_labels(archive, dataset)
+
+    assert report.removed == 1
+    assert not (dataset / "gone.txt").exists()
+    assert (dataset / "image_000000.jpg").read_bytes() == b"pixels"
+    assert (dataset / "image_000000.txt").read_text().startswith("0 ")
+
+
+def test_concurrent_extraction_writes_the_same_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(label_extraction, "MIN_FILES_PER_WORKER", 10)
+    archive = make_synthetic_export(tmp_path / "annotations.zip", 95)
+
+    stream_extract_labels(archive, tmp_path / "serial")
+    report = stream_extract_labels(archive, tmp_path / "concurrent", workers=4)
+
+    assert report.written == 95
+    assert read_dir(tmp_path / "concurrent") == read_dir(tmp_path / "serial")
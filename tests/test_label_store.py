@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from src.label_store import LabelStore, label_path
+
+
+@pytest.fixture
+def split(tmp_path):
+    """train/images and train/labels as made by split_dataset, image_3 without label"""
+    images_path = tmp_path / "train" / "images"
+    labels_path = tmp_path / "train" / "labels"
+    images_path.mkdir(parents=True)
+    labels_path.mkdir(parents=True)
+    images = []
+    for i in range(6):
+        images.append(images_path / f"image_{i}.jpg")
+        images[-1].write_bytes(b"jpg")
+        if i != 3:
+            boxes = "".join(f"{(i + j) % 3} 0.5 0.{j + 2} 0.1 0.1\n" for j in range(i % 3 + 1))
+            (labels_path / f"image_{i}.txt").write_text(boxes)
+    return tmp_path, images
+
+
+def test_build_packs_the_boxes(split):
+    root, images = split
+    store = LabelStore.build(images, root)
+
+    assert store.images[0] == "train/images/image_0.jpg"
+    assert np.diff(store.offsets).tolist() == [1, 2, 3, 0, 2, 3]
+    assert store.labelled.tolist() == [True, True, True, False, True, True]
+    expected = [[2, 0.5, 0.2, 0.1, 0.1], [0, 0.5, 0.3, 0.1, 0.1], [1, 0.5, 0.4, 0.1, 0.1]]
+    assert np.allclose(store.boxes(2), expected)
+    assert store.lines[store.offsets[2] : store.offsets[3]].tolist() == [1, 2, 3]
+    assert store.class_counts(nc=3).tolist() == [3, 4, 4]
+    assert store.image_counts(nc=3).tolist() == [3, 4, 4]
+
+
+def test_save_load_and_incremental_build(split):
+    root, images = split
+    LabelStore.build(images, root).save(root / "store")
+    store = LabelStore.load(root / "store", root)
+    assert isinstance(store.rows, np.memmap)
+
+    (root / "train" / "labels" / "image_1.txt").write_text("2 0.1 0.1 0.1 0.1\nnot a box\n")
+    (root / "train" / "labels" / "image_3.txt").write_text("0 0.9 0.9 0.1 0.1\n")
+    rebuilt = LabelStore.build(images[1:], root, previous=store)
+
+    assert rebuilt.parsed == 2
+    fresh = LabelStore.build(images[1:], root)
+    for name in ("rows", "offsets", "lines", "malformed", "stats"):
+        assert np.array_equal(getattr(rebuilt, name), getattr(fresh, name)), name
+    assert rebuilt.malformed.tolist() == [[0, 2]]
+
+
+def test_export_txt_round_trip(split):
+    root, images = split
+    store = LabelStore.build(images, root)
+    for label in (root / "train" / "labels").iterdir():
+        label.unlink()
+
+    assert store.export_txt() == 5
+    assert not label_path(images[3]).exists()
+    assert label_path(images[0]).read_text() == "0 0.500000 0.200000 0.100000 0.100000\n"
+    assert np.array_equal(LabelStore.build(images, root).rows, store.rows)
+    assert LabelStore.build(images, root, previous=store).parsed == 0
+
+
+def test_rarest_classes():
+    images = [f"image_{i}.jpg" for i in range(4)]
+    rows = np.array([[0, 0.5, 0.5, 0.1, 0.1], [1, 0.5, 0.5, 0.1, 0.1], [0, 0.5, 0.5, 0.1, 0.1], [1, 0.5, 0.5, 0.1, 0.1],
+                     [2, 0.5, 0.5, 0.1, 0.1]], dtype=np.float32)  # fmt: skip
+    offsets = np.array([0, 2, 3, 3, 5])
+    store = LabelStore("root", images, rows, offsets, np.ones(5), np.zeros((0, 2)), np.zeros((4, 2)))
+
+    # Classes 0 and 1 are in 2 images, class 2 in 1: ties go to the lowest class
+    assert store.rarest_classes().tolist() == [0, 0, -1, 2]
@@ -0,0 +1,98 @@
+import os
+
+from src.label_store import LabelStore
+from src.label_validation import validate_stores
+
+
+def make_split(tmp_path, labels: list[str | bytes | None]):
+    """train/images and train/labels, one image per label file content (None: the image has no label file)"""
+    images_path = tmp_path / "train" / "images"
+    labels_path = tmp_path / "train" / "labels"
+    images_path.mkdir(parents=True, exist_ok=True)
+    labels_path.mkdir(parents=True, exist_ok=True)
+    images = []
+    for i, content in enumerate(labels):
+        images.append(images_path / f"image_{i}.jpg")
+        images[-1].write_bytes(b"jpg")
+        if isinstance(content, str):
+            (labels_path / f"image_{i}.txt").write_text(content)
+        elif content is not None:
+            (labels_path / f"image_{i}.txt").write_bytes(content)
+    return images
+
+
+def checks(result, kind="errors"):
+    return {check: entry["lines"] for check, entry in result[kind].items()}
+
+
+def test_checks(tmp_path):
+    images = make_split(
+        tmp_path,
+        [
+            "0 0.5 0.5 0.2 0.2\n2 0.1 0.1 0.1 0.1\n\n",
+            "0 0.5 0.5 0.2\n"  # format
+            "3 0.5 0.5 0.2 0.2\n"  # class >= nc
+            "1.5 0.5 0.5 0.2 0.2\n"  # class not an integer
+            "-1 0.5 0.5 0.2 0.2\n"  # negative class
+            "1 1.2 0.5 0.2 0.2\n"  # coords
+            "1 0.5 0.5 0 0.2\n"  # size
+            "1 0.5 0.5 abc 0.2\n"  # format (not a number)
+            "1 0.95 0.5 0.2 0.2\n"  # bounds (warning)
+            "1 0.5 0.5 0.2 0.2\n"
+            "1 0.5 0.5 0.2 0.2\n",  # duplicate (warning)
+        ],
+    )
+
+    report = validate_stores({"train": LabelStore.build(images, tmp_path)}, nc=3)
+
+    bad_result = report.files[str(tmp_path / "train" / "labels" / "image_1.txt")]
+    assert list(report.files) == [str(tmp_path / "train" / "labels" / "image_1.txt")]
+    assert checks(bad_result) == {"format": [1, 7], "class": [2, 3, 4], "coords": [5], "size": [6]}
+    assert checks(bad_result, "warnings") == {"bounds": [8], "duplicate": [10]}
+    assert bad_result["boxes"] == 3
+    assert report.splits["train"]["boxes"] == 2 + 3
+
+
+def test_unreadable_missing_and_without_nc(tmp_path):
+    images = make_split(tmp_path, ["7 0.5 0.5 0.2 0.2\n", b"\xff\xfe", None])
+
+    report = validate_stores({"train": LabelStore.build(images, tmp_path), "test": None})
+
+    assert report.errors == {"unreadable": 1, "missing_split": 1}  # No class range without nc
+    assert report.warnings == {"missing_label": 1}
+    assert report.splits["train"]["missing_labels"] == 1 and report.splits["test"] is None
+
+
+def test_duplicates_are_per_file(tmp_path):
+    images = make_split(tmp_path, ["0 0.5 0.5 0.2 0.2\n", "0 0.5 0.5 0.2 0.2\n"])
+
+    assert validate_stores({"train": LabelStore.build(images, tmp_path)}).warnings == {}
+
+
+def test_report_and_rebuilt_store(tmp_path):
+    images = make_split(tmp_path, ["9 0.5 0.5 0.2 0.2\n" if i == 3 else "0 0.5 0.5 0.2 0.2\n" for i in range(20)])
+    store = LabelStore.build(images, tmp_path)
+
+    report = validate_stores({"train": store, "test": None}, nc=2)
+
+    assert not report.ok
+    assert report.errors == {"missing_split": 1, "class": 1}
+    assert report.splits["train"] == {
+        "images": 20,
+        "labels": 20,
+        "missing_labels": 0,
+        "boxes": 19,
+        "boxes_per_class": [19, 0],
+        "images_per_class": [19, 0],
+        "invalid_files": 1,
+    }
+    assert list(report.files) == [str(tmp_path / "train" / "labels" / "image_3.txt")]
+    assert report.checked == 20 and report.cached == 0
+
+    # Fixed label: only this file is parsed again
+    label = tmp_path / "train" / "labels" / "image_3.txt"
+    label.write_text("1 0.5 0.5 0.2 0.2\n")
+    os.utime(label, ns=(0, 10**9))
+    report = validate_stores({"train": LabelStore.build(images, tmp_path, previous=store)}, nc=2)
+    assert report.ok and report.checked == 1 and report.cached == 19
+    assert report.splits["train"]["boxes_per_class"] == [19, 1]
@@ -0,0 +1,77 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from src.load_test import Sample, load_corpus, run_closed_loop, run_open_loop, summarize, synthetic_image
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    (tmp_path / "image.jpg").write_bytes(synthetic_image(32, 24))
+    lines = [
+        {"endpoint": "predict", "image": "image.jpg"},
+        {"endpoint": "predict", "synthetic": [64, 48], "seed": 1, "accept": "application/x-yolo-detections"},
+    ]
+    path = tmp_path / "corpus.jsonl"
+    path.write_text("\n".join(json.dumps(line) for line in lines) + "\n")
+    return load_corpus(path)
+
+
+def make_client(status_for_call=lambda i: 200, delay=0.0):
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        await asyncio.sleep(delay)
+        return httpx.Response(status_for_call(len(calls)), json={"boxes": []})
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://test"), calls
+
+
+def test_load_corpus(corpus):
+    assert [request.content_type for request in corpus] == ["image/jpeg", "image/jpeg"]
+    assert corpus[1].headers == {"accept": "application/x-yolo-detections"}
+    assert synthetic_image(64, 48, seed=1) == corpus[1].body  # Deterministic
+
+
+def test_closed_loop_round_robin(corpus):
+    async def run():
+        client, calls = make_client()
+        async with client:
+            samples = await run_closed_loop(client, corpus, concurrency=3, num_requests=10)
+        return samples, calls
+
+    samples, calls = asyncio.run(run())
+
+    assert len(samples) == len(calls) == 10
+    assert sum(1 for call in calls if call.headers.get("accept") == "application/x-yolo-detections") == 5
+    assert all(call.url.path == "/predict" for call in calls)
+
+
+def test_open_loop_keeps_the_arrival_rate_when_the_server_is_slow(corpus):
+    async def run():
+        client, calls = make_client(delay=0.3)
+        async with client:
+            return await run_open_loop(client, corpus, rate=50, duration=0.41, poisson=False)
+
+    samples = asyncio.run(run())
+
+    assert len(samples) == 20  # Every 20 ms, not throttled by the 300 ms responses
+    assert all(sample.latency >= 0.3 for sample in samples)
+
+
+def test_summarize_reports_errors_and_percentiles():
+    samples = [Sample("1:a", 200, latency / 1000) for latency in range(1, 101)]
+    samples += [Sample("2:b", 503, 0.001, "HTTP 503"), Sample("2:b", None, 0.5, "ConnectError: refused")]
+
+    report = summarize(samples, elapsed=2.0)
+
+    assert report["requests"] == 102 and report["errors"] == 2
+    assert report["error_rate"] == pytest.approx(2 / 102)
+    assert report["throughput_rps"] == 50
+    assert report["latency_ms"]["p50"] == pytest.approx(50.5)
+    assert report["latency_ms"]["p99"] == pytest.approx(99.01)
+    assert report["status_codes"] == {"200": 100, "503": 1, "none": 1}
+    assert report["by_request"]["2:b"]["latency_ms"]["p50"] is None
@@ -0,0 +1,33 @@
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+SCRIPT = """
+from prometheus_client import CollectorRegistry
+from prometheus_client.multiprocess import MultiProcessCollector
+
+from src.metrics import set_active_model
+
+set_active_model("yolo11n/1", "torch")
+set_active_model("yolo11n/2", "torch", previous_version="yolo11n/1")
+
+registry = CollectorRegistry()
+MultiProcessCollector(registry)
+for metric in registry.collect():
+    if metric.name == "yolo_active_model":
+        for sample in metric.samples:
+            print(sample.labels["model_version"], sample.value)
+"""
+
+
+def test_active_model_after_swap_in_multiprocess_mode(tmp_path):
+    """The previous version reports 0, as BentoML serves the metrics aggregated from the processes' files"""
+    env = {"PROMETHEUS_MULTIPROC_DIR": str(tmp_path), "PATH": ""}
+    output = subprocess.run(
+        [sys.executable, "-c", SCRIPT], cwd=ROOT_DIR, env=env, capture_output=True, text=True, check=True
+    )
+
+    values = dict(line.split() for line in output.stdout.splitlines())
+    assert values == {"yolo11n/1": "0.0", "yolo11n/2": "1.0"}
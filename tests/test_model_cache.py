@@ -0,0 +1,97 @@
+import multiprocessing
+import time
+
+from src.model_cache import ModelCache
+
+
+class FakeRegistry:
+    """Artifacts of the registered versions, counting the downloads"""
+
+    def __init__(self, artifacts: dict):
+        self.artifacts = artifacts
+        self.downloads = []
+
+    def download(self, key):
+        def download(dst_path):
+            self.downloads.append(key)
+            path = dst_path / key[-1].split("/")[-1]
+            path.write_bytes(self.artifacts[key])
+            return path
+
+        return download
+
+
+def get(cache, registry, *key):
+    return cache.get(*key, registry.download(key))
+
+
+def test_hit_after_restart(tmp_path):
+    registry = FakeRegistry({("yolo11n", "1", "weights/best.pt"): b"v1", ("yolo11n", "2", "weights/best.pt"): b"v1"})
+
+    path = get(ModelCache(tmp_path), registry, "yolo11n", "1", "weights/best.pt")
+    assert path.read_bytes() == b"v1" and path.name == "best.pt"
+    # Another process (a new instance) finds it
+    assert get(ModelCache(tmp_path), registry, "yolo11n", "1", "weights/best.pt") == path
+    assert len(registry.downloads) == 1
+
+    # Same content under another version: downloaded to know its checksum, stored once
+    assert get(ModelCache(tmp_path), registry, "yolo11n", "2", "weights/best.pt") == path
+    assert len(registry.downloads) == 2
+    assert list((tmp_path / "tmp").iterdir()) == []
+
+
+def test_corrupted_object_is_downloaded_again(tmp_path):
+    registry = FakeRegistry({("yolo11n", "1", "weights/best.pt"): b"weights"})
+    cache = ModelCache(tmp_path)
+
+    get(cache, registry, "yolo11n", "1", "weights/best.pt").write_bytes(b"trunc")
+    assert get(cache, registry, "yolo11n", "1", "weights/best.pt").read_bytes() == b"weights"
+    assert len(registry.downloads) == 2
+
+
+def test_lru_eviction(tmp_path):
+    registry = FakeRegistry({("yolo11n", str(v), "weights/best.pt"): bytes([v]) * 100 for v in range(1, 5)})
+    cache = ModelCache(tmp_path, max_bytes=250)
+
+    v1 = get(cache, registry, "yolo11n", "1", "weights/best.pt")
+    v1.with_suffix(".onnx").write_bytes(b"export")  # Cached next to the weights by the backends
+    get(cache, registry, "yolo11n", "2", "weights/best.pt")
+    get(cache, registry, "yolo11n", "1", "weights/best.pt")  # v2 is now the least recently used
+    get(cache, registry, "yolo11n", "3", "weights/best.pt")
+
+    assert cache.size() == 200
+    assert v1.exists() and v1.with_suffix(".onnx").exists()
+    get(cache, registry, "yolo11n", "1", "weights/best.pt")
+    get(cache, registry, "yolo11n", "2", "weights/best.pt")
+    assert registry.downloads.count(("yolo11n", "1", "weights/best.pt")) == 1
+    assert registry.downloads.count(("yolo11n", "2", "weights/best.pt")) == 2
+
+    # Bigger than the cache: kept until the next artifact
+    registry.artifacts[("yolo11n", "5", "weights/best.pt")] = b"0" * 300
+    assert get(cache, registry, "yolo11n", "5", "weights/best.pt").exists()
+    assert cache.size() == 300
+
+
+def slow_download(root, results):
+    def download(dst_path):
+        time.sleep(0.2)
+        results.put("download")
+        path = dst_path / "best.pt"
+        path.write_bytes(b"weights")
+        return path
+
+    results.put(str(ModelCache(root).get("yolo11n", "1", "weights/best.pt", download)))
+
+
+def test_concurrent_processes_download_once(tmp_path):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = [context.Process(target=slow_download, args=(tmp_path, results)) for _ in range(3)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=60)
+
+    messages = [results.get(timeout=5) for _ in range(4)]
+    assert messages.count("download") == 1
+    assert len({message for message in messages if message != "download"}) == 1
@@ -0,0 +1,137 @@
+import pytest
+
+mlflow = pytest.importorskip("mlflow")
+
+from mlflow import MlflowClient  # noqa: E402
+
+from src.model_registry import RegistryModelWatcher  # noqa: E402
+
+MODEL_NAME = "yolo11n"
+
+
+@pytest.fixture
+def s3_artifact_root(monkeypatch):
+    """Local S3 stand-in for MinIO"""
+    moto_server = pytest.importorskip("moto.server")
+    boto3 = pytest.importorskip("boto3")
+
+    server = moto_server.ThreadedMotoServer(port=0)
+    server.start()
+    host, port = server.get_host_and_port()
+    endpoint_url = f"http://{host}:{port}"
+    monkeypatch.setenv("MLFLOW_S3_ENDPOINT_URL", endpoint_url)
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    boto3.client("s3", endpoint_url=endpoint_url).create_bucket(Bucket="mlflow")
+    yield "s3://mlflow/mlflow-artifacts"
+    server.stop()
+
+
+def register_weights(tmp_path, content: bytes, alias: str = "Champion", experiment_id: str | None = None) -> str:
+    """Logs fake weights the way Trainer.train_model does and registers them under the alias"""
+    weights = tmp_path / "best.pt"
+    weights.write_bytes(content)
+    with mlflow.start_run(experiment_id=experiment_id) as run:
+        mlflow.log_artifact(str(weights), artifact_path="weights")
+    client = MlflowClient()
+    if not client.search_registered_models(filter_string=f"name = '{MODEL_NAME}'"):
+        client.create_registered_model(MODEL_NAME)
+    model_version = client.create_model_version(
+        MODEL_NAME, source=f"{run.info.artifact_uri}/weights/best.pt", run_id=run.info.run_id
+    )
+    client.set_registered_model_alias(MODEL_NAME, alias, model_version.version)
+    return model_version.version
+
+
+def check_watcher_follows_alias(tmp_path, experiment_id=None):
+    loaded = []
+    watcher = RegistryModelWatcher(
+        MODEL_NAME,
+        "Champion",
+        on_new_version=lambda version, path: loaded.append((version.version, path.read_bytes())),
+        download_dir=tmp_path / "models",
+    )
+
+    register_weights(tmp_path, b"weights v1", experiment_id=experiment_id)
+    model_version, weights_path = watcher.load_current()
+    assert weights_path.read_bytes() == b"weights v1"
+    assert weights_path.is_relative_to(tmp_path / "models")
+
+    # Alias did not move: nothing to load
+    assert not watcher.check()
+    assert loaded == []
+
+    version = register_weights(tmp_path, b"weights v2", experiment_id=experiment_id)
+    assert watcher.check()
+    assert loaded == [(version, b"weights v2")]
+    assert watcher.current_version.version == version
+
+
+def test_watcher_with_local_artifacts(tracking_uri, tmp_path):
+    check_watcher_follows_alias(tmp_path)
+
+
+def test_watcher_with_s3_artifacts(tracking_uri, s3_artifact_root, tmp_path):
+    experiment_id = mlflow.create_experiment("s3", artifact_location=s3_artifact_root)
+    check_watcher_follows_alias(tmp_path, experiment_id)
+
+
+def test_failed_refresh_keeps_current_version(tracking_uri, tmp_path):
+    """Test that an error while loading the new version does not replace the served one"""
+
+    def failing_load(version, path):
+        raise RuntimeError("corrupted weights")
+
+    watcher = RegistryModelWatcher(MODEL_NAME, "Champion", failing_load, download_dir=tmp_path / "models")
+    register_weights(tmp_path, b"weights v1")
+    watcher.load_current()
+
+    register_weights(tmp_path, b"weights v2")
+    with pytest.raises(RuntimeError):
+        watcher.check()
+    assert str(watcher.current_version.version) == "1"
+
+
+def test_watcher_selects_variant(tracking_uri, tmp_path):
+    """Fastest variant within the tolerance, the .pt weights when the version has no variants"""
+    version = register_weights(tmp_path, b"weights v1")
+    run_id = MlflowClient().get_model_version(MODEL_NAME, version).run_id
+    (tmp_path / "model.int8.onnx").write_bytes(b"int8")
+    table = [
+        {"variant": "torch", "file": "best.pt", "accuracy_drop": 0.0, "latency/batch_1_ms": 40.0},
+        {"variant": "onnx-int8", "file": "model.int8.onnx", "accuracy_drop": 0.004, "latency/batch_1_ms": 12.0},
+    ]
+    mlflow.log_artifact(str(tmp_path / "model.int8.onnx"), artifact_path="variants", run_id=run_id)
+    mlflow.log_dict(table, "variants/variants.json", run_id=run_id)
+
+    def load_current(tolerance):
+        watcher = RegistryModelWatcher(
+            MODEL_NAME, "Champion", lambda *args: None, tmp_path / "models", variant_tolerance=tolerance
+        )
+        served = watcher.load_current()[1].read_bytes()
+        assert watcher.current_weights.read_bytes().startswith(b"weights")  # Loaded by the tracking streams
+        return served
+
+    assert load_current(0.01) == b"int8"
+    assert load_current(0.001) == b"weights v1"
+    assert load_current(None) == b"weights v1"
+
+    register_weights(tmp_path, b"weights v2")
+    assert load_current(0.01) == b"weights v2"
+
+
+def test_restarted_watcher_uses_cache(tracking_uri, tmp_path):
+    """Test that the weights of an unchanged version are not downloaded again after a restart"""
+    register_weights(tmp_path, b"weights v1")
+    downloads = []
+
+    def load_current():
+        watcher = RegistryModelWatcher(MODEL_NAME, "Champion", lambda *args: None, tmp_path / "models")
+        download_artifacts = watcher.client.download_artifacts
+        watcher.client.download_artifacts = lambda *args: downloads.append(args) or download_artifacts(*args)
+        return watcher.load_current()[1]
+
+    path = load_current()
+    assert load_current() == path and path.read_bytes() == b"weights v1"
+    assert len(downloads) == 1
@@ -0,0 +1,94 @@
+import json
+
+import numpy as np
+import pytest
+
+from src.postprocess import Detections, accepts_packed, decode_packed
+
+
+class FakeTensor:
+    def __init__(self, array):
+        self.array = array
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+
+class FakeBoxes:
+    def __init__(self, data):
+        self.data = FakeTensor(data)
+
+
+class FakeResult:
+    """Minimal stand-in for an ultralytics Results object"""
+
+    def __init__(self, data, columns=6):
+        self.boxes = FakeBoxes(np.asarray(data, dtype=np.float32).reshape(-1, columns))
+        self.names = {0: "tuna", 1: "twix", 2: "bueno"}
+        self.speed = {"preprocess": 1.0, "inference": 12.5, "postprocess": 0.5}
+
+
+@pytest.fixture
+def result():
+    return FakeResult([[10, 20, 30, 40, 0.9, 1], [0.5, 1.5, 2.5, 3.5, 0.3, 2]])
+
+
+def test_to_dict_matches_api_contract(result):
+    response = Detections.from_result(result).to_dict()
+
+    assert response["inference_time"] == 12.5
+    assert response["boxes"][0] == {
+        "xyxy": [10.0, 20.0, 30.0, 40.0],
+        "confidence": pytest.approx(0.9),
+        "class_id": 1,
+        "class_name": "twix",
+    }
+    assert response["boxes"][1]["class_name"] == "bueno"
+    json.dumps(response)  # only native python types
+
+
+def test_packed_round_trip(result):
+    detections = Detections.from_result(result)
+    payload = detections.to_packed()
+    class_names = json.loads(detections.class_names_header())
+
+    assert len(payload) == 12 + 2 * 6 * 4
+    assert decode_packed(payload, class_names) == detections.to_dict()
+
+
+def test_no_detections():
+    detections = Detections.from_result(FakeResult([]))
+
+    assert detections.to_dict()["boxes"] == []
+    assert decode_packed(detections.to_packed())["boxes"] == []
+
+
+def test_content_negotiation():
+    assert accepts_packed("application/x-yolo-detections")
+    assert accepts_packed("application/x-yolo-detections, application/json;q=0.5")
+    assert not accepts_packed("application/json")
+    assert not accepts_packed(None)
+
+
+def test_rescale_to_original_image(result):
+    detections = Detections.from_result(result)
+    detections.rescale(factors=(2.0, 4.0), offset=(0.0, 10.0), size=(50, 100))
+
+    assert detections.xyxy[0].tolist() == [20.0, 40.0, 50.0, 100.0]  # clipped to the image size
+    assert detections.xyxy.dtype == np.float32
+
+
+def test_track_ids_from_tracking_results():
+    tracked = FakeResult([[10, 20, 30, 40, 7, 0.9, 1], [0, 0, 5, 5, 3, 0.4, 0]], columns=7)
+    detections = Detections.from_result(tracked)
+
+    assert detections.class_id.tolist() == [1, 0]
+    assert detections.confidence.tolist() == pytest.approx([0.9, 0.4])
+    assert [box["track_id"] for box in detections.to_dict()["boxes"]] == [7, 3]
+
+
+def test_no_track_ids_without_tracking(result):
+    assert "track_id" not in Detections.from_result(result).to_dict()["boxes"][0]
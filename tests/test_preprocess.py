@@ -0,0 +1,46 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+pytest.importorskip("cv2")
+
+from src.preprocess import decode_image, letterbox_batch  # noqa: E402
+
+
+def encode(size, format):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color=(200, 10, 10)).save(buffer, format=format)
+    return buffer.getvalue()
+
+
+def test_large_jpeg_is_decoded_at_reduced_scale():
+    decoded = decode_image(encode((4000, 3000), "JPEG"), target_size=640)
+
+    assert decoded.original_size == (4000, 3000)
+    assert decoded.array.shape == (750, 1000, 3)  # 1/4 scale, still larger than the model input
+    assert decoded.decode_scale == (4.0, 4.0)
+    assert decoded.decode_time > 0
+
+
+def test_small_and_png_images_are_decoded_at_full_scale():
+    assert decode_image(encode((320, 240), "JPEG"), target_size=640).array.shape == (240, 320, 3)
+    assert decode_image(encode((2000, 1000), "PNG"), target_size=640).array.shape == (1000, 2000, 3)
+
+
+def test_lazy_pil_image_is_accepted():
+    image = Image.open(io.BytesIO(encode((1280, 1280), "JPEG")))
+
+    assert decode_image(image, target_size=640).array.shape == (640, 640, 3)
+
+
+def test_letterbox_buffer_is_reused():
+    images = [np.zeros((480, 640, 3), dtype=np.uint8)] * 2
+
+    first, transforms, _ = letterbox_batch(images, 640)
+    second, _, _ = letterbox_batch(images, 640)
+
+    assert first[0].shape == (480, 640, 3)
+    assert transforms == [(1.0, (0, 0))] * 2
+    assert np.shares_memory(first[0], second[0])
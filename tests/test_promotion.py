@@ -0,0 +1,61 @@
+import pytest
+import yaml
+
+from src.promotion import has_test_split, measure_latency, promotion_decision
+
+KEY = "metrics/mAP50-95B"
+
+
+def metrics(accuracy, latency_1, latency_8):
+    return {f"test/{KEY}": accuracy, "latency/batch_1_ms": latency_1, "latency/batch_8_ms": latency_8}
+
+
+def test_promotion_decision():
+    champion = metrics(0.50, 20.0, 100.0)
+
+    assert promotion_decision(metrics(0.55, 21.0, 105.0), champion, KEY, [1, 8]) == (True, [])
+    promote, reasons = promotion_decision(metrics(0.50, 20.0, 100.0), champion, KEY, [1, 8])
+    assert not promote and len(reasons) == 1 and reasons[0].startswith(f"test/{KEY}")
+    # More accurate but slower than the budget at batch 8
+    promote, reasons = promotion_decision(metrics(0.60, 21.0, 120.0), champion, KEY, [1, 8], latency_budget=0.1)
+    assert not promote and reasons[0].startswith("batch 8")
+    assert promotion_decision(metrics(0.60, 21.0, 120.0), champion, KEY, [1, 8], latency_budget=0.25)[0]
+    assert not promotion_decision(metrics(0.60, 21.0, 105.0), champion, KEY, [1, 8], max_latency_ms=100)[0]
+
+
+def test_promotion_decision_without_test_split():
+    candidate = {KEY: 0.6, "latency/batch_1_ms": 10.0}
+    champion = {KEY: 0.5, f"test/{KEY}": 0.7, "latency/batch_1_ms": 10.0}
+
+    # Compared on the validation metric when one of them has no test metrics
+    assert promotion_decision(candidate, champion, KEY, [1]) == (True, [])
+
+
+class FakeModel:
+    def __init__(self):
+        self.batches = []
+
+    def predict(self, images, **kwargs):
+        self.batches.append(len(images))
+
+
+def test_measure_latency():
+    model = FakeModel()
+    result = measure_latency(model, imgsz=32, batch_sizes=[1, 4], iterations=3, warmup=1)
+
+    assert model.batches == [1] * 4 + [4] * 4
+    assert set(result) == {
+        "latency/batch_1_ms",
+        "throughput/batch_1_ips",
+        "latency/batch_4_ms",
+        "throughput/batch_4_ips",
+    }
+    assert result["throughput/batch_4_ips"] == pytest.approx(4000 / result["latency/batch_4_ms"])
+
+
+def test_has_test_split(tmp_path):
+    data_yaml = tmp_path / "yolo.yaml"
+    data_yaml.write_text(yaml.safe_dump({"train": "train.txt", "val": "valid.txt", "test": "test.txt"}))
+    assert has_test_split(data_yaml)
+    data_yaml.write_text(yaml.safe_dump({"train": "train.txt", "val": "valid.txt"}))
+    assert not has_test_split(data_yaml)
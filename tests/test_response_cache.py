@@ -0,0 +1,61 @@
+import time
+
+from src.response_cache import ResponseCache
+
+RESPONSE = {"boxes": [{"xyxy": [0.0, 0.0, 1.0, 1.0], "confidence": 0.9, "class_id": 0, "class_name": "tuna"}]}
+
+
+def test_key_depends_on_image_model_and_params():
+    key = ResponseCache.make_key(b"pixels", "yolo11n/1", {"conf": 0.25})
+
+    assert key == ResponseCache.make_key(b"pixels", "yolo11n/1", {"conf": 0.25})
+    assert key != ResponseCache.make_key(b"other pixels", "yolo11n/1", {"conf": 0.25})
+    assert key != ResponseCache.make_key(b"pixels", "yolo11n/2", {"conf": 0.25})
+    assert key != ResponseCache.make_key(b"pixels", "yolo11n/1", {"conf": 0.5})
+
+
+def test_hit_and_miss_counters():
+    cache = ResponseCache()
+    assert cache.get("a") is None
+    cache.put("a", RESPONSE)
+    assert cache.get("a") == RESPONSE
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", RESPONSE)
+    cache.put("b", RESPONSE)
+    cache.get("a")  # b is now the least recently used
+    cache.put("c", RESPONSE)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["evictions"] == 1
+
+    entry_size = cache.stats()["bytes"] // 2
+    cache = ResponseCache(max_bytes=entry_size * 2)
+    for key in "abc":
+        cache.put(key, RESPONSE)
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["bytes"] <= entry_size * 2
+
+
+def test_ttl_expiry():
+    cache = ResponseCache(ttl=0.01)
+    cache.put("a", RESPONSE)
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_clear_on_model_change():
+    cache = ResponseCache()
+    cache.put("a", RESPONSE)
+    cache.clear()
+
+    assert cache.get("a") is None
+    assert cache.stats()["invalidations"] == 1
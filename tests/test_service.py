@@ -0,0 +1,151 @@
+import asyncio
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import torch
+from bentoml.exceptions import ServiceUnavailable
+from prometheus_client import REGISTRY
+from ultralytics.engine.results import Results
+
+import service
+
+CONTEXT = SimpleNamespace(request=SimpleNamespace(headers={}))
+NAMES = {i: f"class_{i}" for i in range(256)}
+
+
+class FakeModel:
+    """
+    One box per image, its class given by the center pixel and its confidence by the weights path. Records the size of
+    each predict call, and blocks while release is cleared.
+    """
+
+    def __init__(self, weights_path: str, release: threading.Event) -> None:
+        self.weights_path = weights_path
+        self.confidence = 0.9 if str(weights_path).endswith("v1.pt") else 0.5
+        self.release = release
+        self.batches = []
+
+    def predict(self, images, **kwargs):
+        images = [images] if isinstance(images, np.ndarray) and images.ndim == 3 else images  # The warm-up image
+        self.release.wait(timeout=5)
+        self.batches.append(len(images))
+        results = []
+        for image in images:
+            h, w = image.shape[:2]
+            boxes = torch.tensor([[0.0, 0.0, 8.0, 8.0, self.confidence, float(image[h // 2, w // 2, 0])]])
+            results.append(Results(image, path="", names=NAMES, boxes=boxes))
+            results[-1].speed = {"preprocess": 1.0, "inference": 10.0, "postprocess": 1.0}
+        return results
+
+
+@pytest.fixture
+def release():
+    event = threading.Event()
+    event.set()
+    return event
+
+
+@pytest.fixture
+def make_service(monkeypatch, release):
+    """YOLOService with the given module settings (e.g. BATCHING_ENABLED=True), serving FakeModel replicas"""
+    services = []
+
+    def make_service(**settings):
+        monkeypatch.setattr(service, "MODEL_NAME", "v1.pt")
+        for name, value in settings.items():
+            monkeypatch.setattr(service, name, value)
+        monkeypatch.setattr(
+            service, "load_backend", lambda weights_path, *args, **kwargs: FakeModel(weights_path, release)
+        )
+        services.append(service.YOLOService.inner())
+        monkeypatch.setattr(service, "MODEL_REGISTRY_NAME", "yolo11n")  # Label of the swapped versions, no watcher
+        return services[-1]
+
+    yield make_service
+    for yolo_service in services:
+        yolo_service.pool.shutdown()
+
+
+def image(value: int):
+    from PIL import Image
+
+    return Image.fromarray(np.full((48, 64, 3), value, dtype=np.uint8))
+
+
+def predict(yolo_service, value: int) -> dict:
+    return asyncio.run(yolo_service.predict(image(value), CONTEXT))
+
+
+def test_concurrent_requests_are_batched(make_service):
+    yolo_service = make_service(BATCHING_ENABLED=True, MAX_BATCH_SIZE=4, MAX_WAIT_MS=200)
+    model = yolo_service.pool.workers[0].model
+    observed = REGISTRY.get_sample_value("yolo_batch_size_count", {"model_version": "v1.pt"}) or 0
+
+    async def run():
+        return await asyncio.gather(*(yolo_service.predict(image(value), CONTEXT) for value in (1, 2, 3, 4)))
+
+    responses = asyncio.run(run())
+
+    assert model.batches == [1, 4]  # The warm-up, then a single forward pass
+    assert [response["boxes"][0]["class_id"] for response in responses] == [1, 2, 3, 4]
+    assert REGISTRY.get_sample_value("yolo_batch_size_count", {"model_version": "v1.pt"}) == observed + 1
+    assert REGISTRY.get_sample_value("yolo_batch_size_sum", {"model_version": "v1.pt"}) >= 4
+
+
+def test_cached_response(make_service):
+    yolo_service = make_service(CACHE_ENABLED=True)
+    first = predict(yolo_service, 1)
+    hit = predict(yolo_service, 1)
+    predict(yolo_service, 2)
+
+    assert hit["boxes"] == first["boxes"]
+    assert first["inference_time"] == 10.0
+    # The hit reports its own timings: only a decode, no inference
+    assert hit["inference_time"] == 0.0 and hit["preprocess_time"] == 0.0
+    assert hit["decode_time"] is not None
+    stats = asyncio.run(yolo_service.cache_stats())
+    assert (stats["enabled"], stats["hits"], stats["misses"], stats["entries"]) == (True, 1, 2, 2)
+    assert yolo_service.pool.workers[0].model.batches == [1, 1, 1]  # The warm-up and the misses
+
+
+def test_saturated_pool_answers_503(make_service, release):
+    yolo_service = make_service(MAX_QUEUE_SIZE=1, CACHE_ENABLED=True)
+    rejected = REGISTRY.get_sample_value("yolo_rejected_requests_total")
+
+    async def run():
+        release.clear()
+        running = asyncio.create_task(yolo_service.predict(image(1), CONTEXT))
+        await asyncio.sleep(0.05)
+        with pytest.raises(ServiceUnavailable):
+            await yolo_service.predict(image(2), CONTEXT)
+        release.set()
+        return await running
+
+    assert asyncio.run(run())["boxes"]
+    assert REGISTRY.get_sample_value("yolo_rejected_requests_total") == rejected + 1
+    assert asyncio.run(yolo_service.cache_stats())["entries"] == 1  # The rejected request is not cached
+
+
+def test_swap_clears_cache(make_service):
+    yolo_service = make_service(CACHE_ENABLED=True)
+    assert predict(yolo_service, 1)["boxes"][0]["confidence"] == pytest.approx(0.9)
+
+    yolo_service.swap_model(SimpleNamespace(version="2"), "v2.pt")
+    stats = asyncio.run(yolo_service.cache_stats())
+    assert (stats["entries"], stats["invalidations"]) == (0, 1)
+    assert asyncio.run(yolo_service.workers())["model_version"] == "yolo11n/2"
+    assert predict(yolo_service, 1)["boxes"][0]["confidence"] == pytest.approx(0.5)
+    assert REGISTRY.get_sample_value("yolo_active_model", {"model_version": "yolo11n/2", "backend": "torch"}) == 1
+
+
+def test_tracking_loads_weights_of_served_variant(make_service):
+    yolo_service = make_service()
+    assert yolo_service.load_tracking_model().weights_path == "v1.pt"
+
+    # An ONNX variant served from the registry: the tracker runs on the .pt weights of its version
+    yolo_service.watcher = SimpleNamespace(current_weights=Path("models/v2.pt"))
+    yolo_service.swap_model(SimpleNamespace(version="2"), Path("models/v2.int8.onnx"))
+    assert yolo_service.load_tracking_model().weights_path == Path("models/v2.pt")
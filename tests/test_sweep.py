@@ -0,0 +1,56 @@
+import mlflow
+import pytest
+from mlflow import MlflowClient
+
+from src.sweep import Sweep, TrialResult, TrialTask, rung_epochs, sample_params
+
+
+def fake_train(task: TrialTask) -> TrialResult:
+    """Fitness given by lr0, trial 6 (best of the first rung) fails in the second. Module level: workers are spawned"""
+    if task.trial_id == 6 and task.rung == 1:
+        raise RuntimeError("out of memory")
+    # A single training of 9 epochs, resumed at each rung (a failed assertion fails the trial)
+    assert task.max_epochs == 9 and (task.weights is None) == (task.rung == 0)
+    fitness = task.params["lr0"] * 100 + task.epochs / 1000
+    metrics = {"metrics/mAP50-95B": fitness}
+    return TrialResult(fitness, metrics, f"{task.trial_dir}/best.pt", f"{task.trial_dir}/last.pt")
+
+
+@pytest.fixture
+def tracking(tracking_uri):
+    return MlflowClient(tracking_uri)
+
+
+def test_rung_epochs():
+    assert rung_epochs(1, 9, 3) == [1, 3, 9]
+    assert rung_epochs(1, 10, 3) == [1, 3, 9, 10]
+    assert rung_epochs(2, 2, 3) == [2]
+
+
+def test_sample_params():
+    space = {"model": ["yolo11n", "yolo11s"], "lr0": {"low": 1e-4, "high": 1e-2, "log": True}}
+    trials = sample_params(space, 20, seed=0)
+
+    assert trials == sample_params(space, 20, seed=0)
+    assert {trial["model"] for trial in trials} == {"yolo11n", "yolo11s"}
+    assert all(1e-4 <= trial["lr0"] <= 1e-2 for trial in trials)
+
+
+def test_successive_halving(tmp_path, tracking):
+    space = {"lr0": {"low": 0.01, "high": 0.09}}
+    sweep = Sweep("data.yaml", tmp_path / "sweep", space=space, n_trials=9, concurrency=2, train_fn=fake_train)
+    best = sweep.run("test-sweep")
+
+    parent = tracking.search_runs(["0"], "tags.best_run_id != ''")[0]
+    trials = mlflow.artifacts.load_dict(f"runs:/{parent.info.run_id}/sweep.json")["trials"]
+    # 9 trials for 1 epoch, the best 3 for 3 epochs (the best one fails), the best remaining one for 9
+    assert sorted(trial["epochs"] for trial in trials) == [1, 1, 1, 1, 1, 1, 1, 3, 9]
+    assert trials[6]["status"] == "failed"
+    assert best.trial_id == 4 and best.epochs == 9 and best.status == "completed"
+    assert parent.data.tags["best_run_id"] == best.run_id
+
+    runs = {run.info.run_id: run for run in tracking.search_runs(["0"], "tags.status != ''")}
+    assert sorted(run.data.tags["status"] for run in runs.values()) == ["completed", "failed"] + ["stopped"] * 7
+    assert all(run.data.tags["mlflow.parentRunId"] == parent.info.run_id for run in runs.values())
+    assert runs[best.run_id].data.metrics["metrics/mAP50-95B"] == best.fitness
+    assert runs[best.run_id].data.params.keys() == {"sweep.lr0"}
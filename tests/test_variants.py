@@ -0,0 +1,62 @@
+import yaml
+
+from src.variants import list_images, select_variant, variant_table, write_sample_yaml
+
+KEY = "val/metrics/mAP50-95B"
+
+
+def row(variant, accuracy_drop, latency_1, latency_8):
+    return {
+        "variant": variant,
+        "accuracy_drop": accuracy_drop,
+        "latency/batch_1_ms": latency_1,
+        "latency/batch_8_ms": latency_8,
+    }
+
+
+def test_select_variant():
+    table = [
+        row("torch", 0.0, 40.0, 200.0),
+        row("onnx", 0.0, 25.0, 150.0),
+        row("onnx-fp16", 0.001, 24.0, 160.0),
+        row("onnx-int8", 0.03, 12.0, 70.0),
+    ]
+
+    assert select_variant(table, tolerance=0.01)["variant"] == "onnx-fp16"
+    assert select_variant(table, tolerance=0.01, batch_size=8)["variant"] == "onnx"
+    assert select_variant(table, tolerance=0.05, batch_size=6)["variant"] == "onnx-int8"  # closest measured: 8
+    assert select_variant(table, tolerance=-1)["variant"] == "torch"
+
+
+def test_variant_table(tmp_path):
+    files = {"torch": tmp_path / "best.pt", "onnx-int8": tmp_path / "model.int8.onnx"}
+    files["torch"].write_bytes(b"0" * 2**20)
+    files["onnx-int8"].write_bytes(b"0" * 2**19)
+    results = {"torch": {KEY: 0.52, "latency/batch_1_ms": 30.0}, "onnx-int8": {KEY: 0.5, "latency/batch_1_ms": 10.0}}
+
+    table = variant_table(files, results, KEY)
+
+    assert [(r["variant"], r["file"], r["size_mb"]) for r in table] == [
+        ("torch", "best.pt", 1.0),
+        ("onnx-int8", "model.int8.onnx", 0.5),
+    ]
+    assert table[0]["accuracy_drop"] == 0 and abs(table[1]["accuracy_drop"] - 0.02) < 1e-9
+
+
+def test_sample_yaml_from_index(tmp_path):
+    images = tmp_path / "train" / "images"
+    images.mkdir(parents=True)
+    for name in ("a.jpg", "b.png", "c.txt"):
+        (images / name).write_bytes(b"")
+    (tmp_path / "train.txt").write_text("./train/images/a.jpg\n./train/images/b.png\n")
+    (tmp_path / "yolo.yaml").write_text(yaml.safe_dump({"train": "./train.txt", "nc": 2, "names": {0: "a", 1: "b"}}))
+
+    assert list_images(images) == [images / "a.jpg", images / "b.png"]
+    sample = list_images(tmp_path / "train.txt")
+    assert sample == [images / "a.jpg", images / "b.png"]
+
+    path = write_sample_yaml(tmp_path / "yolo.yaml", sample[:1], tmp_path / "variants" / "calibration.yaml")
+    data = yaml.safe_load(path.read_text())
+    assert data["val"] == data["train"] == str(path.with_suffix(".txt"))
+    assert data["names"] == {0: "a", 1: "b"}
+    assert path.with_suffix(".txt").read_text() == f"{images / 'a.jpg'}\n"
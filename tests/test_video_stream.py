@@ -0,0 +1,150 @@
+import json
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from src.video_stream import FrameReader, VideoPipeline, image_frames, video_frames
+
+
+def make_frames(n):
+    return (np.full((4, 4, 3), i, dtype=np.uint8) for i in range(n))
+
+
+def test_reads_all_frames_in_order():
+    reader = FrameReader(make_frames(20), buffer_size=2).start()
+
+    indices = [index for index, frame in reader]
+
+    assert indices == list(range(20))
+    assert reader.read == 20 and reader.dropped == 0
+
+
+def test_drop_frames_when_consumer_is_slow():
+    done = threading.Event()
+
+    def frames():
+        yield from make_frames(50)
+        done.set()
+
+    reader = FrameReader(frames(), buffer_size=3, drop_frames=True).start()
+    done.wait(5)  # Nothing consumed while decoding: only the first frames fit in the buffer
+
+    items = list(reader)
+
+    assert [index for index, _ in items] == [0, 1, 2]
+    assert int(items[2][1][0, 0, 0]) == 2
+    assert reader.read == 50 and reader.dropped == 47
+
+
+def test_buffer_is_bounded_when_blocking():
+    reader = FrameReader(make_frames(1000), buffer_size=4).start()
+    reader.get()
+
+    assert reader.queue.qsize() <= 4
+    reader.stop()  # Does not hang on the full buffer
+    assert reader.read < 1000
+
+
+def test_stop_releases_a_waiting_consumer():
+    def frames():
+        for frame in make_frames(1000):
+            time.sleep(0.05)
+            yield frame
+
+    reader = FrameReader(frames(), buffer_size=4).start()
+    consumer = threading.Thread(target=lambda: list(reader), daemon=True)  # Waiting in get() most of the time
+    consumer.start()
+    time.sleep(0.2)
+
+    reader.stop()  # e.g. the client of the stream disconnected
+    consumer.join(timeout=2)
+    assert not consumer.is_alive()
+
+
+def test_decoding_errors_are_raised_to_the_consumer(tmp_path):
+    reader = FrameReader(image_frames([tmp_path / "missing.jpg"])).start()
+
+    with pytest.raises(ValueError, match="Could not read frame"):
+        reader.get()
+
+
+def test_video_frames(tmp_path):
+    cv2 = pytest.importorskip("cv2")
+    path = str(tmp_path / "video.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 10, (64, 48))
+    for frame in make_frames(5):
+        writer.write(cv2.resize(frame, (64, 48)))
+    writer.release()
+
+    frames = list(video_frames(path))
+
+    assert len(frames) == 5
+    assert frames[0].shape == (48, 64, 3)
+
+
+class FakeTracker:
+    """One box per frame with track id 1, slower than the decoding"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+
+    def track(self, frame, persist=False, **kwargs):
+        import torch
+        from ultralytics.engine.results import Results
+
+        time.sleep(self.delay)
+        self.calls.append(int(frame[0, 0, 0]))
+        boxes = torch.tensor([[0.0, 0.0, 2.0, 2.0, 1.0, 0.8, 0.0]])
+        result = Results(frame, path="", names={0: "bottle"}, boxes=boxes)
+        result.speed = {"inference": 1.0}
+        return [result]
+
+
+def test_pipeline_writes_video_and_detections(tmp_path):
+    pytest.importorskip("cv2")  # Writes the video
+    frames = (np.full((48, 64, 3), i, dtype=np.uint8) for i in range(12))
+    pipeline = VideoPipeline(
+        FakeTracker(), buffer_size=2, output_video=tmp_path / "out.avi", detections_log=tmp_path / "tracks.jsonl"
+    )
+
+    report = pipeline.run(frames)
+
+    lines = [json.loads(line) for line in (tmp_path / "tracks.jsonl").read_text().splitlines()]
+    assert [line["frame"] for line in lines] == list(range(12))
+    box = {"xyxy": [0.0, 0.0, 2.0, 2.0], "confidence": pytest.approx(0.8), "class_id": 0, "class_name": "bottle"}
+    assert lines[0]["boxes"] == [{**box, "track_id": 1}]
+    assert len(list(video_frames(tmp_path / "out.avi"))) == 12
+    assert [stats["frames"] for stats in report["stages"].values()] == [12, 12, 12]  # decode, track, write
+    assert all(stats["dropped"] == 0 and stats["fps"] > 0 for stats in report["stages"].values())
+
+
+def test_pipeline_drops_frames_for_slow_tracker():
+    model = FakeTracker(delay=0.02)
+    frames = (np.full((4, 4, 3), i, dtype=np.uint8) for i in range(100))
+
+    report = VideoPipeline(model, buffer_size=2, drop_frames=True).run(frames)
+
+    stages = report["stages"]
+    assert stages["decode"]["frames"] == 100
+    assert stages["track"]["frames"] == len(model.calls) < 100
+    assert stages["track"]["dropped"] == 100 - len(model.calls)
+    assert model.calls == sorted(model.calls)
+
+
+def test_pipeline_memory_is_bounded():
+    """The decoding waits for a slow tracker: only a few frames are in flight, whatever the length of the video"""
+    model = FakeTracker(delay=0.005)
+    in_flight = []
+
+    def frames():
+        for i in range(50):
+            in_flight.append(i + 1 - len(model.calls))  # Decoded and not tracked yet
+            yield np.full((4, 4, 3), i, dtype=np.uint8)
+
+    report = VideoPipeline(model, buffer_size=2).run(frames())
+
+    assert report["stages"]["write"]["frames"] == 50
+    assert max(in_flight) <= 2 + 2  # the queue, the frame being tracked and this one
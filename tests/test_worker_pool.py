@@ -0,0 +1,80 @@
+import asyncio
+import threading
+
+import pytest
+
+from src.worker_pool import PoolSaturatedError, WorkerPool
+
+
+def test_jobs_run_on_their_worker_replica():
+    """Test that each job gets the model of the worker running it, outside of the event loop thread"""
+    pool = WorkerPool(lambda: object(), num_workers=2)
+    models = {w.index: w.model for w in pool.workers}
+
+    def job(model, x):
+        return model, threading.current_thread().name, x
+
+    async def run():
+        return await asyncio.gather(*(pool.submit(job, i) for i in range(4)))
+
+    results = asyncio.run(run())
+    pool.shutdown()
+
+    assert [x for _, _, x in results] == [0, 1, 2, 3]
+    assert {id(model) for model, _, _ in results} == {id(m) for m in models.values()}
+    assert all(name.startswith("yolo-worker-") for _, name, _ in results)
+
+
+def test_saturated_pool_refuses_jobs():
+    """Test that jobs beyond the queue capacity are refused right away"""
+    pool = WorkerPool(lambda: None, num_workers=2, max_queue_size=1)
+    release = threading.Event()
+
+    def blocking_job(model):
+        release.wait(timeout=5)
+        return "done"
+
+    async def run():
+        running = [asyncio.create_task(pool.submit(blocking_job)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        assert [w["queue_depth"] for w in pool.stats()] == [1, 1]
+        with pytest.raises(PoolSaturatedError):
+            await pool.submit(blocking_job)
+        release.set()
+        return await asyncio.gather(*running)
+
+    assert asyncio.run(run()) == ["done", "done"]
+    assert [w["queue_depth"] for w in pool.stats()] == [0, 0]
+    assert sum(w["processed"] for w in pool.stats()) == 2
+    pool.shutdown()
+
+
+def test_invalid_pool_size():
+    with pytest.raises(ValueError):
+        WorkerPool(lambda: None, num_workers=0)
+
+
+def test_on_job_start_reports_queue_wait():
+    waits = []
+    pool = WorkerPool(lambda: None, num_workers=1, on_job_start=waits.append)
+
+    async def run():
+        await asyncio.gather(*(pool.submit(lambda model: None) for _ in range(3)))
+
+    asyncio.run(run())
+    pool.shutdown()
+
+    assert len(waits) == 3 and all(wait >= 0 for wait in waits)
+
+
+def test_torch_threads_are_split_between_workers(monkeypatch):
+    """Test that the process-wide torch threads are set once, for the whole pool"""
+    calls = []
+    monkeypatch.setattr("src.worker_pool._limit_threads", calls.append)
+    monkeypatch.setattr("os.cpu_count", lambda: 8)
+
+    WorkerPool(lambda: None, num_workers=4).shutdown()
+    WorkerPool(lambda: None, num_workers=16).shutdown()
+    WorkerPool(lambda: None, num_workers=4, threads_per_worker=3).shutdown()
+
+    assert calls == [2, 1, 3]